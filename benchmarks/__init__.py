@@ -0,0 +1,7 @@
+"""
+Benchmarks on seeded synthetic match data (the real dataset can't be shipped).
+
+    generator.py  writes reproducible event files in the parser's input shape
+    suite.py      parse / cache load / search (single and batched) / features / clustering
+    __main__.py   command line: python -m benchmarks
+"""
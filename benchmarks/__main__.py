@@ -0,0 +1,72 @@
+"""
+Run the benchmark suite:
+
+    python -m benchmarks --sizes 1,10,50,150 --out results.json
+    python -m benchmarks --baseline benchmarks/baseline.json
+
+Exits with status 1 when a benchmark is slower than the baseline by more
+than the tolerance.
+"""
+import argparse
+import sys
+import tempfile
+
+from benchmarks.suite import BENCHMARKS, run_suite, save_results, load_results, compare, print_comparison
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks", description="Football Pattern Matcher benchmarks")
+    ap.add_argument("--sizes", default="1,10,50,150", help="comma separated corpus sizes, in matches")
+    ap.add_argument("--only", default=None, help=f"comma separated subset of: {', '.join(BENCHMARKS)}")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--events", type=int, default=2000, help="events per generated match")
+    ap.add_argument("--workers", type=int, default=1, help="parser processes for the parse benchmark")
+    ap.add_argument("--workdir", default=None,
+                    help="where corpora and caches live (kept, so generated matches are reused); "
+                         "a temporary directory by default")
+    ap.add_argument("--out", default="benchmark_results.json")
+    ap.add_argument("--baseline", default=None, help="results file to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    ap.add_argument("--update-baseline", action="store_true", help="write these results to --baseline")
+    args = ap.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    names = None
+    if args.only:
+        names = [n.strip() for n in args.only.split(",") if n.strip()]
+        unknown = [n for n in names if n not in BENCHMARKS]
+        if unknown:
+            ap.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    def run(workdir):
+        return run_suite(sizes, workdir, names, repeat=args.repeat, seed=args.seed,
+                         n_events=args.events, workers=args.workers)
+
+    if args.workdir:
+        results = run(args.workdir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="fpm_bench_") as workdir:
+            results = run(workdir)
+
+    save_results(results, args.out)
+    print(f"Results written to {args.out}")
+
+    if not args.baseline:
+        return 0
+    if args.update_baseline:
+        save_results(results, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    rows = compare(results, load_results(args.baseline), args.tolerance)
+    print_comparison(rows)
+    regressions = [row for row in rows if row['regression']]
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than baseline by more than {args.tolerance:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
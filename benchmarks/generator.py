@@ -0,0 +1,249 @@
+"""
+Seeded synthetic match generator.
+
+Writes event files in the shape ChainParser consumes: a JSON array of
+events, each with 'gameEvents', 'possessionEvents' and the tracked
+'homePlayers' / 'awayPlayers'. The same seed always gives the same files.
+"""
+import json
+import math
+import os
+import random
+from typing import Dict, List, Optional
+
+PITCH_HALF_LENGTH = 52.5
+PITCH_HALF_WIDTH = 34.0
+
+TEAM_NAMES = [
+    "Argentina", "Australia", "Belgium", "Brazil", "Cameroon", "Canada", "Costa Rica", "Croatia",
+    "Denmark", "Ecuador", "England", "France", "Germany", "Ghana", "Iran", "Japan",
+    "Korea Republic", "Mexico", "Morocco", "Netherlands", "Poland", "Portugal", "Qatar", "Saudi Arabia",
+    "Senegal", "Serbia", "Spain", "Switzerland", "Tunisia", "United States", "Uruguay", "Wales",
+]
+
+# 4-4-2 in a team's own frame: x = depth (towards the opponent goal), y = width
+FORMATION = [
+    ('GK', -48.0, 0.0),
+    ('D', -32.0, -24.0), ('D', -35.0, -8.0), ('D', -35.0, 8.0), ('D', -32.0, 24.0),
+    ('M', -12.0, -26.0), ('M', -15.0, -9.0), ('M', -15.0, 9.0), ('M', -12.0, 26.0),
+    ('F', 2.0, -8.0), ('F', 2.0, 8.0),
+]
+
+# Possession event mix while a team has the ball (type, weight)
+ON_BALL_EVENTS = [('PA', 70), ('BC', 10), ('CR', 4), ('SH', 3), ('CL', 3), ('CH', 10)]
+
+# Events that have no possession event attached (type, weight)
+STOPPAGES = [('OUT', 60), ('SUB', 15), ('FOUL', 25)]
+
+PASS_COMPLETION = 0.84
+STOPPAGE_RATE = 0.04
+MISSING_COORDS_RATE = 0.01
+
+
+def _clamp(v: float, lo: float, hi: float) -> float:
+    return lo if v < lo else hi if v > hi else v
+
+
+def _clock(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class _MatchSim:
+    """
+    A crude possession model: the team on the ball passes and carries it up
+    the pitch, both blocks shift with the ball and possession changes hands on
+    failed passes, challenges, shots and clearances.
+    """
+
+    def __init__(self, rng: random.Random, home: Dict, away: Dict, n_events: int):
+        self.rng = rng
+        self.teams = [home, away]
+        self.n_events = n_events
+        self.clock = 0.0
+        self.half = 1
+        self.possession = 0 # 0 = home, 1 = away
+        self.holder = 9
+        self.ball = [0.0, 0.0] # Pitch frame
+
+    def direction(self, side: int) -> int:
+        # Home attacks +x in the first half, teams swap ends at half time
+        d = 1 if side == 0 else -1
+        return d if self.half == 1 else -d
+
+    def player_positions(self, side: int) -> List[Dict]:
+        rng = self.rng
+        d = self.direction(side)
+        team = self.teams[side]
+        # The block follows the ball, more so up the pitch for the team on the ball
+        shift = self.ball[0] * d * (0.7 if side == self.possession else 0.5)
+        players = []
+        for i, (group, fx, fy) in enumerate(FORMATION):
+            depth = fx if group == 'GK' else fx + shift
+            x = _clamp(depth * d + rng.gauss(0, 3.0), -PITCH_HALF_LENGTH, PITCH_HALF_LENGTH)
+            y = _clamp(fy + 0.3 * self.ball[1] + rng.gauss(0, 3.0), -PITCH_HALF_WIDTH, PITCH_HALF_WIDTH)
+            player = {
+                'playerId': team['player_ids'][i],
+                'jerseyNum': i + 1,
+                'positionGroupType': group,
+                'x': round(x, 2),
+                'y': round(y, 2),
+                'visibility': 'VISIBLE',
+            }
+            if rng.random() < MISSING_COORDS_RATE:
+                player['x'] = None
+                player['y'] = None
+                player['visibility'] = 'ESTIMATED'
+            players.append(player)
+        return players
+
+    def pick_receiver(self, positions: List[Dict]) -> int:
+        # Prefer team mates ahead of the ball and not too far away
+        d = self.direction(self.possession)
+        weights = []
+        for i, p in enumerate(positions):
+            if i == self.holder or p['x'] is None:
+                weights.append(0.0)
+                continue
+            dx = (p['x'] - self.ball[0]) * d
+            dist = math.hypot(p['x'] - self.ball[0], p['y'] - self.ball[1])
+            weights.append(math.exp(-dist / 25.0) * (1.6 if dx > 0 else 0.8))
+        if not any(weights):
+            return self.rng.randrange(1, len(positions))
+        return self.rng.choices(range(len(positions)), weights)[0]
+
+    def turnover(self, holder: Optional[int] = None):
+        self.possession = 1 - self.possession
+        self.holder = holder if holder is not None else self.rng.randrange(1, 11)
+
+    def event(self, game_event_type: str, side: int, possession: Optional[Dict]) -> Dict:
+        home_players = self.player_positions(0)
+        away_players = self.player_positions(1)
+        team = self.teams[side]
+        return {
+            'gameEvents': {
+                'gameEventType': game_event_type,
+                'teamId': team['id'],
+                'teamName': team['name'],
+                'homeTeam': side == 0,
+                'period': self.half,
+                'startGameClock': round(self.clock, 1),
+            },
+            'possessionEvents': possession or {},
+            'homePlayers': home_players,
+            'awayPlayers': away_players,
+        }
+
+    def step(self) -> Dict:
+        rng = self.rng
+        self.clock += rng.uniform(1.5, 5.0)
+        side = self.possession
+        team = self.teams[side]
+
+        if rng.random() < STOPPAGE_RATE:
+            kind = rng.choices(*zip(*STOPPAGES))[0]
+            evt = self.event(kind, side, None)
+            if kind != 'SUB' and rng.random() < 0.5:
+                self.turnover()
+            return evt
+
+        kind = rng.choices(*zip(*ON_BALL_EVENTS))[0]
+        possession = {
+            'possessionEventType': kind,
+            'formattedGameClock': _clock(self.clock),
+        }
+        if kind in ('PA', 'CR'):
+            possession['passerPlayerId'] = team['player_ids'][self.holder]
+
+        # The event snapshot is taken before the ball moves
+        evt = self.event('OTB', side, possession)
+        positions = evt['homePlayers'] if side == 0 else evt['awayPlayers']
+        holder_pos = positions[self.holder]
+        if holder_pos['x'] is not None:
+            self.ball = [holder_pos['x'], holder_pos['y']]
+        if rng.random() < 0.02:
+            # Passer missing from the tracking data
+            possession.pop('passerPlayerId', None)
+
+        d = self.direction(side)
+        if kind in ('PA', 'CR'):
+            if rng.random() < (PASS_COMPLETION if kind == 'PA' else 0.3):
+                self.holder = self.pick_receiver(positions)
+            else:
+                self.turnover()
+        elif kind == 'BC':
+            self.ball[0] = _clamp(self.ball[0] + d * rng.uniform(2, 12), -PITCH_HALF_LENGTH, PITCH_HALF_LENGTH)
+        elif kind == 'CH':
+            if rng.random() < 0.5:
+                self.turnover()
+        else: # SH, CL
+            self.turnover(holder=0 if kind == 'SH' else None)
+        return evt
+
+    def run(self) -> List[Dict]:
+        events = []
+        per_half = self.n_events // 2
+        for self.half in (1, 2):
+            self.clock = 0.0 if self.half == 1 else 45 * 60.0
+            self.ball = [0.0, 0.0]
+            self.possession = self.half - 1
+            self.holder = 9
+            kick_off = self.event('FIRSTKICKOFF' if self.half == 1 else 'SECONDKICKOFF', self.possession, None)
+            events.append(kick_off)
+            for _ in range(per_half - 1):
+                events.append(self.step())
+        events.append(self.event('END', self.possession, None))
+        return events
+
+
+def _team(rng: random.Random, index: int) -> Dict:
+    team_id = 100 + index
+    return {
+        'id': team_id,
+        'name': TEAM_NAMES[index % len(TEAM_NAMES)],
+        'player_ids': [team_id * 100 + i for i in range(len(FORMATION))],
+    }
+
+
+def generate_match(seed: int, n_events: int = 2000) -> List[Dict]:
+    """
+    Events of one synthetic match (about n_events of them).
+    """
+    rng = random.Random(seed)
+    home_idx, away_idx = rng.sample(range(len(TEAM_NAMES)), 2)
+    sim = _MatchSim(rng, _team(rng, home_idx), _team(rng, away_idx), n_events)
+    return sim.run()
+
+
+def write_match(path: str, seed: int, n_events: int = 2000):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(generate_match(seed, n_events), f)
+
+
+def generate_corpus(out_dir: str, n_matches: int, seed: int = 0, n_events: int = 2000) -> List[str]:
+    """
+    Writes n_matches match files into out_dir and returns their paths.
+    Match i only depends on (seed, i), so a larger corpus extends a smaller one.
+    Files that already exist are kept as they are.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(n_matches):
+        path = os.path.join(out_dir, f"match_{i:05d}.json")
+        if not os.path.exists(path):
+            write_match(path, seed * 1_000_003 + i, n_events)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Write synthetic match event files.")
+    ap.add_argument("out_dir")
+    ap.add_argument("-n", "--matches", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--events", type=int, default=2000, help="events per match")
+    args = ap.parse_args()
+    paths = generate_corpus(args.out_dir, args.matches, args.seed, args.events)
+    print(f"Wrote {len(paths)} matches to {args.out_dir}")
@@ -0,0 +1,368 @@
+"""
+The benchmarks themselves, plus result files and baseline comparison.
+
+Every benchmark takes a prepared Corpus and returns a dict with 'median_s',
+'min_s' (the number compared against a baseline: the best run is the least
+disturbed by whatever else the machine is doing), the raw 'runs' and
+whatever throughput figures make sense for it.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import ChainParser
+from matcher import PatternMatcher
+from clustering import PatternClusterer
+from benchmarks.generator import generate_corpus
+
+RESULTS_VERSION = 1
+
+
+class Corpus:
+    """
+    A generated data directory of n_matches files and its cache location.
+    Generated files are reused across runs when workdir is kept.
+    """
+
+    def __init__(self, workdir: str, n_matches: int, seed: int = 0, n_events: int = 2000):
+        self.n_matches = n_matches
+        self.seed = seed
+        # Match i only depends on (seed, i, n_events), so all sizes share one pool
+        self.pool_dir = os.path.join(workdir, f"matches_seed{seed}_ev{n_events}")
+        self.data_dir = os.path.join(workdir, f"corpus_{n_matches}")
+        self.cache_dir = os.path.join(workdir, f"cache_{n_matches}")
+        self.cache_file = os.path.join(self.cache_dir, "chains_cache.bin")
+        self.n_events = n_events
+        self.store = None
+
+    def prepare(self):
+        paths = generate_corpus(self.pool_dir, self.n_matches, self.seed, self.n_events)
+        os.makedirs(self.data_dir, exist_ok=True)
+        wanted = {os.path.basename(p) for p in paths}
+        for name in os.listdir(self.data_dir):
+            if name not in wanted:
+                os.remove(os.path.join(self.data_dir, name))
+        for path in paths:
+            link = os.path.join(self.data_dir, os.path.basename(path))
+            if not os.path.exists(link):
+                try:
+                    os.link(path, link)
+                except OSError:
+                    shutil.copyfile(path, link)
+
+    def parser(self, workers: int = 1) -> ChainParser:
+        return ChainParser(self.data_dir, cache_file=self.cache_file, workers=workers)
+
+    def clear_cache(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def load(self):
+        if self.store is None:
+            if not os.path.exists(self.cache_file):
+                self.clear_cache()
+            with quiet():
+                self.store = self.parser().process_all()
+        return self.store
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Swallows the progress prints of the code under test.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(fn: Callable, repeat: int, setup: Optional[Callable] = None) -> List[float]:
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def summarize(runs: List[float], **extra) -> Dict:
+    result = {
+        'median_s': statistics.median(runs),
+        'min_s': min(runs),
+        'runs': runs,
+    }
+    result.update(extra)
+    return result
+
+
+def make_queries(store, n_queries: int, seed: int) -> List[List]:
+    """
+    Queries are jittered copies of random corpus chains, so every search has
+    genuinely close matches (like a user tracing a real move).
+    """
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(len(store), size=min(n_queries, len(store)), replace=False)
+    queries = []
+    for i in ids:
+        coords = np.asarray(store.coords_of(int(i)), dtype=np.float64)
+        coords = coords + rng.normal(0, 2.0, coords.shape)
+        queries.append([tuple(p) for p in coords])
+    return queries
+
+
+# --- Benchmarks ------------------------------------------------------------
+
+def bench_parse(corpus: Corpus, repeat: int, workers: int = 1) -> Dict:
+    """
+    Cold build: parse every file and write segments, combined cache and manifest.
+    """
+    store = {}
+
+    def run():
+        with quiet():
+            store['chains'] = corpus.parser(workers).process_all()
+
+    runs = timed(run, repeat, setup=corpus.clear_cache)
+    corpus.store = store['chains']
+    n = len(store['chains'])
+    return summarize(runs, chains=n, matches=corpus.n_matches,
+                     chains_per_s=n / statistics.median(runs))
+
+
+def bench_cache_load(corpus: Corpus, repeat: int) -> Dict:
+    """
+    Warm start: manifest check of every file plus memory-mapping the cache.
+    """
+    corpus.load()
+
+    def run():
+        with quiet():
+            corpus.parser().process_all()
+
+    return summarize(timed(run, repeat), chains=len(corpus.load()))
+
+
+def bench_search(corpus: Corpus, repeat: int, n_queries: int = 20, top_k: int = 15,
+                 pool_size: Optional[int] = None) -> Dict:
+    """
+    Per-query latency of exact search (or ANN + re-rank with pool_size).
+    The result cache is off so every query is really searched.
+    """
+    store = corpus.load()
+    matcher = PatternMatcher(store, cache_size=0)
+    if pool_size:
+        matcher.build_ann_index()
+    queries = make_queries(store, n_queries, corpus.seed)
+
+    latencies = []
+
+    def run():
+        for q in queries:
+            start = time.perf_counter()
+            matcher.search(q, top_k=top_k, pool_size=pool_size)
+            latencies.append(time.perf_counter() - start)
+
+    runs = timed(run, repeat)
+    return summarize(runs, queries=len(queries),
+                     p50_ms=float(np.percentile(latencies, 50) * 1000),
+                     p95_ms=float(np.percentile(latencies, 95) * 1000),
+                     queries_per_s=len(queries) / statistics.median(runs))
+
+
+def bench_search_many(corpus: Corpus, repeat: int, n_queries: int = 100, top_k: int = 15) -> Dict:
+    """
+    Throughput of search_many() on a batch of queries, next to the same
+    queries run one search() at a time. Result cache off, as in bench_search.
+    """
+    store = corpus.load()
+    matcher = PatternMatcher(store, cache_size=0)
+    queries = make_queries(store, n_queries, corpus.seed)
+
+    loop_runs = timed(lambda: [matcher.search(q, top_k=top_k) for q in queries], 1)
+    runs = timed(lambda: matcher.search_many(queries, top_k=top_k), repeat)
+    return summarize(runs, queries=len(queries),
+                     queries_per_s=len(queries) / statistics.median(runs),
+                     loop_queries_per_s=len(queries) / loop_runs[0],
+                     speedup=loop_runs[0] / statistics.median(runs))
+
+
+def bench_parallel_search(corpus: Corpus, repeat: int, n_queries: int = 20, top_k: int = 15) -> Dict:
+    """
+    Exact search throughput of ParallelMatcher at 1, 2, 4, ... workers (up to
+    the number of cores), as speedups over the in-process PatternMatcher.
+    The timed runs are those at the most workers.
+    """
+    from parallel import ParallelMatcher
+    store = corpus.load()
+    queries = make_queries(store, n_queries, corpus.seed)
+    matcher = PatternMatcher(store, cache_size=0)
+    base = statistics.median(timed(lambda: [matcher.search(q, top_k=top_k) for q in queries], repeat))
+
+    cpus = os.cpu_count() or 1
+    counts = sorted({n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cpus} | {cpus})
+    expected = [[r['chain_idx'] for r in matcher.search(q, top_k=top_k)] for q in queries]
+    scaling = {}
+    identical = True
+    for n in counts:
+        with ParallelMatcher(store, n_workers=n) as pm:
+            runs = timed(lambda: [pm.search(q, top_k=top_k) for q in queries], repeat)
+            identical &= [[r['chain_idx'] for r in pm.search(q, top_k=top_k)] for q in queries] == expected
+        scaling[str(n)] = {'queries_per_s': len(queries) / statistics.median(runs),
+                           'speedup': base / statistics.median(runs)}
+    return summarize(runs, queries=len(queries), workers=counts[-1], identical=identical,
+                     single_queries_per_s=len(queries) / base, scaling=scaling)
+
+
+def bench_features(corpus: Corpus, repeat: int, n_points: int = 10) -> Dict:
+    store = corpus.load()
+    clusterers = []
+
+    def run():
+        clusterers[-1].extract_features(n_points=n_points)
+
+    runs = timed(run, repeat, setup=lambda: clusterers.append(PatternClusterer(store)))
+    return summarize(runs, chains=len(store))
+
+
+def bench_cluster(corpus: Corpus, repeat: int, threshold: float = 40.0) -> Dict:
+    """
+    Leader clustering on precomputed features (tree and neighbour lists included).
+    """
+    store = corpus.load()
+    clusterers = []
+
+    def setup():
+        clusterer = PatternClusterer(store)
+        clusterer.extract_features()
+        clusterers.append(clusterer)
+
+    def run():
+        with quiet():
+            clusterers[-1].cluster(threshold=threshold)
+
+    runs = timed(run, repeat, setup=setup)
+    return summarize(runs, chains=len(store), clusters=len(clusterers[-1].cluster_data))
+
+
+def bench_cluster_sweep(corpus: Corpus, repeat: int, thresholds=tuple(range(5, 201, 5))) -> Dict:
+    """
+    Group counts over the Discovery tab's threshold range. The timed runs are
+    first sweeps on a fresh clusterer (features precomputed); warm_s is a
+    second sweep on the same clusterer, which reuses its neighbour lists.
+    """
+    store = corpus.load()
+    clusterers = []
+
+    def setup():
+        clusterer = PatternClusterer(store)
+        clusterer.extract_features()
+        clusterers.append(clusterer)
+
+    runs = timed(lambda: clusterers[-1].cluster_counts(thresholds), repeat, setup=setup)
+    warm = timed(lambda: clusterers[-1].cluster_counts(thresholds), repeat)
+    return summarize(runs, chains=len(store), thresholds=list(thresholds), warm_s=statistics.median(warm))
+
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'cache_load': bench_cache_load,
+    'search': bench_search,
+    'search_ann': lambda corpus, repeat: bench_search(corpus, repeat, pool_size=200),
+    'search_many': bench_search_many,
+    'search_parallel': bench_parallel_search,
+    'features': bench_features,
+    'cluster': bench_cluster,
+    'cluster_sweep': bench_cluster_sweep,
+}
+
+
+def run_suite(sizes: List[int], workdir: str, names: Optional[List[str]] = None, repeat: int = 3,
+              seed: int = 0, n_events: int = 2000, workers: int = 1) -> Dict:
+    """
+    Runs the selected benchmarks at every corpus size (in matches).
+    Results are keyed "<benchmark>/<matches>".
+    """
+    names = names or list(BENCHMARKS)
+    results = {}
+    for size in sizes:
+        corpus = Corpus(workdir, size, seed, n_events)
+        print(f"Preparing corpus of {size} matches...")
+        corpus.prepare()
+        for name in names:
+            if name == 'parse':
+                result = bench_parse(corpus, repeat, workers=workers)
+            else:
+                result = BENCHMARKS[name](corpus, repeat)
+            key = f"{name}/{size}"
+            results[key] = result
+            print(f"  {key:<22} {result['median_s'] * 1000:10.1f} ms")
+    return {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed,
+            'events_per_match': n_events,
+            'repeat': repeat,
+            'workers': workers,
+        },
+        'results': results,
+    }
+
+
+def save_results(results: Dict, path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+
+
+def load_results(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {results.get('version')}")
+    return results
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = 0.25, noise_floor: float = 0.002) -> List[Dict]:
+    """
+    Best-run time ratio current/baseline for every benchmark in both files.
+    A ratio above 1 + tolerance is a regression, unless the slowdown is under
+    noise_floor seconds (sub-millisecond timings jitter by more than 25%).
+    """
+    rows = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None or not base.get('min_s'):
+            continue
+        ratio = result['min_s'] / base['min_s']
+        rows.append({
+            'benchmark': key,
+            'baseline_s': base['min_s'],
+            'current_s': result['min_s'],
+            'ratio': ratio,
+            'regression': ratio > 1 + tolerance and result['min_s'] - base['min_s'] > noise_floor,
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict]):
+    print(f"{'benchmark':<22} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for row in rows:
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['benchmark']:<22} {row['baseline_s'] * 1000:12.1f} "
+              f"{row['current_s'] * 1000:12.1f} {row['ratio']:7.2f}{flag}")
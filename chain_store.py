@@ -0,0 +1,568 @@
+import itertools
+import json
+import os
+import struct
+import zlib
+import numpy as np
+from collections.abc import Mapping
+from typing import List, Dict, Iterable, Iterator, Sequence, Optional
+
+# On-disk corpus format:
+#   magic (8 bytes) | version (u32) | header length (u32) | header JSON | header crc32 (u32)
+#   | data sections, each aligned to SECTION_ALIGN bytes
+# The header lists every section's offset/dtype/shape, the metadata tables and
+# a crc32 over the data sections.
+CORPUS_MAGIC = b'FPMCHAIN'
+CORPUS_VERSION = 2
+SECTION_ALIGN = 64
+
+# name -> (attribute, dtype); every array the store needs, in file order
+CORPUS_SECTIONS = (
+    ('coords', '<f4'),
+    ('normalized', '<f4'),
+    ('offsets', '<i8'),
+    ('team_idx', '<i4'),
+    ('match_idx', '<i4'),
+    ('timestamp_idx', '<i4'),
+    ('seconds', '<f4'),
+)
+
+
+# Every store instance gets a new id, so caches can tell corpora apart
+_store_ids = itertools.count(1)
+
+
+class CorpusFormatError(ValueError):
+    """
+    Raised when a corpus file is missing, truncated, corrupt or from another version.
+    """
+
+def game_clock_seconds(clock) -> float:
+    """
+    Game time in seconds from a formattedGameClock string: 'MM:SS' (minutes
+    go past 90), 'H:MM:SS', or with added time, '45:00+2:13'. Numbers are
+    taken as seconds already. NaN for anything else (e.g. 'End of Match').
+    """
+    if isinstance(clock, (int, float)) and not isinstance(clock, bool):
+        return float(clock)
+    if not isinstance(clock, str):
+        return float('nan')
+    total = 0.0
+    try:
+        for part in clock.strip().split('+'):
+            seconds = 0.0
+            for field in part.strip().split(':'):
+                seconds = seconds * 60 + float(field)
+            total += seconds
+    except ValueError:
+        return float('nan')
+    return total
+
+
+class CodeIndex:
+    """
+    Inverted index over an integer column: chain ids sorted by value
+    (stable, so ids stay ascending within a value), plus the [start, stop)
+    range of every value in that order.
+    """
+
+    def __init__(self, codes: np.ndarray):
+        codes = np.asarray(codes)
+        self.order = np.argsort(codes, kind='stable')
+        values, starts, counts = np.unique(codes[self.order], return_index=True, return_counts=True)
+        self.ranges = {int(v): (int(s), int(s + c)) for v, s, c in zip(values, starts, counts)}
+
+    def values(self) -> List[int]:
+        return sorted(self.ranges)
+
+    def count(self, value: int) -> int:
+        start, stop = self.ranges.get(value, (0, 0))
+        return stop - start
+
+    def ids(self, value: int) -> np.ndarray:
+        """
+        Ids of the chains with exactly this value, ascending (a view).
+        """
+        start, stop = self.ranges.get(value, (0, 0))
+        return self.order[start:stop]
+
+
+class LengthIndex(CodeIndex):
+    """
+    CodeIndex over the chain lengths.
+    """
+
+    def lengths(self) -> List[int]:
+        return self.values()
+
+
+class MetadataIndex:
+    """
+    Inverted indexes for filtered search, built once per store: chain ids
+    per team, per match and per length, and all ids sorted by game time.
+    select() turns filters into the ascending ids of the matching chains,
+    in time proportional to the result rather than the corpus.
+    """
+
+    FILTERS = ('team_id', 'match_name', 'time_range', 'length')
+
+    def __init__(self, store: 'ChainStore'):
+        self.n_chains = len(store)
+        self.teams = CodeIndex(store.team_idx)
+        self.team_codes = {value: code for code, value in enumerate(store.teams)}
+        self.matches = CodeIndex(store.match_idx)
+        self.match_codes = {value: code for code, value in enumerate(store.matches)}
+        self.lengths = store.length_index
+        # Chains without a known game time can't match a time range
+        seconds = np.asarray(store.seconds, dtype=np.float64)
+        known = np.flatnonzero(~np.isnan(seconds))
+        self.time_order = known[np.argsort(seconds[known], kind='stable')]
+        self.time_sorted = seconds[self.time_order]
+
+    @staticmethod
+    def _values(value) -> List:
+        return list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+
+    @staticmethod
+    def _union(parts: List[np.ndarray]) -> np.ndarray:
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        if len(parts) == 1:
+            return parts[0]
+        return np.unique(np.concatenate(parts))
+
+    def _lookup(self, index: CodeIndex, codes: Dict, value) -> np.ndarray:
+        return self._union([index.ids(codes[v]) for v in self._values(value) if v in codes])
+
+    def time_ids(self, start=None, end=None) -> np.ndarray:
+        """
+        Ids of the chains with start <= game time <= end, ascending. The
+        bounds are seconds or clock strings; None leaves that side open.
+        """
+        lo = -np.inf if start is None else game_clock_seconds(start)
+        hi = np.inf if end is None else game_clock_seconds(end)
+        if np.isnan(lo) or np.isnan(hi):
+            raise ValueError(f"Bad time range ({start!r}, {end!r})")
+        first = np.searchsorted(self.time_sorted, lo, side='left')
+        last = np.searchsorted(self.time_sorted, hi, side='right')
+        return np.sort(self.time_order[first:last])
+
+    def length_ids(self, length) -> np.ndarray:
+        """
+        length: one length, a list of lengths, or a (min, max) range as a
+        dict {'min': ..., 'max': ...} (either may be left out).
+        """
+        if isinstance(length, dict):
+            lo, hi = length.get('min'), length.get('max')
+            lengths = [L for L in self.lengths.lengths()
+                       if (lo is None or L >= lo) and (hi is None or L <= hi)]
+        else:
+            lengths = [int(L) for L in self._values(length)]
+        return self._union([self.lengths.ids(L) for L in lengths])
+
+    def select(self, team_id=None, match_name=None, time_range=None, length=None) -> Optional[np.ndarray]:
+        """
+        Ascending ids of the chains passing every given filter, or None if no
+        filter is given. team_id and match_name take one value or a list of
+        them; time_range is (start, end) as for time_ids().
+        """
+        parts = []
+        if team_id is not None:
+            parts.append(self._lookup(self.teams, self.team_codes, team_id))
+        if match_name is not None:
+            parts.append(self._lookup(self.matches, self.match_codes, match_name))
+        if time_range is not None:
+            start, end = time_range
+            parts.append(self.time_ids(start, end))
+        if length is not None:
+            parts.append(self.length_ids(length))
+        if not parts:
+            return None
+
+        # Smallest first, so every intersection is as cheap as it can be
+        parts.sort(key=len)
+        ids = parts[0]
+        for part in parts[1:]:
+            if len(ids) == 0:
+                break
+            ids = np.intersect1d(ids, part, assume_unique=True)
+        return ids.astype(np.int64, copy=False)
+
+
+class ChainView(Mapping):
+    """
+    Read-only dict view of one chain in a ChainStore.
+    Behaves like the old {'team_id', 'coords', 'match_name', 'timestamp'} dict
+    (plus 'seconds', the game time as a number, None if unknown), but the
+    coordinate list is only built when somebody asks for it.
+    """
+    __slots__ = ('store', 'index')
+
+    KEYS = ('team_id', 'coords', 'match_name', 'timestamp', 'seconds')
+
+    def __init__(self, store: 'ChainStore', index: int):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        store, i = self.store, self.index
+        if key == 'coords':
+            return [(float(x), float(y)) for x, y in store.coords_of(i)]
+        if key == 'team_id':
+            return store.teams[store.team_idx[i]]
+        if key == 'match_name':
+            return store.matches[store.match_idx[i]]
+        if key == 'timestamp':
+            return store.timestamps[store.timestamp_idx[i]]
+        if key == 'seconds':
+            seconds = float(store.seconds[i])
+            return None if np.isnan(seconds) else seconds
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return f"ChainView({self.index}, {dict(self)!r})"
+
+
+class ChainStore:
+    """
+    Columnar storage for the whole chain corpus.
+    - coords: one contiguous float32 (P, 2) buffer for every pass in every chain
+    - offsets: int64 (N + 1,), chain i is coords[offsets[i]:offsets[i + 1]]
+    - normalized: the same buffer with every chain translated to start at (0, 0)
+    - team/match/timestamp values are interned into small tables and each chain
+      only stores an index into them
+    - seconds: float32 game time of every chain (NaN if unknown), for time filters
+    Indexing the store gives a ChainView, so code written against the old
+    list-of-dicts keeps working.
+    """
+
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray,
+                 team_idx: np.ndarray, teams: List,
+                 match_idx: np.ndarray, matches: List[str],
+                 timestamp_idx: np.ndarray, timestamps: List[str],
+                 normalized: Optional[np.ndarray] = None, seconds: Optional[np.ndarray] = None):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float32).reshape(-1, 2)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        self.team_idx = np.asarray(team_idx, dtype=np.int32)
+        self.teams = list(teams)
+        self.match_idx = np.asarray(match_idx, dtype=np.int32)
+        self.matches = list(matches)
+        self.timestamp_idx = np.asarray(timestamp_idx, dtype=np.int32)
+        self.timestamps = list(timestamps)
+        if seconds is None:
+            # Same game time for every chain sharing a timestamp string
+            table = np.array([game_clock_seconds(t) for t in self.timestamps] or [np.nan], dtype=np.float32)
+            seconds = table[self.timestamp_idx]
+        self.seconds = np.asarray(seconds, dtype=np.float32)
+        if normalized is None:
+            normalized = self._normalize()
+        self.normalized = normalized
+        self.uid = next(_store_ids)
+        self._length_index = None
+        self._metadata_index = None
+
+    def _normalize(self) -> np.ndarray:
+        """
+        Translate every chain so its first point is (0, 0).
+        """
+        lengths = self.lengths
+        if len(self.coords) == 0:
+            return self.coords.copy()
+        starts = self.coords[self.offsets[:-1][lengths > 0]]
+        return self.coords - np.repeat(starts, lengths[lengths > 0], axis=0)
+
+    @classmethod
+    def from_chains(cls, chains: Iterable[Dict]) -> 'ChainStore':
+        """
+        Build a store from the parser's list of chain dicts.
+        """
+        tables = {'team_id': {}, 'match_name': {}, 'timestamp': {}}
+        columns = {key: [] for key in tables}
+        points = []
+        offsets = [0]
+        seconds = []
+
+        for chain in chains:
+            coords = chain.get('coords') or []
+            points.extend(coords)
+            offsets.append(offsets[-1] + len(coords))
+            for key, table in tables.items():
+                value = chain.get(key)
+                columns[key].append(table.setdefault(value, len(table)))
+            # Older chain dicts have no 'seconds', their timestamp still tells
+            value = chain.get('seconds')
+            seconds.append(game_clock_seconds(chain.get('timestamp') if value is None else value))
+
+        coords = np.array(points, dtype=np.float32).reshape(-1, 2)
+        return cls(coords, np.array(offsets),
+                   columns['team_id'], list(tables['team_id']),
+                   columns['match_name'], list(tables['match_name']),
+                   columns['timestamp'], list(tables['timestamp']),
+                   seconds=np.array(seconds, dtype=np.float32))
+
+    @classmethod
+    def concat(cls, stores: Sequence['ChainStore']) -> 'ChainStore':
+        """
+        One store holding the chains of every given store, in order.
+        The metadata tables are merged and the per-chain indices remapped.
+        """
+        stores = list(stores)
+        if not stores:
+            return cls.from_chains([])
+
+        tables = {'teams': {}, 'matches': {}, 'timestamps': {}}
+        columns = {'teams': [], 'matches': [], 'timestamps': []}
+        index_attr = {'teams': 'team_idx', 'matches': 'match_idx', 'timestamps': 'timestamp_idx'}
+        offsets = [np.zeros(1, dtype=np.int64)]
+        shift = 0
+
+        for store in stores:
+            offsets.append(store.offsets[1:] + shift)
+            shift += int(store.offsets[-1])
+            for name, table in tables.items():
+                remap = np.array([table.setdefault(value, len(table)) for value in getattr(store, name)],
+                                 dtype=np.int32)
+                idx = getattr(store, index_attr[name])
+                columns[name].append(remap[idx] if len(remap) else idx)
+
+        return cls(np.concatenate([store.coords for store in stores]), np.concatenate(offsets),
+                   np.concatenate(columns['teams']), list(tables['teams']),
+                   np.concatenate(columns['matches']), list(tables['matches']),
+                   np.concatenate(columns['timestamps']), list(tables['timestamps']),
+                   seconds=np.concatenate([store.seconds for store in stores]))
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def length_index(self) -> LengthIndex:
+        """
+        Length -> chain ids index, built on first use.
+        """
+        if self._length_index is None:
+            self._length_index = LengthIndex(self.lengths)
+        return self._length_index
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """
+        Team / match / time / length indexes for select(), built on first use.
+        """
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex(self)
+        return self._metadata_index
+
+    def select(self, **filters) -> Optional[np.ndarray]:
+        """
+        Ascending ids of the chains passing the filters (team_id, match_name,
+        time_range, length; see MetadataIndex.select), or None without filters.
+        """
+        unknown = set(filters) - set(MetadataIndex.FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+        return self.metadata_index.select(**filters)
+
+    def coords_of(self, i: int) -> np.ndarray:
+        """
+        (length, 2) view of the raw coordinates of chain i (no copy).
+        """
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def normalized_of(self, i: int) -> np.ndarray:
+        """
+        (length, 2) view of chain i translated to start at (0, 0) (no copy).
+        """
+        return self.normalized[self.offsets[i]:self.offsets[i + 1]]
+
+    def gather(self, ids: Sequence[int], length: int, normalized: bool = True) -> np.ndarray:
+        """
+        Stack chains that all have the given length into a (B, length, 2) array.
+        """
+        source = self.normalized if normalized else self.coords
+        rows = self.offsets[np.asarray(ids, dtype=np.int64)][:, None] + np.arange(length)
+        return source[rows]
+
+    def take(self, ids: Sequence[int]) -> 'ChainStore':
+        """
+        New store holding only the given chains, in the given order.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        lengths = self.lengths[ids]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        rows = np.repeat(self.offsets[ids] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return ChainStore(self.coords[rows], offsets,
+                          self.team_idx[ids], self.teams,
+                          self.match_idx[ids], self.matches,
+                          self.timestamp_idx[ids], self.timestamps,
+                          seconds=self.seconds[ids])
+
+    def starts_with(self, other: 'ChainStore') -> bool:
+        """
+        True if the first len(other) chains of this store have other's
+        coordinates, i.e. this store is other with chains appended.
+        """
+        n, points = len(other), len(other.coords)
+        return (len(self) >= n
+                and np.array_equal(self.offsets[:n + 1], other.offsets)
+                and np.array_equal(self.coords[:points], other.coords))
+
+    def to_dicts(self) -> List[Dict]:
+        """
+        Plain list-of-dicts copy, e.g. for the readable JSON export.
+        """
+        return [dict(view) for view in self]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> ChainView:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return ChainView(self, int(i))
+
+    def __iter__(self) -> Iterator[ChainView]:
+        for i in range(len(self)):
+            yield ChainView(self, i)
+
+    def save(self, path: str):
+        """
+        Write the store in the binary corpus format (atomically).
+        """
+        arrays = [(name, np.ascontiguousarray(getattr(self, name), dtype=dtype))
+                  for name, dtype in CORPUS_SECTIONS]
+
+        # Lay the sections out first so the header can describe them
+        sections = {}
+        crc = 0
+        position = 0
+        for name, arr in arrays:
+            sections[name] = {'offset': position, 'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+            position += -(-arr.nbytes // SECTION_ALIGN) * SECTION_ALIGN
+            crc = zlib.crc32(arr.tobytes(), crc)
+
+        header = {
+            'n_chains': len(self),
+            'n_points': int(len(self.coords)),
+            'sections': sections,
+            'teams': self.teams,
+            'matches': self.matches,
+            'timestamps': self.timestamps,
+            'data_crc32': crc,
+        }
+        header_bytes = json.dumps(header).encode('utf-8')
+        prefix = CORPUS_MAGIC + struct.pack('<II', CORPUS_VERSION, len(header_bytes))
+        head = prefix + header_bytes + struct.pack('<I', zlib.crc32(header_bytes))
+        data_start = -(-len(head) // SECTION_ALIGN) * SECTION_ALIGN
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(head)
+            for name, arr in arrays:
+                f.seek(data_start + sections[name]['offset'])
+                f.write(arr.tobytes())
+            f.truncate(data_start + position)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path: str, mmap: bool = True, verify: bool = False) -> 'ChainStore':
+        """
+        Open a corpus file written by save().
+        mmap: map the arrays with numpy.memmap (pages load on first touch)
+              instead of reading them into memory.
+        verify: also check the data checksum, which reads the whole file.
+        The chain offsets and the metadata indices are always checked, so a
+        damaged file can't hand out out-of-range chains.
+        Raises CorpusFormatError if the file is not a valid corpus of this version.
+        """
+        try:
+            with open(path, 'rb') as f:
+                prefix = f.read(len(CORPUS_MAGIC) + 8)
+                if len(prefix) < len(CORPUS_MAGIC) + 8 or not prefix.startswith(CORPUS_MAGIC):
+                    raise CorpusFormatError(f"{path} is not a chain corpus file")
+                version, header_len = struct.unpack('<II', prefix[len(CORPUS_MAGIC):])
+                if version != CORPUS_VERSION:
+                    raise CorpusFormatError(f"{path} has format version {version}, expected {CORPUS_VERSION}")
+                header_bytes = f.read(header_len)
+                (header_crc,) = struct.unpack('<I', f.read(4))
+                file_size = os.fstat(f.fileno()).st_size
+        except (OSError, struct.error) as e:
+            raise CorpusFormatError(f"Cannot read {path}: {e}")
+
+        if zlib.crc32(header_bytes) != header_crc:
+            raise CorpusFormatError(f"{path} has a corrupt header")
+        header = json.loads(header_bytes.decode('utf-8'))
+        data_start = -(-(len(prefix) + header_len + 4) // SECTION_ALIGN) * SECTION_ALIGN
+
+        arrays = {}
+        crc = 0
+        for name, _ in CORPUS_SECTIONS:
+            spec = header['sections'][name]
+            dtype = np.dtype(spec['dtype'])
+            shape = tuple(spec['shape'])
+            offset = data_start + spec['offset']
+            if offset + dtype.itemsize * int(np.prod(shape)) > file_size:
+                raise CorpusFormatError(f"{path} is truncated")
+            if int(np.prod(shape)) == 0:
+                arr = np.zeros(shape, dtype=dtype)
+            elif mmap:
+                arr = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+            else:
+                arr = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+            if verify:
+                crc = zlib.crc32(np.ascontiguousarray(arr).tobytes(), crc)
+            arrays[name] = arr
+
+        if verify and crc != header['data_crc32']:
+            raise CorpusFormatError(f"{path} failed its data checksum")
+        cls._check_structure(path, header, arrays)
+
+        return cls(arrays['coords'], arrays['offsets'],
+                   arrays['team_idx'], header['teams'],
+                   arrays['match_idx'], header['matches'],
+                   arrays['timestamp_idx'], header['timestamps'],
+                   normalized=arrays['normalized'], seconds=arrays['seconds'])
+
+    @staticmethod
+    def _check_structure(path: str, header: Dict, arrays: Dict[str, np.ndarray]):
+        """
+        Cheap consistency checks of an opened corpus (reads the offsets and
+        the per-chain index columns only).
+        """
+        n_chains, n_points = header['n_chains'], header['n_points']
+        offsets = arrays['offsets']
+        if arrays['coords'].shape != (n_points, 2) or arrays['normalized'].shape != (n_points, 2):
+            raise CorpusFormatError(f"{path} has coordinate sections of the wrong shape")
+        if offsets.shape != (n_chains + 1,):
+            raise CorpusFormatError(f"{path} has {len(offsets)} chain offsets for {n_chains} chains")
+        if offsets[0] != 0 or offsets[-1] != n_points or np.any(np.diff(offsets) < 0):
+            raise CorpusFormatError(f"{path} has corrupt chain offsets")
+        for name, table in (('team_idx', 'teams'), ('match_idx', 'matches'), ('timestamp_idx', 'timestamps')):
+            arr = arrays[name]
+            if arr.shape != (n_chains,):
+                raise CorpusFormatError(f"{path} has a {name} section of the wrong shape")
+            if n_chains and (arr.min() < 0 or arr.max() >= len(header[table])):
+                raise CorpusFormatError(f"{path} has {name} values outside its {table} table")
+        if arrays['seconds'].shape != (n_chains,):
+            raise CorpusFormatError(f"{path} has a seconds section of the wrong shape")
+
+    def __getstate__(self):
+        # The normalized buffer is cheap to rebuild, don't pickle it
+        state = self.__dict__.copy()
+        del state['normalized']
+        state['_length_index'] = None
+        state['_metadata_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.normalized = self._normalize()
+        self.uid = next(_store_ids)
@@ -0,0 +1,309 @@
+"""
+Headless command line for cache builds, batch search and pattern discovery.
+
+    python cli.py build    DATA_DIR [--workers N] [--verify]
+    python cli.py search   DATA_DIR --queries queries.json [--top-k 15] [--out results.csv]
+                           [--team ID] [--match NAME] [--time 0:00-15:00] [--length 3-5]
+                           [--search-workers N]
+    python cli.py discover DATA_DIR --thresholds 20,40,60 [--out groups.json]
+
+Results go to --out (format from the extension, or --format) or to stdout.
+Progress messages go to stderr, so stdout can be piped.
+Imports no Qt and no matplotlib.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from parser import ChainParser
+from matcher import PatternMatcher
+from clustering import PatternClusterer
+from instrumentation import metrics
+
+
+def log(msg: str):
+    print(msg, file=sys.stderr)
+
+
+def load_store(args):
+    """
+    Builds/refreshes the cache and returns the ChainStore.
+    """
+    cache_file = args.cache or os.path.join(args.data_dir, "chains_cache.bin")
+    parser = ChainParser(args.data_dir, cache_file=cache_file, workers=args.workers,
+                         verify=getattr(args, 'verify', False))
+    # The parser reports progress with print(); keep stdout for results
+    with contextlib.redirect_stdout(sys.stderr):
+        store = parser.process_all(export_json=getattr(args, 'export_json', False))
+    for path, msg in parser.errors:
+        log(f"Failed: {path}: {msg}")
+    return store, parser
+
+
+def load_queries(path: str) -> List[Dict]:
+    """
+    Reads a queries file: a JSON array, or JSON lines. Each query is either a
+    list of [x, y] points or {"id": ..., "coords": [[x, y], ...]}.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        items = json.loads(text)
+        if not isinstance(items, list):
+            items = [items]
+    except ValueError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    queries = []
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            coords = item.get('coords')
+            query_id = item.get('id', i)
+        else:
+            coords = item
+            query_id = i
+        if not coords or any(len(p) != 2 for p in coords):
+            raise ValueError(f"Query {query_id}: expected a list of [x, y] points")
+        queries.append({'id': query_id, 'coords': [(float(x), float(y)) for x, y in coords]})
+    return queries
+
+
+def make_matcher(store, args):
+    """
+    PatternMatcher, or a ParallelMatcher over --search-workers processes.
+    """
+    if args.search_workers > 1:
+        from parallel import ParallelMatcher
+        log(f"Starting {args.search_workers} search workers...")
+        return ParallelMatcher(store, n_workers=args.search_workers, window=args.window)
+    return PatternMatcher(store, window=args.window)
+
+
+def parse_range(text: str):
+    """
+    "A-B" -> (A, B), "A" -> (A, A); either side of the dash may be empty.
+    """
+    lo, sep, hi = text.partition('-')
+    if not sep:
+        hi = lo
+    return lo.strip() or None, hi.strip() or None
+
+
+def search_filters(args) -> Optional[Dict]:
+    """
+    Metadata filters from the search options, as PatternMatcher.search takes them.
+    """
+    filters = {}
+    if args.team:
+        filters['team_id'] = [int(t) if t.lstrip('-').isdigit() else t for t in args.team]
+    if args.match:
+        filters['match_name'] = args.match
+    if args.time:
+        filters['time_range'] = parse_range(args.time)
+    if args.length:
+        lo, hi = parse_range(args.length)
+        filters['length'] = {'min': int(lo) if lo else None, 'max': int(hi) if hi else None}
+    return filters or None
+
+
+def output_format(args) -> str:
+    if args.format:
+        return args.format
+    if args.out and args.out.lower().endswith('.csv'):
+        return 'csv'
+    return 'json'
+
+
+@contextlib.contextmanager
+def open_output(path: Optional[str]):
+    if not path or path == '-':
+        yield sys.stdout
+        return
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        yield f
+
+
+def write_rows(args, rows: List[Dict], document, columns: List[str]):
+    """
+    CSV: one line per row in rows. JSON: the whole document.
+    """
+    with open_output(args.out) as f:
+        if output_format(args) == 'csv':
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(document, f, indent=1)
+            f.write("\n")
+    if args.out and args.out != '-':
+        log(f"Results written to {args.out}")
+
+
+def cmd_build(args) -> int:
+    start = time.perf_counter()
+    store, parser = load_store(args)
+    refresh = parser.last_refresh
+    log(f"{len(store)} chains from {refresh.get('reused', 0) + refresh.get('reparsed', 0)} files "
+        f"({refresh.get('reparsed', 0)} parsed, {refresh.get('removed', 0)} removed) "
+        f"in {time.perf_counter() - start:.2f}s")
+    return 1 if parser.errors else 0
+
+
+def cmd_search(args) -> int:
+    queries = load_queries(args.queries)
+    store, _ = load_store(args)
+    matcher = make_matcher(store, args)
+    try:
+        return run_search(args, queries, store, matcher)
+    finally:
+        if hasattr(matcher, 'close'):
+            matcher.close()
+
+
+def run_search(args, queries: List[Dict], store, matcher) -> int:
+    filters = search_filters(args)
+    if filters:
+        ids = matcher.select(filters)
+        log(f"Running {len(queries)} queries against {len(ids)} of {len(store)} chains...")
+    else:
+        log(f"Running {len(queries)} queries against {len(store)} chains...")
+
+    # In process: one corpus pass per block of queries. With search workers:
+    # one query at a time, each spread over every worker
+    start = time.perf_counter()
+    all_matches = matcher.search_many([q['coords'] for q in queries], top_k=args.top_k,
+                                      pool_size=args.pool_size, filters=filters)
+    total = time.perf_counter() - start
+    document = []
+    rows = []
+    for q, matches, query_stats in zip(queries, all_matches, matcher.last_batch_stats):
+        results = []
+        for rank, m in enumerate(matches, 1):
+            chain = m['chain_data']
+            row = {
+                'query_id': q['id'],
+                'rank': rank,
+                'chain_idx': int(m['chain_idx']),
+                'distance': float(m['distance']),
+                'match_name': chain.get('match_name'),
+                'team_id': chain.get('team_id'),
+                'timestamp': chain.get('timestamp'),
+                'length': len(chain.get('coords')),
+            }
+            rows.append(row)
+            result = dict(row)
+            del result['query_id']
+            if args.coords:
+                result['coords'] = chain.get('coords')
+            results.append(result)
+        stats = {k: v for k, v in query_stats.items() if isinstance(v, (int, float, bool))}
+        document.append({'query_id': q['id'], 'stats': stats, 'results': results})
+
+    log(f"{len(queries)} queries in {total:.2f}s ({len(queries) / total if total else 0:.1f}/s)")
+    write_rows(args, rows, document,
+               ['query_id', 'rank', 'chain_idx', 'distance', 'match_name', 'team_id', 'timestamp', 'length'])
+    return 0
+
+
+def cmd_discover(args) -> int:
+    thresholds = [float(t) for t in args.thresholds.split(',') if t.strip()]
+    store, _ = load_store(args)
+    clusterer = PatternClusterer(store)
+    clusterer.extract_features(n_points=args.n_points)
+
+    document = []
+    rows = []
+    for threshold in thresholds:
+        start = time.perf_counter()
+        clusters = clusterer.cluster(threshold=threshold)
+        log(f"Threshold {threshold:g}: {len(clusters)} groups in {time.perf_counter() - start:.2f}s")
+
+        # Largest groups first, as the GUI lists them
+        groups = []
+        for cid in sorted(clusters, key=lambda k: len(clusters[k]), reverse=True):
+            members = clusters[cid]
+            if len(members) < args.min_size:
+                continue
+            leader = store[members[0]]
+            group = {
+                'threshold': threshold,
+                'cluster_id': cid,
+                'size': len(members),
+                'leader_idx': int(members[0]),
+                'leader_match': leader.get('match_name'),
+                'leader_timestamp': leader.get('timestamp'),
+                'members': [int(i) for i in members],
+            }
+            groups.append(group)
+            rows.append(dict(group, members=' '.join(str(i) for i in members)))
+        document.append({'threshold': threshold, 'n_groups': len(clusters), 'groups': groups})
+
+    write_rows(args, rows, document,
+               ['threshold', 'cluster_id', 'size', 'leader_idx', 'leader_match', 'leader_timestamp', 'members'])
+    return 0
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Football Tactical Pattern Matcher (headless)")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("data_dir", help="folder with the match JSON files")
+    common.add_argument("--cache", default=None, help="cache file (default: DATA_DIR/chains_cache.bin)")
+    common.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes")
+    common.add_argument("--metrics", default=None, help="write stage timings and counters as JSON here")
+
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--out", default=None, help="output file (default: stdout)")
+    output.add_argument("--format", choices=("json", "csv"), default=None,
+                        help="default: from the --out extension, else json")
+
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", parents=[common], help="build or refresh the chain cache")
+    p.add_argument("--export-json", action="store_true", help="also write the readable JSON export")
+    p.add_argument("--verify", action="store_true",
+                   help="check the cache's data checksums and rebuild it if it is damaged")
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser("search", parents=[common, output], help="run a file of queries")
+    p.add_argument("--queries", required=True, help="JSON array or JSON lines of queries")
+    p.add_argument("--top-k", type=int, default=15)
+    p.add_argument("--pool-size", type=int, default=None, help="approximate search: re-rank this many candidates")
+    p.add_argument("--window", type=int, default=None, help="Sakoe-Chiba band for DTW")
+    p.add_argument("--coords", action="store_true", help="include match coordinates in JSON output")
+    p.add_argument("--team", action="append", default=None, help="only this team id (repeatable)")
+    p.add_argument("--match", action="append", default=None, help="only this match (repeatable)")
+    p.add_argument("--time", default=None, help="game time range START-END, e.g. 0:00-15:00 or 2700-")
+    p.add_argument("--length", default=None, help="chain length N or range MIN-MAX")
+    p.add_argument("--search-workers", type=int, default=1,
+                   help="spread every query over this many processes (default: batched in this one)")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("discover", parents=[common, output], help="group similar patterns")
+    p.add_argument("--thresholds", default="40", help="comma separated similarity thresholds")
+    p.add_argument("--n-points", type=int, default=10, help="resampling points per chain")
+    p.add_argument("--min-size", type=int, default=1, help="leave out groups smaller than this")
+    p.set_defaults(func=cmd_discover)
+    return ap
+
+
+def main(argv=None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    try:
+        status = args.func(args)
+    except (OSError, ValueError) as e:
+        log(f"Error: {e}")
+        return 2
+    if args.metrics:
+        metrics.dump_json(args.metrics)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
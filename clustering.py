@@ -1,75 +1,343 @@
+import time
 import numpy as np
-from scipy.spatial.distance import cdist
 from typing import List, Dict
 
+from chain_store import ChainStore
+from instrumentation import metrics
+
+def resample_chains(coords: np.ndarray, offsets: np.ndarray, n_points: int = 10):
+    """
+    Resample every chain of a ragged corpus to n_points evenly spaced (by path
+    length) points, all at once.
+    coords: (P, 2) points of all chains back to back; offsets: (N + 1,) chain bounds.
+    Returns (features, valid): a float32 (M, 2 * n_points) matrix of flattened
+    [x0, y0, x1, y1, ...] vectors and the indices of the M chains that have at
+    least 2 points and a non-zero length (the others can't be resampled).
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    n_chains = len(lengths)
+    if n_chains == 0 or len(coords) == 0:
+        return np.zeros((0, 2 * n_points), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    # Path length of each step; the step into a chain's first point is zero
+    step = np.zeros(len(coords))
+    step[1:] = np.sqrt(np.sum(np.diff(coords, axis=0) ** 2, axis=1))
+    chain_of_point = np.repeat(np.arange(n_chains), lengths)
+    starts = offsets[:-1][lengths > 0]
+    step[starts] = 0.0
+
+    # Cumulative distance inside each chain, and each chain's total length
+    cum = np.cumsum(step)
+    cum -= np.repeat(cum[starts], lengths[lengths > 0])
+    total = np.zeros(n_chains)
+    ends = offsets[1:][lengths > 0] - 1
+    total[lengths > 0] = cum[ends]
+
+    valid = np.flatnonzero((lengths >= 2) & (total > 0))
+    if len(valid) == 0:
+        return np.zeros((0, 2 * n_points), dtype=np.float32), valid
+
+    # Put every chain on one increasing axis: chain c spans [2c, 2c + 1].
+    # The gap keeps one chain's end from touching the next chain's start.
+    keep = np.isin(chain_of_point, valid)
+    point_chain = chain_of_point[keep]
+    key = 2.0 * point_chain + cum[keep] / total[point_chain]
+    targets = (2.0 * valid[:, None] + np.linspace(0, 1, n_points)[None, :]).ravel()
+
+    features = np.empty((len(valid), n_points, 2), dtype=np.float32)
+    features[:, :, 0] = np.interp(targets, key, coords[keep, 0]).reshape(len(valid), n_points)
+    features[:, :, 1] = np.interp(targets, key, coords[keep, 1]).reshape(len(valid), n_points)
+    return features.reshape(len(valid), 2 * n_points), valid
+
+
 class PatternClusterer:
-    def __init__(self, chains: List[Dict]):
+    BACKENDS = ('kdtree', 'matrix')
+    # Largest threshold the GUI offers; neighbour lists never grow past it
+    MAX_THRESHOLD = 200.0
+    # New leaders checked one by one before the leader tree is rebuilt
+    LEADER_REBUILD = 256
+    # Neighbour entries (int32 index + float32 distance) cached over all rows
+    NEIGHBOR_BUDGET = 8_000_000
+    # Neighbour lists reach this far past the threshold asked for, so nearby
+    # spinbox values reuse them
+    NEIGHBOR_MARGIN = 10.0
+
+    def __init__(self, chains, backend: str = 'kdtree'):
+        """
+        chains: a ChainStore, or a list of chain dicts with a 'coords' key.
+        backend: how cluster() finds neighbours, 'kdtree' or 'matrix'.
+        """
+        if not isinstance(chains, ChainStore):
+            chains = ChainStore.from_chains(chains)
         self.chains = chains
         self.feature_matrix = None
+        self.n_points = None
         self.labels = None
         self.cluster_data = {}
+        # (n_points, threshold) of cluster_data, which extend() keeps up to date
+        self.cluster_key = None
+        self.backend = backend
+        self.max_threshold = self.MAX_THRESHOLD
+        self._tree = None
+        self._neighbor_cache = {}
+        self._neighbor_entries = 0
+        self._feature_cache = {}
+        self._leaders = None
 
     def extract_features(self, n_points=10):
         """
         Convert each chain into a fixed-size feature vector.
         We resample the chain to exactly n_points (x,y) coordinates.
         Vector size = n_points * 2.
+        Results are cached per n_points, so asking again is free.
         """
-        features = []
-        valid_indices = []
-        
-        for idx, chain in enumerate(self.chains):
-            coords = chain.get('coords')
-            if not coords or len(coords) < 2:
-                continue
-                
-            # Convert to numpy
-            arr = np.array(coords)
-            
-            # Simple resampling: Linear interpolation
-            # We want to interpolate 'arr' to 'n_points'
-            # Calculate cumulative distance to parametrize by length
-            dists = np.sqrt(np.sum(np.diff(arr, axis=0)**2, axis=1))
-            cum_dist = np.insert(np.cumsum(dists), 0, 0)
-            total_len = cum_dist[-1]
-            
-            if total_len == 0:
-                continue
-                
-            # Create target distances
-            target_dists = np.linspace(0, total_len, n_points)
-            
-            # Interpolate X and Y
-            new_xs = np.interp(target_dists, cum_dist, arr[:, 0])
-            new_ys = np.interp(target_dists, cum_dist, arr[:, 1])
-            
-            # Flatten to vector
-            vec = np.column_stack((new_xs, new_ys)).flatten()
-            features.append(vec)
-            valid_indices.append(idx)
-            
-        self.feature_matrix = np.array(features)
-        self.valid_indices = valid_indices
+        if n_points not in self._feature_cache:
+            with metrics.stage('clusterer.extract_features'):
+                features, valid = resample_chains(self.chains.coords, self.chains.offsets, n_points)
+            self._feature_cache[n_points] = (features, valid.tolist())
+        else:
+            metrics.count('clusterer.feature_cache_hits')
+
+        features, valid_indices = self._feature_cache[n_points]
+        self.n_points = n_points
+        if features is not self.feature_matrix:
+            self.feature_matrix = features
+            self.valid_indices = valid_indices
+            self._tree = None
+            self._clear_neighbors()
         return self.feature_matrix
 
-    def cluster(self, threshold=40.0):
+    def cluster(self, threshold=40.0, backend=None):
         """
         Perform Greedy Threshold Clustering (Leader Algorithm).
         1. Pick unassigned item.
         2. Find all items within 'threshold' distance.
         3. Group them.
         4. Repeat.
+        backend: 'kdtree' (default) answers step 2 with a KD-tree radius query,
+        so memory stays linear in N; 'matrix' is the original full cdist matrix.
+        Both give the same clusters.
         """
+        backend = backend or self.backend
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {self.BACKENDS}")
         if self.feature_matrix is None:
             self.extract_features()
             
         n_samples = len(self.feature_matrix)
+        self.cluster_key = (self.n_points, threshold)
+        self._leaders = None
         if n_samples == 0:
-            return {}
-            
+            self.cluster_data = {}
+            return self.cluster_data
+
+        with metrics.stage('clusterer.cluster'):
+            if backend == 'matrix':
+                clusters = self._cluster_matrix(threshold)
+            else:
+                clusters = self._cluster_kdtree(threshold)
+        metrics.count('clusterer.clusters_found', len(clusters))
+
+        self.cluster_data = clusters
+        return clusters
+
+    def add_chains(self, chains) -> Dict[int, List[int]]:
+        """
+        Appends chains (a ChainStore or chain dicts) to the corpus, see extend().
+        """
+        if not isinstance(chains, ChainStore):
+            chains = ChainStore.from_chains(chains)
+        return self.extend(ChainStore.concat([self.chains, chains]))
+
+    def extend(self, store: ChainStore) -> Dict[int, List[int]]:
+        """
+        Switches to store, which must be the current corpus with chains
+        appended, without clustering again. Only the new chains are resampled,
+        and each is put in the first cluster (in cluster id order) whose
+        leader is within the last cluster() threshold, or starts a new
+        cluster. That is what the leader algorithm gives over the whole
+        appended corpus: new chains come after every old one, so the old
+        clusters can only gain members.
+        Returns the updated cluster_data (the same dict, changed in place).
+        """
+        if not store.starts_with(self.chains):
+            raise ValueError("extend() needs the current chains followed by the new ones")
+        n_old = len(self.chains)
+        first_point = int(store.offsets[n_old])
+
+        with metrics.stage('clusterer.extend'):
+            # Resample the new chains for every cached n_points
+            new_rows = {}
+            for n_points, (features, valid) in self._feature_cache.items():
+                added, added_valid = resample_chains(store.coords[first_point:],
+                                                     store.offsets[n_old:] - first_point, n_points)
+                new_rows[n_points] = np.arange(len(features), len(features) + len(added))
+                self._feature_cache[n_points] = (np.concatenate([features, added]),
+                                                 valid + (added_valid + n_old).tolist())
+            self.chains = store
+
+            # Neighbour lists and the tree don't know the new rows
+            if self.feature_matrix is not None:
+                self.feature_matrix, self.valid_indices = self._feature_cache[self.n_points]
+            self._tree = None
+            self._clear_neighbors()
+
+            if self.cluster_key is not None and self.cluster_key[0] in new_rows:
+                n_points, threshold = self.cluster_key
+                self._assign(new_rows[n_points], *self._feature_cache[n_points], threshold)
+        metrics.count('clusterer.chains_added', len(store) - n_old)
+        return self.cluster_data
+
+    def _assign(self, rows, features, valid_indices, threshold):
+        """
+        Puts feature rows (in order) into the cluster of the first leader
+        closer than threshold, or makes them leaders of new clusters.
+        """
+        from scipy.spatial import cKDTree
+        if self._leaders is None:
+            # Leaders are the first members, cluster ids run in leader order
+            leaders = [self.cluster_data[cid][0] for cid in sorted(self.cluster_data)]
+            self._leaders = {'rows': np.searchsorted(valid_indices, leaders).tolist(), 'tree': None, 'n_tree': 0}
+        state = self._leaders
+        if state['tree'] is None and state['rows']:
+            state['tree'] = cKDTree(features[state['rows']])
+            state['n_tree'] = len(state['rows'])
+
+        leader_rows = state['rows']
+        n_tree = state['n_tree']
+        tree_rows = np.asarray(leader_rows[:n_tree], dtype=np.int64)
+        tree_hits = state['tree'].query_ball_point(features[rows], threshold) if n_tree else [[]] * len(rows)
+        for row, hits in zip(rows, tree_hits):
+            cid = None
+            # Leaders in the tree come first in leader order, then the ones added since
+            if hits:
+                hits = np.sort(np.asarray(hits, dtype=np.int64))
+                diff = features[tree_rows[hits]] - features[row]
+                inside = hits[np.sqrt(np.sum(diff * diff, axis=1)) < threshold]
+                if len(inside):
+                    cid = int(inside[0])
+            if cid is None and len(leader_rows) > n_tree:
+                diff = features[leader_rows[n_tree:]] - features[row]
+                inside = np.flatnonzero(np.sqrt(np.sum(diff * diff, axis=1)) < threshold)
+                if len(inside):
+                    cid = n_tree + int(inside[0])
+
+            if cid is None:
+                cid = len(leader_rows)
+                leader_rows.append(int(row))
+                self.cluster_data[cid] = [valid_indices[row]]
+            else:
+                self.cluster_data[cid].append(valid_indices[row])
+
+        if len(leader_rows) - n_tree > self.LEADER_REBUILD:
+            state['tree'] = None
+
+    def _get_tree(self):
+        from scipy.spatial import cKDTree
+        if self._tree is None:
+            with metrics.stage('clusterer.build_tree'):
+                self._tree = cKDTree(self.feature_matrix)
+        return self._tree
+
+    def _clear_neighbors(self):
+        self._neighbor_cache = {}
+        self._neighbor_entries = 0
+
+    def neighbors(self, i, threshold):
+        """
+        Feature-row indices within 'threshold' (strictly) of row i.
+        Each row's neighbour list is found with a KD-tree radius query out to
+        threshold + NEIGHBOR_MARGIN (capped at max_threshold unless the
+        threshold itself is larger) and kept sorted by distance, so it answers
+        any threshold up to that radius as a prefix.
+        The lists are int32/float32 and the cache holds at most
+        NEIGHBOR_BUDGET entries in total. A list that doesn't fit isn't
+        cached (nothing is evicted, so a repeated pass still hits every row
+        that fit the first time); it is answered in tree order instead.
+        """
+        cached = self._neighbor_cache.get(i)
+        if cached is not None and cached[2] >= threshold:
+            idx, dists, radius = cached
+            return idx[:np.searchsorted(dists, threshold, side='left')]
+
+        radius = max(threshold, min(threshold + self.NEIGHBOR_MARGIN, self.max_threshold))
+        features = self.feature_matrix
+        idx = np.asarray(self._get_tree().query_ball_point(features[i], radius), dtype=np.int32)
+        diff = features[idx] - features[i]
+        dists = np.sqrt(np.sum(diff * diff, axis=1), dtype=np.float32)
+        metrics.count('clusterer.radius_queries')
+
+        freed = len(cached[0]) if cached is not None else 0
+        if self._neighbor_entries - freed + len(idx) > self.NEIGHBOR_BUDGET:
+            metrics.count('clusterer.neighbor_cache_skips')
+            return idx[dists < threshold]
+
+        order = np.argsort(dists, kind='stable')
+        idx, dists = idx[order], dists[order]
+        self._neighbor_cache[i] = (idx, dists, radius)
+        self._neighbor_entries += len(idx) - freed
+        return idx[:np.searchsorted(dists, threshold, side='left')]
+
+    def _leader_pass(self, threshold, collect=True):
+        """
+        One leader-algorithm pass over the cached neighbour lists.
+        Returns {cluster_id: [chain indices]} if collect, else just the count.
+        """
+        start = time.perf_counter()
+        n_samples = len(self.feature_matrix)
+        visited = np.zeros(n_samples, dtype=bool)
+        clusters = {}
+        cluster_id = 0
+
+        for i in range(n_samples):
+            if visited[i]:
+                continue
+
+            # Start new cluster with chain 'i' as the "Leader"
+            visited[i] = True
+            members = self.neighbors(i, threshold)
+            members = members[~visited[members]]
+            visited[members] = True
+
+            if collect:
+                # Members in index order, as the original scan produced them
+                members = np.sort(members)
+                clusters[cluster_id] = [self.valid_indices[i]] + [self.valid_indices[j] for j in members]
+            cluster_id += 1
+
+        metrics.record('clusterer.leader_pass', time.perf_counter() - start)
+        return clusters if collect else cluster_id
+
+    def _cluster_kdtree(self, threshold):
+        """
+        Leader algorithm with cached KD-tree neighbour lists; only leaders are queried.
+        """
+        return self._leader_pass(threshold)
+
+    def cluster_counts(self, thresholds):
+        """
+        Number of clusters the leader algorithm finds at each threshold,
+        e.g. cluster_counts(range(5, 201)) to scan the whole spinbox range.
+        Returns {threshold: count}. Neighbour lists are shared between
+        thresholds, so after the first sweep this is cheap.
+        """
+        if self.feature_matrix is None:
+            self.extract_features()
+        if len(self.feature_matrix) == 0:
+            return {t: 0 for t in thresholds}
+        return {t: self._leader_pass(t, collect=False) for t in thresholds}
+
+    def _cluster_matrix(self, threshold):
+        """
+        Original implementation on the full N x N distance matrix.
+        """
         # Calculate pairwise distances (Euclidean)
         # O(N^2), but fast for N < 10000 in numpy
-        dist_matrix = cdist(self.feature_matrix, self.feature_matrix, metric='euclidean')
+        from scipy.spatial.distance import cdist
+        with metrics.stage('clusterer.cdist'):
+            dist_matrix = cdist(self.feature_matrix, self.feature_matrix, metric='euclidean')
         
         visited = set()
         clusters = {}
@@ -78,7 +346,7 @@ class PatternClusterer:
         # Sort indices? No, random order is arguably better or standard order.
         # Standard order ensures determinism.
         
-        for i in range(n_samples):
+        for i in range(len(self.feature_matrix)):
             if i in visited:
                 continue
                 
@@ -100,7 +368,6 @@ class PatternClusterer:
             clusters[cluster_id] = current_cluster
             cluster_id += 1
             
-        self.cluster_data = clusters
         return clusters
 
     def get_cluster_representative(self, cluster_id):
@@ -122,3 +389,70 @@ class PatternClusterer:
         leader_idx = indices_in_full_list[0]
         chain = self.chains[leader_idx]
         return chain.get('coords')
+
+
+class LengthClusterer:
+    """
+    Clusterings of the chains of one length at a time, for the Length
+    Analysis view. Uses the store's length index, so picking a length is a
+    slice rather than a scan, and memoizes everything per length: the
+    sub-store, a PatternClusterer per (length, n_points) (which keeps its
+    features and neighbour lists) and the clusters per (length, n_points,
+    threshold). Going back to a length already seen is a dict lookup.
+    """
+
+    def __init__(self, chains):
+        if not isinstance(chains, ChainStore):
+            chains = ChainStore.from_chains(chains)
+        self.chains = chains
+        self.index = chains.length_index
+        self._subsets = {}
+        self._clusterers = {}
+        self._clusters = {}
+
+    def lengths(self) -> List[int]:
+        return self.index.lengths()
+
+    def count(self, length: int) -> int:
+        return self.index.count(length)
+
+    def subset(self, length: int) -> ChainStore:
+        """
+        Store of the chains with this length, in corpus order.
+        """
+        if length not in self._subsets:
+            self._subsets[length] = self.chains.take(self.index.ids(length))
+        return self._subsets[length]
+
+    def chain_ids(self, length: int) -> np.ndarray:
+        """
+        Corpus ids of subset(length)'s rows.
+        """
+        return self.index.ids(length)
+
+    def clusterer(self, length: int, n_points: int = 10) -> PatternClusterer:
+        key = (length, n_points)
+        if key not in self._clusterers:
+            clusterer = PatternClusterer(self.subset(length))
+            clusterer.extract_features(n_points=n_points)
+            self._clusterers[key] = clusterer
+        return self._clusterers[key]
+
+    def features(self, length: int, n_points: int = 10) -> np.ndarray:
+        return self.clusterer(length, n_points).feature_matrix
+
+    def cluster(self, length: int, n_points: int = 10, threshold: float = 40.0) -> Dict[int, List[int]]:
+        """
+        Leader clusters of the chains of this length, as rows of subset(length).
+        """
+        key = (length, n_points, threshold)
+        if key in self._clusters:
+            metrics.count('clusterer.length_cache_hits')
+            return self._clusters[key]
+        clusterer = self.clusterer(length, n_points)
+        if len(self.subset(length)) == 0:
+            clusters = {}
+        else:
+            clusters = clusterer.cluster(threshold=threshold)
+        self._clusters[key] = clusters
+        return clusters
@@ -0,0 +1,230 @@
+import numpy as np
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# Upper bound on the size of one (batch, n, m) cost block.
+# Keeps memory flat no matter how many chains share a length.
+MAX_BLOCK_CELLS = 4_000_000
+
+
+@lru_cache(maxsize=512)
+def _diagonals(n: int, m: int, window: Optional[int]) -> Tuple[Tuple[np.ndarray, ...], ...]:
+    """
+    Precompute the flat cell indices of every anti-diagonal of an
+    (n+1) x (m+1) accumulated cost matrix, restricted to the Sakoe-Chiba band.
+    Returns one (cell, up, left, diag, cost) tuple of index arrays per diagonal.
+    """
+    width = m + 1
+    diagonals = []
+    for d in range(2, n + m + 1):
+        i = np.arange(max(1, d - m), min(n, d - 1) + 1)
+        j = d - i
+        if window is not None:
+            keep = np.abs(i - j) <= window
+            i, j = i[keep], j[keep]
+        if len(i) == 0:
+            continue
+        cell = i * width + j
+        cost = (i - 1) * m + (j - 1)
+        diagonals.append((cell, cell - width, cell - 1, cell - width - 1, cost))
+    return tuple(diagonals)
+
+
+def pairwise_cost(query: np.ndarray, batch: np.ndarray) -> np.ndarray:
+    """
+    Euclidean distance between every query point and every chain point.
+    query: (n, 2), or (B, n, 2) for one query per chain; batch: (B, m, 2) -> (B, n, m)
+    """
+    if query.ndim == 2:
+        query = query[None]
+    diff = query[:, :, None, :] - batch[:, None, :, :]
+    return np.sqrt(np.sum(diff * diff, axis=-1))
+
+
+def dtw_batch(query: np.ndarray, batch: np.ndarray, window: Optional[int] = None,
+              max_dist: Optional[float] = None) -> np.ndarray:
+    """
+    Exact DTW distance between one query and a batch of equal-length chains.
+    The point metric is Euclidean, so the result is the same quantity fastdtw
+    approximates with dist=euclidean.
+
+    The accumulated cost matrix is filled one anti-diagonal at a time: every
+    cell on a diagonal only depends on the two previous diagonals, so a whole
+    diagonal is updated for the whole batch in a single NumPy step.
+
+    window: optional Sakoe-Chiba band half-width. Cells with |i - j| > window
+    are never visited; pairs whose lengths differ by more than the window get
+    an infinite distance.
+
+    max_dist: optional early-abandoning threshold. A warping path steps one or
+    two diagonals at a time, so it touches one of any two consecutive
+    diagonals; once the minimum over the last two diagonals exceeds max_dist
+    the chain can never beat it and is dropped with an infinite distance.
+
+    To score many (query, chain) pairs in one go, query can also be a
+    (B, n, 2) array, one query per chain, and max_dist a (B,) array.
+    """
+    query = np.asarray(query, dtype=np.float64)
+    batch = np.asarray(batch)
+    n_chains = batch.shape[0]
+    n, m = query.shape[-2], batch.shape[1]
+    paired = query.ndim == 3
+    if max_dist is not None and np.ndim(max_dist):
+        max_dist = np.asarray(max_dist, dtype=np.float64)
+
+    if n_chains == 0:
+        return np.zeros(0)
+    if n == 0 or m == 0:
+        return np.full(n_chains, np.inf)
+    if window is not None and abs(n - m) > window:
+        return np.full(n_chains, np.inf)
+
+    # Split very large groups so the cost block stays bounded
+    block = max(1, MAX_BLOCK_CELLS // (n * m))
+    if n_chains > block:
+        def part(arr, start):
+            return arr[start:start + block] if arr is not None and np.ndim(arr) else arr
+        return np.concatenate([
+            dtw_batch(part(query, start) if paired else query, batch[start:start + block],
+                      window, part(max_dist, start))
+            for start in range(0, n_chains, block)
+        ])
+
+    cost = pairwise_cost(query, batch).reshape(n_chains, n * m)
+    acc = np.full((n_chains, (n + 1) * (m + 1)), np.inf)
+    acc[:, 0] = 0.0
+
+    out = np.full(n_chains, np.inf)
+    rows = np.arange(n_chains)
+    prev_cell = None
+
+    for cell, up, left, diag, cost_idx in _diagonals(n, m, window):
+        best = np.minimum(np.minimum(acc[:, up], acc[:, left]), acc[:, diag])
+        acc[:, cell] = cost[:, cost_idx] + best
+
+        if max_dist is not None and prev_cell is not None:
+            lower = np.minimum(acc[:, cell].min(axis=1), acc[:, prev_cell].min(axis=1))
+            alive = lower <= max_dist
+            if not alive.all():
+                if not alive.any():
+                    return out
+                acc, cost, rows = acc[alive], cost[alive], rows[alive]
+                if np.ndim(max_dist):
+                    max_dist = max_dist[alive]
+        prev_cell = cell
+
+    out[rows] = acc[:, -1]
+    return out
+
+
+def dtw_distance(a: np.ndarray, b: np.ndarray, window: Optional[int] = None) -> float:
+    """
+    Exact DTW distance between two sequences of (x, y) points.
+    """
+    b = np.asarray(b)
+    return float(dtw_batch(a, b[None, :, :], window)[0])
+
+
+def envelope(batch: np.ndarray, window: Optional[int] = None,
+             n_centers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-axis lower/upper envelope of a batch of chains (B, m, 2).
+    Without a window this is the bounding box of each chain, shape (B, 1, 2).
+    With a window, entry c covers points [c - window, c + window], shape (B, n_centers, 2).
+    """
+    batch = np.asarray(batch)
+    if window is None:
+        return batch.min(axis=1, keepdims=True), batch.max(axis=1, keepdims=True)
+
+    m = batch.shape[1]
+    if n_centers is None:
+        n_centers = m
+    lower = np.empty((batch.shape[0], n_centers, 2))
+    upper = np.empty((batch.shape[0], n_centers, 2))
+    for c in range(n_centers):
+        # Centres past the end only occur for pairs the band rules out anyway
+        start = min(max(0, c - window), m - 1)
+        stop = max(min(m, c + window + 1), start + 1)
+        lower[:, c] = batch[:, start:stop].min(axis=1)
+        upper[:, c] = batch[:, start:stop].max(axis=1)
+    return lower, upper
+
+
+def envelope_distance(points: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """
+    Sum over points of the distance from each point to its envelope box.
+    points: (n, 2) or (B, n, 2); lower/upper: (B, 1 or >= n, 2) -> (B,)
+    Leading dimensions broadcast, e.g. (Q, 1, n, 2) points against
+    (B, 1, 2) boxes give (Q, B).
+    """
+    n = points.shape[-2]
+    if lower.shape[-2] != 1:
+        lower, upper = lower[..., :n, :], upper[..., :n, :]
+    gap = np.maximum(lower - points, 0.0) + np.maximum(points - upper, 0.0)
+    return np.sqrt(np.sum(gap * gap, axis=-1)).sum(axis=-1)
+
+
+def lb_kim(query: np.ndarray, batch: np.ndarray) -> np.ndarray:
+    """
+    LB_Kim: every warping path starts at the first pair and ends at the last pair.
+    """
+    first = np.linalg.norm(batch[:, 0] - query[0], axis=-1)
+    if query.shape[0] == 1 and batch.shape[1] == 1:
+        return first
+    return first + np.linalg.norm(batch[:, -1] - query[-1], axis=-1)
+
+
+def lb_keogh(query: np.ndarray, batch: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+             window: Optional[int] = None) -> np.ndarray:
+    """
+    Symmetric LB_Keogh. Every query point is matched to at least one chain
+    point inside its band (and vice versa), so the distance to the envelope
+    of that band is a lower bound on its share of the DTW cost.
+    lower/upper: envelope of the batch from envelope().
+    """
+    query = np.asarray(query, dtype=np.float64)
+    forward = envelope_distance(query, lower, upper)
+    q_lower, q_upper = envelope(query[None, :, :], window, batch.shape[1])
+    backward = envelope_distance(batch, q_lower, q_upper)
+    return np.maximum(forward, backward)
+
+
+# Upper bound on the size of one (queries, chains, points) block in the _many bounds
+MAX_BOUND_CELLS = 2_000_000
+
+
+def _chain_blocks(n_queries: int, batch: np.ndarray):
+    """
+    Slices of the batch small enough that a (queries, chains, points) block
+    stays under MAX_BOUND_CELLS.
+    """
+    step = max(1, MAX_BOUND_CELLS // max(1, n_queries * batch.shape[1]))
+    for start in range(0, batch.shape[0], step):
+        yield slice(start, start + step)
+
+
+def lb_kim_many(queries: np.ndarray, batch: np.ndarray) -> np.ndarray:
+    """
+    lb_kim for every query of a (Q, n, 2) stack against every chain -> (Q, B).
+    """
+    first = np.linalg.norm(batch[None, :, 0] - queries[:, None, 0], axis=-1)
+    if queries.shape[1] == 1 and batch.shape[1] == 1:
+        return first
+    return first + np.linalg.norm(batch[None, :, -1] - queries[:, None, -1], axis=-1)
+
+
+def lb_keogh_many(queries: np.ndarray, batch: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                  window: Optional[int] = None) -> np.ndarray:
+    """
+    lb_keogh for every query of a (Q, n, 2) stack against every chain -> (Q, B).
+    The chain envelopes are shared by all queries; each query's own envelope
+    is built once for the whole batch.
+    """
+    queries = np.asarray(queries, dtype=np.float64)
+    q_lower, q_upper = envelope(queries, window, batch.shape[1])
+    out = np.empty((len(queries), len(batch)))
+    for part in _chain_blocks(len(queries), batch):
+        forward = envelope_distance(queries[:, None], lower[None, part], upper[None, part])
+        backward = envelope_distance(batch[None, part], q_lower[:, None], q_upper[:, None])
+        out[:, part] = np.maximum(forward, backward)
+    return out
@@ -1,29 +1,44 @@
+import time
+APP_START = time.perf_counter() # Before the heavy imports: startup is measured from here
+
 import sys
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QListWidget, QLabel, QListWidgetItem, QMessageBox, QSplitter, QProgressBar,
-                             QTabWidget, QComboBox, QSpinBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import numpy as np
+                             QTabWidget, QComboBox, QSpinBox, QPlainTextEdit, QFileDialog)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt6.QtGui import QFontDatabase
 import os
-import time
 
 # Import our modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from parser import ChainParser
-from matcher import PatternMatcher
-from clustering import PatternClusterer
-from visualizer import Visualizer
+# matplotlib, SciPy and fastdtw are imported on first use (canvas shown,
+# corpus loaded), so the window comes up before they are loaded
+from instrumentation import metrics
 
 class DataLoaderThread(QThread):
-    finished = pyqtSignal(object, object) # Matcher, Clusterer
+    finished = pyqtSignal(object, object, object) # Matcher, Clusterer, LengthClusterer
     progress = pyqtSignal(str)
 
+    def __init__(self, server_url=None, search_workers=1):
+        """
+        server_url: use a running query server (server.py) instead of
+        loading the corpus in this process.
+        search_workers: > 1 spreads every search over that many processes.
+        """
+        super().__init__()
+        self.server_url = server_url
+        self.search_workers = search_workers
+
     def run(self):
         try:
+            if self.server_url:
+                self.connect_server()
+                return
             self.progress.emit("Initializing parser...")
+            from parser import ChainParser
+            from matcher import PatternMatcher
+            from clustering import PatternClusterer, LengthClusterer
             # Paths
             data_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             cwd = os.getcwd()
@@ -37,66 +52,258 @@ class DataLoaderThread(QThread):
             else:
                 data_path = cwd
             
-            cache_path = os.path.join(data_path, "chains_cache.pkl")
+            cache_path = os.path.join(data_path, "chains_cache.bin")
             
             self.progress.emit(f"Data Path: {data_path}")
             self.progress.emit("Checking cache (parsing metadata)...")
             
-            parser = ChainParser(data_path, cache_file=cache_path)
+            parser = ChainParser(data_path, cache_file=cache_path, workers=os.cpu_count() or 1)
             chains = parser.process_all()
             
             self.progress.emit(f"Loaded {len(chains)} chains. Indexing...")
-            matcher = PatternMatcher(chains)
+            if self.search_workers > 1:
+                from parallel import ParallelMatcher
+                self.progress.emit(f"Starting {self.search_workers} search workers...")
+                matcher = ParallelMatcher(chains, n_workers=self.search_workers)
+            else:
+                matcher = PatternMatcher(chains)
             
-            self.progress.emit("Clustering patterns...")
+            # Clustering waits until the Discovery tab is opened
             clusterer = PatternClusterer(chains)
-            # Run clustering (lightweight enough?)
-            clusterer.extract_features(n_points=10)
-            clusterer.cluster(threshold=40)
             
-            self.finished.emit(matcher, clusterer)
+            self.finished.emit(matcher, clusterer, LengthClusterer(chains))
             
         except Exception as e:
             self.progress.emit(f"Error: {str(e)}")
-            self.finished.emit(None, None)
+            self.finished.emit(None, None, None)
+
+    def connect_server(self):
+        from remote import RemoteBackend
+        self.progress.emit(f"Connecting to query server {self.server_url}...")
+        backend = RemoteBackend(self.server_url)
+        self.progress.emit(f"Server has {len(backend.chains)} chains.")
+        self.finished.emit(backend.matcher(), backend.clusterer(), backend.length_clusterer())
+
+class SearchWorker(QThread):
+    """
+    Runs one search off the GUI thread and streams the current top-k as the
+    corpus is scored. cancel() makes it stop after the chunk in progress.
+    """
+    partial = pyqtSignal(object, int) # matches, generation
+    done = pyqtSignal(object, object, int, bool) # matches, stats, generation, cancelled
+
+    # Minimum seconds between two partial updates
+    PARTIAL_INTERVAL = 0.1
+
+    def __init__(self, matcher, query, top_k, generation, capture=None, filters=None):
+        """
+        capture: 'cprofile' or 'tracemalloc' to profile this search; the
+        result is left in self.capture_result.
+        filters: team / match / time filters for the matcher, or None.
+        """
+        super().__init__()
+        self.matcher = matcher
+        self.query = query
+        self.top_k = top_k
+        self.generation = generation
+        self.capture = capture
+        self.filters = filters
+        self.capture_result = None
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            if self.capture:
+                with metrics.capture(self.capture) as cap:
+                    matches = self.search()
+                self.capture_result = cap
+            else:
+                matches = self.search()
+            self.done.emit(matches, dict(self.matcher.last_search_stats), self.generation, self._cancelled)
+        except Exception as e:
+            self.done.emit([], {'error': str(e)}, self.generation, True)
+
+    def search(self):
+        matches = []
+        last_emit = 0.0
+        for matches in self.matcher.iter_search(self.query, top_k=self.top_k, filters=self.filters):
+            if self._cancelled:
+                break
+            now = time.perf_counter()
+            if now - last_emit >= self.PARTIAL_INTERVAL:
+                self.partial.emit(matches, self.generation)
+                last_emit = now
+        return matches
+
+class ClusterCountWorker(QThread):
+    """
+    Counts the groups at one threshold off the GUI thread, for the
+    Pattern Discovery preview.
+    """
+    done = pyqtSignal(int, int) # threshold, count (-1 on error)
+
+    def __init__(self, clusterer, threshold):
+        super().__init__()
+        self.clusterer = clusterer
+        self.threshold = threshold
+
+    def run(self):
+        try:
+            count = self.clusterer.cluster_counts([self.threshold])[self.threshold]
+        except Exception as e:
+            print(f"Counting groups failed: {e}")
+            count = -1
+        self.done.emit(self.threshold, count)
+
+_PitchCanvas = None
+
+def make_pitch_canvas(figure):
+    """
+    FigureCanvas that reports its full redraws to the metrics. The class is
+    built on first use so matplotlib's Qt backend loads with the first canvas.
+    """
+    global _PitchCanvas
+    if _PitchCanvas is None:
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+        class PitchCanvas(FigureCanvas):
+            def draw(self):
+                with metrics.stage('canvas.full_draw'):
+                    super().draw()
+
+        _PitchCanvas = PitchCanvas
+    return _PitchCanvas(figure)
 
 class CanvasWidget(QWidget):
+    """
+    Pitch canvas with click-to-draw.
+
+    The pitch never changes, so it is drawn once per canvas size and kept as a
+    background bitmap. The query / comparison / result chains are animated
+    artists: a redraw restores the bitmap and blits only those on top.
+    Context chains (e.g. every member of a cluster) are drawn faintly into
+    the background itself, with a fixed number of artists however many
+    there are, so they only cost a full redraw when they change.
+
+    The figure is only built once the widget is first shown (so canvases on
+    hidden tabs cost nothing at startup); until then draw() just keeps the
+    state.
+    """
     def __init__(self, parent=None):
         super().__init__(parent)
         self.layout = QVBoxLayout(self)
         
-        self.figure = Figure(figsize=(5, 4), dpi=100)
-        self.figure.patch.set_facecolor('#4B823B') # Match pitch color to hide padding
-        self.canvas = FigureCanvas(self.figure)
-        self.ax = self.figure.add_subplot(111)
-        
-        self.layout.addWidget(self.canvas)
+        self.figure = None
+        self.canvas = None
+        self.ax = None
+        self._build_pending = False
+        self._pending_context = None
         
         self.clicks = []
         self.result_chain = None
         self.comparison_chain = None
-        
-        self.draw()
-        self.canvas.mpl_connect('button_press_event', self.on_click)
+        self.context = []
+        self.overlays = []
+        self.background = None
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.canvas is None and not self._build_pending:
+            # Let the window paint first, then load matplotlib
+            self._build_pending = True
+            QTimer.singleShot(0, self.build)
+
+    def build(self):
+        if self.canvas is not None:
+            return
+        with metrics.stage('canvas.build'):
+            from matplotlib.figure import Figure
+            from visualizer import Visualizer
+            
+            self.figure = Figure(figsize=(5, 4), dpi=100)
+            self.figure.patch.set_facecolor('#4B823B') # Match pitch color to hide padding
+            self.canvas = make_pitch_canvas(self.figure)
+            self.ax = self.figure.add_subplot(111)
+            Visualizer.draw_pitch(self.ax)
+            
+            self.layout.addWidget(self.canvas)
+            
+            self.canvas.mpl_connect('draw_event', self.on_full_draw)
+            self.canvas.mpl_connect('resize_event', self.on_resize)
+            if self._pending_context is not None:
+                self.set_context(self._pending_context)
+                self._pending_context = None
+            self.draw()
+            self.canvas.mpl_connect('button_press_event', self.on_click)
+
+    def build_overlays(self):
+        from visualizer import Visualizer
+        for artist in self.overlays:
+            artist.remove()
+        self.overlays = []
 
-    def draw(self):
-        self.ax.clear()
-        Visualizer.draw_pitch(self.ax)
-        
         # Draw query
         if self.clicks:
-            Visualizer.plot_chain(self.ax, self.clicks, color='red', label='Query', linestyle='--', marker='x')
+            self.overlays += Visualizer.plot_chain(self.ax, self.clicks, color='red', label='Query', linestyle='--', marker='x')
 
         # Draw comparison (Previous selection)
         if self.comparison_chain:
-            Visualizer.plot_chain(self.ax, self.comparison_chain, color='#E67E22', label='Previous', linestyle='-', alpha=0.7)
+            self.overlays += Visualizer.plot_chain(self.ax, self.comparison_chain, color='#E67E22', label='Previous', linestyle='-', alpha=0.7)
 
         # Draw result (Current selection)
         if self.result_chain:
-            Visualizer.plot_chain(self.ax, self.result_chain, color='blue', label='Current', linestyle='-')
-            self.ax.legend()
-            
-        self.canvas.draw()
+            self.overlays += Visualizer.plot_chain(self.ax, self.result_chain, color='blue', label='Current', linestyle='-')
+            # Fixed corner: loc='best' would scan every pitch artist on each redraw
+            self.overlays.append(self.ax.legend(loc='upper right'))
+
+        # Animated artists are skipped by full redraws, so the cached
+        # background only ever holds the pitch
+        for artist in self.overlays:
+            artist.set_animated(True)
+
+    def set_context(self, chains):
+        if self.canvas is None:
+            self._pending_context = chains
+            return
+        from visualizer import Visualizer
+        for artist in self.context:
+            artist.remove()
+        # Paths only, no arrows or markers
+        self.context = Visualizer.plot_chains(self.ax, chains, color='white', alpha=0.25,
+                                              linewidth=1, arrows=False, markers=False)
+        self.background = None # Part of the bitmap: next draw is a full one
+
+    def draw_overlays(self):
+        for artist in sorted(self.overlays, key=lambda a: a.get_zorder()):
+            self.ax.draw_artist(artist)
+
+    def draw(self):
+        if self.canvas is None:
+            return # Not shown yet; build() draws the current state
+        with metrics.stage('canvas.draw'):
+            self.build_overlays()
+            if self.background is None:
+                # No bitmap yet (first show or just resized): a full draw
+                # captures it in on_full_draw
+                self.canvas.draw_idle()
+                return
+            self.canvas.restore_region(self.background)
+            self.draw_overlays()
+            self.canvas.blit(self.figure.bbox)
+        metrics.count('canvas.blits')
+
+    def on_full_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_overlays()
+
+    def on_resize(self, event):
+        # The bitmap is only valid for one canvas size; Qt schedules a full
+        # redraw after the resize, which rebuilds it
+        self.background = None
+        self.canvas.draw_idle()
 
     def on_click(self, event):
         if event.inaxes != self.ax:
@@ -109,16 +316,30 @@ class CanvasWidget(QWidget):
         self.clicks = []
         self.result_chain = None
         self.comparison_chain = None
+        if self.context or self._pending_context:
+            self.set_context([])
         self.draw()
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # Top of the minute filter's range
+    MAX_MINUTE = 130
+    # Milliseconds the threshold spinbox must rest before the group count is previewed
+    PREVIEW_DELAY_MS = 300
+
+    def __init__(self, server_url=None, search_workers=1):
         super().__init__()
         self.setWindowTitle("Football Tactical Pattern Matcher V2")
         self.resize(1300, 850)
         
+        self.server_url = server_url
+        self.search_workers = search_workers
         self.matcher = None
         self.clusterer = None
+        self.clustered_threshold = None # Threshold of the clustering on display
+        self.length_clusterer = None
+        self.search_worker = None
+        self.search_generation = 0
+        self.preview_worker = None
         
         # Main Tab Widget
         self.tabs = QTabWidget()
@@ -139,6 +360,12 @@ class MainWindow(QMainWindow):
         self.setup_length_tab()
         self.tabs.addTab(self.tab_length, "Length Analysis")
         
+        # Tab 4: Diagnostics
+        self.tab_diagnostics = QWidget()
+        self.setup_diagnostics_tab()
+        self.tabs.addTab(self.tab_diagnostics, "Diagnostics")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        
         # Start loading
         self.start_loading()
 
@@ -153,13 +380,18 @@ class MainWindow(QMainWindow):
         
         controls = QHBoxLayout()
         self.btn_clear = QPushButton("Clear Query")
+        self.btn_clear.clicked.connect(self.cancel_search)
         self.btn_clear.clicked.connect(self.search_canvas.clear)
         self.btn_search = QPushButton("Search Patterns")
         self.btn_search.clicked.connect(self.run_search)
         self.btn_search.setEnabled(False)
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.clicked.connect(self.cancel_search)
+        self.btn_cancel.setEnabled(False)
         
         controls.addWidget(self.btn_clear)
         controls.addWidget(self.btn_search)
+        controls.addWidget(self.btn_cancel)
         left_layout.addLayout(controls)
         
         # Right Panel
@@ -171,6 +403,27 @@ class MainWindow(QMainWindow):
         
         right_layout.addWidget(self.status_label)
         right_layout.addWidget(self.progress_bar)
+        
+        # Filters, applied before any chain is scored
+        right_layout.addWidget(QLabel("Only search:"))
+        self.combo_team = QComboBox()
+        self.combo_team.addItem("Any team", None)
+        self.combo_match = QComboBox()
+        self.combo_match.addItem("Any match", None)
+        right_layout.addWidget(self.combo_team)
+        right_layout.addWidget(self.combo_match)
+        minutes = QHBoxLayout()
+        self.spin_min_from = QSpinBox()
+        self.spin_min_from.setRange(0, self.MAX_MINUTE)
+        self.spin_min_to = QSpinBox()
+        self.spin_min_to.setRange(0, self.MAX_MINUTE)
+        self.spin_min_to.setValue(self.MAX_MINUTE)
+        minutes.addWidget(QLabel("Minutes"))
+        minutes.addWidget(self.spin_min_from)
+        minutes.addWidget(QLabel("to"))
+        minutes.addWidget(self.spin_min_to)
+        right_layout.addLayout(minutes)
+        
         right_layout.addWidget(QLabel("Top Matches:"))
         
         self.results_list = QListWidget()
@@ -195,7 +448,12 @@ class MainWindow(QMainWindow):
         self.spin_clusters.setRange(5, 200) # Threshold range. 
         self.spin_clusters.setValue(40) # Default Threshold
         self.spin_clusters.setSuffix(" units")
+        self.spin_clusters.valueChanged.connect(self.preview_cluster_count)
         top_bar.addWidget(self.spin_clusters)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_DELAY_MS)
+        self.preview_timer.timeout.connect(self.start_preview)
         
         self.btn_recluster = QPushButton("Find Patterns")
         self.btn_recluster.clicked.connect(self.recluster_data)
@@ -231,7 +489,7 @@ class MainWindow(QMainWindow):
         layout.addLayout(content)
 
     def start_loading(self):
-        self.loader = DataLoaderThread()
+        self.loader = DataLoaderThread(self.server_url, self.search_workers)
         self.loader.progress.connect(self.update_status)
         self.loader.finished.connect(self.on_data_loaded)
         self.loader.start()
@@ -239,31 +497,95 @@ class MainWindow(QMainWindow):
     def update_status(self, msg):
         self.status_label.setText(msg)
 
-    def on_data_loaded(self, matcher, clusterer):
+    def on_data_loaded(self, matcher, clusterer, length_clusterer):
         self.progress_bar.hide()
         if matcher and clusterer:
             self.matcher = matcher
             self.clusterer = clusterer
-            self.status_label.setText(f"Ready. Loaded {len(self.matcher.chains)} chains.")
+            self.length_clusterer = length_clusterer
             self.btn_search.setEnabled(True)
+            options = self.matcher.filter_options()
+            for team in options['team_id']:
+                self.combo_team.addItem(f"Team {team}", team)
+            for match in options['match_name']:
+                self.combo_match.addItem(match, match)
+            lengths = self.length_clusterer.lengths()
+            if lengths:
+                self.spin_length.setRange(max(1, lengths[0]), lengths[-1])
             
-            # Initial clustering with spinbox value
-            self.recluster_data()
+            elapsed = time.perf_counter() - APP_START
+            metrics.record('app.time_to_first_search', elapsed)
+            print(f"Search ready {elapsed:.2f}s after start.")
+            source = f"chains from {self.server_url}" if self.server_url else "chains"
+            self.status_label.setText(f"Ready. Loaded {len(self.matcher.chains)} {source} "
+                                      f"(search ready in {elapsed:.1f}s).")
+            
+            # Discovery clusters on first view; it may already be open
+            if self.tabs.currentWidget() is self.tab_discovery:
+                self.ensure_clustered()
         else:
             self.status_label.setText("Error loading data.")
             
     def recluster_data(self):
         if not self.clusterer: return
         thresh = self.spin_clusters.value()
+        # The preview shares the clusterer's neighbour lists, let it finish first
+        self.preview_timer.stop()
+        if self.preview_worker is not None:
+            self.preview_worker.wait()
         self.status_label.setText(f"Grouping with Threshold {thresh}...")
         QApplication.processEvents()
         
         self.clusterer.cluster(threshold=thresh)
+        self.clustered_threshold = thresh
         self.populate_clusters()
         count = len(self.clusterer.cluster_data)
         self.status_label.setText(f"Found {count} distinct groups.")
         self.cluster_label.setText(f"Found: {count} groups")
 
+    def ensure_clustered(self):
+        # Cluster once, the first time the results are needed
+        if self.clusterer and self.clustered_threshold is None:
+            self.recluster_data()
+
+    def preview_cluster_count(self, thresh):
+        # A count can take seconds on a big corpus (or a round trip to the
+        # server), so wait for the spinbox to settle and count off the GUI thread
+        if not self.clusterer: return
+        self.preview_timer.start()
+
+    def start_preview(self):
+        if self.preview_worker is not None and self.preview_worker.isRunning():
+            return # on_preview_done picks up the new value
+        thresh = self.spin_clusters.value()
+        self.cluster_label.setText(f"At {thresh}: counting...")
+        self.preview_worker = ClusterCountWorker(self.clusterer, thresh)
+        self.preview_worker.done.connect(self.on_preview_done)
+        self.preview_worker.start()
+
+    def on_preview_done(self, thresh, count):
+        if thresh != self.spin_clusters.value():
+            # The spinbox moved on while counting
+            if not self.preview_timer.isActive():
+                self.start_preview()
+            return
+        if count < 0:
+            self.cluster_label.setText(f"At {thresh}: count failed")
+        else:
+            self.cluster_label.setText(f"At {thresh}: {count} groups")
+
+    def closeEvent(self, event):
+        # Don't tear down threads that are still running
+        self.preview_timer.stop()
+        if self.preview_worker is not None:
+            self.preview_worker.wait()
+        if self.search_worker is not None and self.search_worker.isRunning():
+            self.search_worker.cancel()
+            self.search_worker.wait()
+        if hasattr(self.matcher, 'close'):
+            self.matcher.close() # Parallel search workers
+        super().closeEvent(event)
+
     def populate_clusters(self):
         self.cluster_combo.clear()
         clusters = self.clusterer.cluster_data # Access the clustered data directly
@@ -280,21 +602,24 @@ class MainWindow(QMainWindow):
         cid = self.cluster_combo.currentData()
         if cid is None: return
         
-        # Get examples
+        # Get examples (as a store of their own, so a remote backend fetches them in one go)
         indices = self.clusterer.cluster_data[cid]
+        members = self.clusterer.chains.take(indices)
         
         # Show representative on canvas (Average)
         centroid = self.clusterer.get_cluster_representative(cid)
         if centroid:
             self.discovery_canvas.clicks = centroid # As 'query' (red)
             self.discovery_canvas.result_chain = None
+            # Whole group in the background
+            self.discovery_canvas.set_context([members.coords_of(k) for k in range(len(members))])
             self.discovery_canvas.draw()
             
         # Populate list
         self.cluster_list.clear()
         # Show top 50 examples to avoid lag
-        for i in indices[:50]:
-            chain = self.matcher.chains[i]
+        for k in range(min(50, len(members))):
+            chain = members[k]
             match_name = chain.get('match_name', 'Unknown')
             t_id = chain.get('team_id')
             time_str = chain.get('timestamp', '00:00')
@@ -311,12 +636,69 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Warning", "Please draw at least 2 points.")
             return
         
-        self.status_label.setText("Searching...")
-        QApplication.processEvents()
+        # A new query replaces whatever is still running
+        self.cancel_search()
+        self.search_generation += 1
         
-        matches = self.matcher.search(query, top_k=15)
-        self.status_label.setText(f"Found {len(matches)} matches.")
+        self.status_label.setText("Searching...")
+        self.btn_cancel.setEnabled(True)
+        
+        capture = None
+        if self.btn_capture.isChecked():
+            # Profile this one search only
+            capture = self.capture_combo.currentData()
+            self.btn_capture.setChecked(False)
+        
+        self.search_worker = SearchWorker(self.matcher, list(query), 15, self.search_generation, capture,
+                                          self.search_filters())
+        self.search_worker.partial.connect(self.on_search_partial)
+        self.search_worker.done.connect(self.on_search_done)
+        self.search_worker.start()
+
+    def search_filters(self):
+        filters = {}
+        if self.combo_team.currentData() is not None:
+            filters['team_id'] = self.combo_team.currentData()
+        if self.combo_match.currentData() is not None:
+            filters['match_name'] = self.combo_match.currentData()
+        start, end = self.spin_min_from.value(), self.spin_min_to.value()
+        if start > 0 or end < self.MAX_MINUTE:
+            # The top of the range stays open-ended (extra time)
+            filters['time_range'] = (start * 60, end * 60 if end < self.MAX_MINUTE else None)
+        return filters or None
+
+    def cancel_search(self):
+        worker = self.search_worker
+        if worker is not None and worker.isRunning():
+            worker.cancel()
+            worker.wait() # Stops after the chunk it is scoring
+        self.btn_cancel.setEnabled(False)
+
+    def on_search_partial(self, matches, generation):
+        if generation != self.search_generation: return
+        self.status_label.setText(f"Searching... best {len(matches)} so far")
+        self.populate_results(matches)
+
+    def on_search_done(self, matches, stats, generation, cancelled):
+        if generation != self.search_generation: return
+        self.btn_cancel.setEnabled(False)
+        if self.search_worker.capture_result is not None:
+            self.show_capture(self.search_worker.capture_result)
+        if 'error' in stats:
+            self.status_label.setText(f"Search failed: {stats['error']}")
+            return
+        if cancelled:
+            self.status_label.setText("Search cancelled.")
+            return
         
+        if 'full_dtw' in stats:
+            self.status_label.setText(f"Found {len(matches)} matches "
+                                      f"({stats['full_dtw']} of {stats['candidates']} chains fully scored).")
+        else:
+            self.status_label.setText(f"Found {len(matches)} matches.")
+        self.populate_results(matches)
+
+    def populate_results(self, matches):
         self.results_list.clear()
         for idx, m in enumerate(matches):
             chain = m['chain_data']
@@ -354,6 +736,8 @@ class MainWindow(QMainWindow):
         self.spin_length = QSpinBox()
         self.spin_length.setRange(3, 77) # Based on data
         self.spin_length.setValue(3)
+        # Results are memoized per length, so browsing lengths is immediate
+        self.spin_length.valueChanged.connect(self.analyze_by_length)
         controls.addWidget(self.spin_length)
         
         self.btn_len_analyze = QPushButton("Analyze Length")
@@ -381,39 +765,25 @@ class MainWindow(QMainWindow):
         layout.addWidget(splitter)
 
     def analyze_by_length(self):
-        if not self.matcher: return
+        if not self.length_clusterer: return
         
         target_len = self.spin_length.value()
-        self.lbl_len_status.setText(f"Finding chains with length {target_len}...")
-        QApplication.processEvents()
-        
-        # Filter chains
-        # Note: 'coords' is a list of tuples.
-        filtered_chains = [c for c in self.matcher.chains if len(c.get('coords', [])) == target_len]
         
-        if not filtered_chains:
+        # Length index lookup, no scan of the corpus
+        if self.length_clusterer.count(target_len) == 0:
             self.lbl_len_status.setText(f"No chains found with length {target_len}.")
             self.list_length.clear()
             return
-            
-        self.lbl_len_status.setText(f"Found {len(filtered_chains)} chains. Clustering...")
-        QApplication.processEvents()
         
-        # Cluster this subset
-        sub_clusterer = PatternClusterer(filtered_chains)
-        sub_clusterer.extract_features(n_points=target_len) # Use actual length for resampling? Or fixed?
-        # Using fixed n_points=10 allows standard comparison, but maybe user wants raw shape?
-        # Let's stick to n_points=10 for standardized clustering comparison, 
-        # but since they ARE the same length, we could use that length.
-        # However, extract_features expects fixed size. Let's use 10 for consistency.
-        sub_clusterer.extract_features(n_points=10) 
-        sub_clusterer.cluster(threshold=40)
+        # Cluster this subset (memoized per length / n_points / threshold).
+        # Fixed n_points=10 keeps clustering comparable across lengths
+        filtered_chains = self.length_clusterer.subset(target_len)
+        clusters = self.length_clusterer.cluster(target_len, n_points=10, threshold=40)
         
         # Display results (Grouped)
         self.list_length.clear()
         
         # Sort clusters by size
-        clusters = sub_clusterer.cluster_data
         sorted_keys = sorted(clusters.keys(), key=lambda k: len(clusters[k]), reverse=True)
         
         for cid in sorted_keys:
@@ -445,10 +815,94 @@ class MainWindow(QMainWindow):
             self.length_canvas.clicks = [] # Clear query
             self.length_canvas.draw()
 
+    def setup_diagnostics_tab(self):
+        layout = QVBoxLayout(self.tab_diagnostics)
+        
+        top_bar = QHBoxLayout()
+        self.btn_diag_refresh = QPushButton("Refresh")
+        self.btn_diag_refresh.clicked.connect(self.refresh_diagnostics)
+        self.btn_diag_reset = QPushButton("Reset")
+        self.btn_diag_reset.clicked.connect(self.reset_diagnostics)
+        self.btn_diag_save = QPushButton("Save JSON...")
+        self.btn_diag_save.clicked.connect(self.save_diagnostics)
+        top_bar.addWidget(self.btn_diag_refresh)
+        top_bar.addWidget(self.btn_diag_reset)
+        top_bar.addWidget(self.btn_diag_save)
+        top_bar.addStretch()
+        
+        # One-shot profiling of the next search
+        self.capture_combo = QComboBox()
+        self.capture_combo.addItem("cProfile (time)", 'cprofile')
+        self.capture_combo.addItem("tracemalloc (memory)", 'tracemalloc')
+        self.btn_capture = QPushButton("Profile Next Search")
+        self.btn_capture.setCheckable(True)
+        self.btn_capture_save = QPushButton("Save Profile...")
+        self.btn_capture_save.clicked.connect(self.save_capture)
+        self.btn_capture_save.setEnabled(False)
+        top_bar.addWidget(self.capture_combo)
+        top_bar.addWidget(self.btn_capture)
+        top_bar.addWidget(self.btn_capture_save)
+        layout.addLayout(top_bar)
+        
+        mono = QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont)
+        self.diag_text = QPlainTextEdit()
+        self.diag_text.setReadOnly(True)
+        self.diag_text.setFont(mono)
+        layout.addWidget(QLabel("Stage timings, counters and memory:"))
+        layout.addWidget(self.diag_text, stretch=2)
+        
+        self.capture_label = QLabel("Last profile: none")
+        self.capture_text = QPlainTextEdit()
+        self.capture_text.setReadOnly(True)
+        self.capture_text.setFont(mono)
+        layout.addWidget(self.capture_label)
+        layout.addWidget(self.capture_text, stretch=1)
+        self.last_capture = None
+
+    def on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.tab_discovery:
+            self.ensure_clustered()
+        elif self.tabs.widget(index) is self.tab_diagnostics:
+            self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        self.diag_text.setPlainText(metrics.format())
+
+    def reset_diagnostics(self):
+        metrics.reset()
+        self.refresh_diagnostics()
+
+    def save_diagnostics(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Diagnostics", "diagnostics.json", "JSON (*.json)")
+        if path:
+            metrics.dump_json(path)
+
+    def show_capture(self, cap):
+        self.last_capture = cap
+        self.capture_label.setText(f"Last profile: {cap.kind}, search took {cap.seconds * 1000:.1f} ms")
+        self.capture_text.setPlainText(cap.report())
+        self.btn_capture_save.setEnabled(True)
+
+    def save_capture(self):
+        if self.last_capture is None: return
+        default = "search.prof" if self.last_capture.kind == 'cprofile' else "search_memory.txt"
+        path, _ = QFileDialog.getSaveFileName(self, "Save Profile", default)
+        if path:
+            self.last_capture.dump(path)
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    import argparse
+    ap = argparse.ArgumentParser(description="Football Tactical Pattern Matcher")
+    ap.add_argument("--server", default=os.environ.get("FPM_SERVER"),
+                    help="URL of a running query server (server.py) to use instead of loading "
+                         "the corpus here; default: $FPM_SERVER")
+    ap.add_argument("--search-workers", type=int, default=1,
+                    help="spread every search over this many processes (local corpus only)")
+    args, qt_args = ap.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle("Fusion")
     
-    window = MainWindow()
+    window = MainWindow(server_url=args.server, search_workers=args.search_workers)
     window.show()
+    QTimer.singleShot(0, lambda: metrics.record('app.window_shown', time.perf_counter() - APP_START))
     sys.exit(app.exec())
@@ -0,0 +1,222 @@
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import resource # Not on Windows
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident memory of this process so far, in MB (None if unknown).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Capture:
+    """
+    Result of Metrics.capture(): a cProfile or tracemalloc trace of one operation.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.seconds = 0.0
+        self.profile = None
+        self.snapshot = None
+        self.peak_mb = None
+
+    def report(self, limit: int = 25) -> str:
+        if self.kind == 'cprofile':
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(limit)
+            return out.getvalue()
+        lines = [f"Peak traced memory: {self.peak_mb:.2f} MB"]
+        for stat in self.snapshot.statistics('lineno')[:limit]:
+            lines.append(str(stat))
+        return "\n".join(lines)
+
+    def dump(self, path: str):
+        """
+        cProfile: pstats file (for snakeviz & co.); tracemalloc: the text report.
+        """
+        if self.kind == 'cprofile':
+            self.profile.dump_stats(path)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.report(limit=100))
+
+
+class Metrics:
+    """
+    Process-wide stage timings, counters and peak memory samples.
+
+    Cheap enough to leave on: a stage is two perf_counter calls, a getrusage
+    call and a dict update under a lock. Stage names are dotted by component
+    ('parser.parse_files', 'matcher.search', ...), counters likewise.
+    """
+
+    MAX_SAMPLES = 500
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.samples = deque(maxlen=self.MAX_SAMPLES)
+            self.started = time.time()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times the enclosed block as one call of stage name.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        """
+        Adds one call of stage name that took seconds (for code that can't use
+        a with block, e.g. a generator consumed elsewhere).
+        """
+        if not self.enabled:
+            return
+        rss = peak_rss_mb()
+        with self._lock:
+            st = self.stages.get(name)
+            if st is None:
+                st = self.stages[name] = {'calls': 0, 'total_s': 0.0, 'max_s': 0.0, 'last_s': 0.0,
+                                          'peak_rss_mb': None}
+            st['calls'] += 1
+            st['total_s'] += seconds
+            st['last_s'] = seconds
+            st['max_s'] = max(st['max_s'], seconds)
+            if rss is not None:
+                st['peak_rss_mb'] = rss
+                self.samples.append((round(time.time() - self.started, 3), name, round(rss, 1)))
+
+    def count(self, name: str, n: int = 1):
+        if not self.enabled or not n:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def merge_counters(self, counters: Dict[str, int]):
+        """
+        Adds counters collected elsewhere (e.g. in a parser worker process).
+        """
+        for name, n in counters.items():
+            self.count(name, n)
+
+    def take_counters(self) -> Dict[str, int]:
+        """
+        Returns and clears the counters.
+        """
+        with self._lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stages = {}
+            for name, st in self.stages.items():
+                stages[name] = dict(st, mean_s=st['total_s'] / st['calls'])
+            return {
+                'uptime_s': time.time() - self.started,
+                'stages': stages,
+                'counters': dict(self.counters),
+                'memory': {
+                    'peak_rss_mb': peak_rss_mb(),
+                    'samples': list(self.samples),
+                },
+            }
+
+    def dump_json(self, path: str) -> str:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        return path
+
+    def format(self) -> str:
+        """
+        Plain-text table of the current snapshot.
+        """
+        snap = self.snapshot()
+        lines = [f"{'stage':<30} {'calls':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'peak MB':>8}"]
+        for name in sorted(snap['stages']):
+            st = snap['stages'][name]
+            peak = f"{st['peak_rss_mb']:.0f}" if st['peak_rss_mb'] is not None else '-'
+            lines.append(f"{name:<30} {st['calls']:>6} {st['total_s'] * 1000:>10.1f} "
+                         f"{st['mean_s'] * 1000:>9.2f} {st['max_s'] * 1000:>9.2f} {peak:>8}")
+        lines.append("")
+        lines.append(f"{'counter':<30} {'value':>12}")
+        for name in sorted(snap['counters']):
+            lines.append(f"{name:<30} {snap['counters'][name]:>12}")
+        peak = snap['memory']['peak_rss_mb']
+        if peak is not None:
+            lines.append("")
+            lines.append(f"Peak resident memory: {peak:.1f} MB")
+        return "\n".join(lines)
+
+    @contextmanager
+    def capture(self, kind: str = 'cprofile'):
+        """
+        Profiles the enclosed operation:
+            with metrics.capture('tracemalloc') as cap:
+                clusterer.cluster(40)
+            print(cap.report())
+        kind: 'cprofile' (call times, current thread only) or 'tracemalloc'
+        (allocations by line and the peak).
+        """
+        if kind not in ('cprofile', 'tracemalloc'):
+            raise ValueError(f"Unknown capture kind '{kind}'")
+        cap = Capture(kind)
+        start = time.perf_counter()
+        if kind == 'cprofile':
+            cap.profile = cProfile.Profile()
+            cap.profile.enable()
+            try:
+                yield cap
+            finally:
+                cap.profile.disable()
+                cap.seconds = time.perf_counter() - start
+            return
+
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            yield cap
+        finally:
+            cap.snapshot = tracemalloc.take_snapshot()
+            cap.peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            if not was_tracing:
+                tracemalloc.stop()
+            cap.seconds = time.perf_counter() - start
+
+
+# The instance everything reports to
+metrics = Metrics()
@@ -1,15 +1,103 @@
+import heapq
+import time
 import numpy as np
-from fastdtw import fastdtw
-from scipy.spatial.distance import euclidean
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator
+
+from dtw import dtw_batch, envelope, lb_kim, lb_keogh, lb_kim_many, lb_keogh_many
+from chain_store import ChainStore
+from query_cache import QueryCache
+from clustering import resample_chains
+from instrumentation import metrics
 
 class PatternMatcher:
-    def __init__(self, chains: List[Dict]):
+    BACKENDS = ('vectorized', 'fastdtw')
+    # Chains scored per batched DTW call once the top-k heap is seeded
+    CHUNK_SIZE = 512
+    # Candidates scored up front (as a multiple of top_k) to seed the heap
+    SEED_FACTOR = 4
+    # Bounds are compared with a little slack so float rounding never prunes a tie
+    PRUNE_EPS = 1e-9
+    # Queries search_many() runs through the corpus together
+    MANY_BLOCK = 64
+
+    def __init__(self, chains, backend: str = 'vectorized', window: Optional[int] = None,
+                 cache_size: int = 256, cache_grid: float = 1.0):
         """
         Initialize with the database of possession chains.
-        chains: List of dicts, where each dict has at least 'coords' key: [(x,y), ...]
+        chains: a ChainStore, or a list of dicts with at least a 'coords' key: [(x,y), ...]
+        backend: 'vectorized' (exact batched DTW) or 'fastdtw' (original per-chain loop).
+        window: optional Sakoe-Chiba band for the vectorized backend.
+        cache_size / cache_grid: result cache size (0 disables it) and the grid,
+        in pitch units, queries are snapped to when looking it up.
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {self.BACKENDS}")
+        self.backend = backend
+        self.window = window
+        self.cache = QueryCache(cache_size, cache_grid)
+        self.last_search_stats = {}
+        self.last_batch_stats = []
+        self.set_chains(chains)
+
+    def set_chains(self, chains):
         """
+        Swap in a new corpus. Indexes are rebuilt; cached results for the old
+        corpus are dropped automatically because the store id changes.
+        """
+        if not isinstance(chains, ChainStore):
+            chains = ChainStore.from_chains(chains)
         self.chains = chains
+        with metrics.stage('matcher.build_index'):
+            self._set_length_groups(self._build_length_groups())
+        self.ann_tree = None
+        self.ann_points = None
+
+    @classmethod
+    def from_length_groups(cls, length_groups: Dict[int, Tuple[np.ndarray, np.ndarray]],
+                           window: Optional[int] = None) -> 'PatternMatcher':
+        """
+        Matcher over prebuilt length groups and no chain metadata.
+        Used by the parallel search workers, which only call _top_k.
+        """
+        matcher = cls.__new__(cls)
+        matcher.chains = None
+        matcher.backend = 'vectorized'
+        matcher.window = window
+        matcher.cache = QueryCache(0)
+        matcher._set_length_groups(length_groups)
+        # Sorted ids and their lengths, to resolve candidates without offsets
+        ids = np.concatenate([indices for indices, _ in length_groups.values()] or [np.zeros(0, dtype=np.int64)])
+        lengths = np.concatenate([np.full(len(indices), length, dtype=np.int64)
+                                  for length, (indices, _) in length_groups.items()] or [np.zeros(0, dtype=np.int64)])
+        order = np.argsort(ids, kind='stable')
+        matcher._group_ids = (ids[order], lengths[order])
+        matcher.last_search_stats = {}
+        matcher.last_batch_stats = []
+        matcher.ann_tree = None
+        matcher.ann_points = None
+        return matcher
+
+    def _set_length_groups(self, length_groups: Dict[int, Tuple[np.ndarray, np.ndarray]]):
+        self.length_groups = length_groups
+        self.group_envelopes = {
+            length: envelope(arr, self.window, None if self.window is None else length + self.window)
+            for length, (indices, arr) in length_groups.items()
+        }
+
+    def _build_length_groups(self) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Group the normalized chains by length so the vectorized backend can score
+        a whole group with one batched DTW call.
+        Returns: length -> (chain indices, (B, length, 2) array)
+        """
+        index = self.chains.length_index
+        groups = {}
+        for length in index.lengths():
+            if length < 1:
+                continue
+            indices = index.ids(length)
+            groups[length] = (indices, self.chains.gather(indices, length))
+        return groups
 
     def normalize_sequence(self, seq: List[Tuple[float, float]]) -> np.ndarray:
         """
@@ -21,23 +109,546 @@ class PatternMatcher:
             return np.zeros((0, 2))
         return arr - arr[0]
 
-    def search(self, query: List[Tuple[float, float]], top_k: int = 5) -> List[Dict]:
+    def build_ann_index(self, n_points: int = 10):
+        """
+        Build the candidate index for approximate search: every chain is
+        start-translated and resampled to n_points points (the same resampling
+        PatternClusterer uses), and the flattened vectors go into a KD-tree.
+        Chains too short to resample embed as all zeros, i.e. "stays at the start".
+        """
+        from scipy.spatial import cKDTree
+        with metrics.stage('matcher.build_ann'):
+            features, valid = resample_chains(self.chains.normalized, self.chains.offsets, n_points)
+            embeddings = np.zeros((len(self.chains), 2 * n_points))
+            embeddings[valid] = features
+            self.ann_points = n_points
+            self.ann_tree = cKDTree(embeddings)
+
+    def embed_query(self, query_arr: np.ndarray) -> np.ndarray:
+        """
+        Embedding of a normalized query, matching build_ann_index.
+        """
+        features, valid = resample_chains(query_arr, [0, len(query_arr)], self.ann_points)
+        if len(valid) == 0:
+            return np.zeros(2 * self.ann_points)
+        return features[0].astype(np.float64)
+
+    def search(self, query: List[Tuple[float, float]], top_k: int = 5,
+               pool_size: Optional[int] = None, filters: Optional[Dict] = None) -> List[Dict]:
         """
         Search for the top_k most similar chains to the query.
+        pool_size: if given, search approximately: take the pool_size nearest
+        chains from the embedding index and re-rank only those with exact DTW.
+        Use evaluate_ann() to pick a pool size.
+        filters: only search chains matching all of these, e.g.
+            {'team_id': 12, 'match_name': [...], 'time_range': (0, '15:00'), 'length': {'min': 4}}
+        (see ChainStore.select). They are resolved through the store's
+        inverted indexes before any bound or DTW is computed, so a filtered
+        search costs time in proportion to the chains that pass.
+        Results are cached per (query snapped to the cache grid, top_k, backend,
+        pool size, filters); see self.cache.stats() for hit/miss counts.
+        """
+        results = []
+        for results in self.iter_search(query, top_k, pool_size, filters):
+            pass
+        return results
+
+    def select(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """
+        Ids of the chains passing filters, or None when nothing is filtered.
+        """
+        if not filters:
+            return None
+        with metrics.stage('matcher.select'):
+            return self.chains.select(**{k: v for k, v in filters.items() if v is not None})
+
+    def filter_options(self) -> Dict[str, List]:
+        """
+        Values the team_id / match_name filters can take, for pickers.
+        """
+        return {
+            'team_id': sorted({t for t in self.chains.teams if t is not None}, key=str),
+            'match_name': sorted({m for m in self.chains.matches if m is not None}),
+        }
+
+    @staticmethod
+    def _filter_key(filters: Optional[Dict]) -> Optional[Tuple]:
+        if not filters:
+            return None
+        return tuple(sorted((k, repr(v)) for k, v in filters.items() if v is not None)) or None
+
+    def iter_search(self, query: List[Tuple[float, float]], top_k: int = 5,
+                    pool_size: Optional[int] = None, filters: Optional[Dict] = None) -> Iterator[List[Dict]]:
+        """
+        Same as search(), but yields the current top-k after every scored chunk
+        of the corpus; the last list yielded is the final answer. Candidates
+        are scored best-bound first, so the early lists are usually close.
+        Stop iterating to cancel (a cancelled search is not cached).
         """
         if not query:
-            return []
+            yield []
+            return
 
+        start = time.perf_counter()
         query_arr = self.normalize_sequence(query)
-        
+        if pool_size is not None and self.ann_tree is None:
+            self.build_ann_index()
+
+        # Nearly identical redraws are answered from the result cache
+        key = self.cache.make_key(query_arr, top_k, self.backend, self.window,
+                                  pool_size, self.ann_points if pool_size is not None else None,
+                                  self._filter_key(filters))
+        cached = self.cache.get(key, self.chains.uid)
+        if cached is not None:
+            results, self.last_search_stats = cached
+            self.last_search_stats['cache_hit'] = True
+            metrics.count('matcher.cache_hits')
+            metrics.record('matcher.search_cached', time.perf_counter() - start)
+            yield results
+            return
+        metrics.count('matcher.cache_misses')
+        candidates = self.select(filters)
+
+        results = []
+        try:
+            for results in self._iter_uncached(query_arr, top_k, pool_size, candidates):
+                yield results
+        except GeneratorExit:
+            metrics.count('matcher.searches_cancelled')
+            raise
+        if candidates is not None:
+            self.last_search_stats['filtered'] = len(candidates)
+        self.cache.put(key, self.chains.uid, results, self.last_search_stats)
+        metrics.record('matcher.search', time.perf_counter() - start)
+        self._count_search_stats(self.last_search_stats)
+
+    def search_many(self, queries: List[List[Tuple[float, float]]], top_k: int = 5,
+                    pool_size: Optional[int] = None, filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        search() for a whole list of queries; returns one top-k list per query.
+        Exact search makes a single pass over the corpus for up to MANY_BLOCK
+        queries at a time: each length group's lower bounds are computed for
+        all the queries at once, and the (query, chain) pairs that survive
+        pruning are scored together in batched DTW calls.
+        Answers are the same as search()'s, and the result cache is shared
+        with it. With pool_size, or the fastdtw backend, the candidates
+        differ per query and this is just a loop over search().
+        filters apply to every query, as in search().
+        Per-query stats are left in self.last_batch_stats, totals in
+        self.last_search_stats.
+        """
+        if pool_size is not None or self.backend != 'vectorized':
+            results, batch_stats = [], []
+            for query in queries:
+                results.append(self.search(query, top_k, pool_size, filters))
+                batch_stats.append(dict(self.last_search_stats))
+            self.last_batch_stats = batch_stats
+            self.last_search_stats = self._sum_stats(batch_stats)
+            return results
+
+        start = time.perf_counter()
+        results = [[] for _ in queries]
+        batch_stats = [{} for _ in queries]
+        pending = []
+        filter_key = self._filter_key(filters)
+        for qi, query in enumerate(queries):
+            if not query:
+                continue
+            query_arr = self.normalize_sequence(query)
+            key = self.cache.make_key(query_arr, top_k, self.backend, self.window, None, None, filter_key)
+            cached = self.cache.get(key, self.chains.uid)
+            if cached is not None:
+                results[qi], stats = cached
+                batch_stats[qi] = dict(stats, cache_hit=True)
+                metrics.count('matcher.cache_hits')
+            else:
+                metrics.count('matcher.cache_misses')
+                pending.append((qi, query_arr, key))
+
+        candidates = self.select(filters) if pending else None
+        for block in range(0, len(pending), self.MANY_BLOCK):
+            part = pending[block:block + self.MANY_BLOCK]
+            hits, stats = self._top_k_many([query_arr for _, query_arr, _ in part], top_k, candidates)
+            for (qi, _, key), query_hits, query_stats in zip(part, hits, stats):
+                if candidates is not None:
+                    query_stats['filtered'] = len(candidates)
+                results[qi] = [{
+                    'chain_idx': idx,
+                    'distance': dist,
+                    'chain_data': self.chains[idx]
+                } for dist, idx in query_hits]
+                batch_stats[qi] = query_stats
+                self.cache.put(key, self.chains.uid, results[qi], query_stats)
+                self._count_search_stats(query_stats)
+
+        self.last_batch_stats = batch_stats
+        self.last_search_stats = self._sum_stats(batch_stats)
+        metrics.record('matcher.search_many', time.perf_counter() - start)
+        metrics.count('matcher.batched_queries', len(queries))
+        return results
+
+    @staticmethod
+    def _sum_stats(batch_stats: List[Dict]) -> Dict:
+        totals = {'queries': len(batch_stats)}
+        for stats in batch_stats:
+            for name, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[name] = totals.get(name, 0) + value
+        totals['cache_hits'] = sum(1 for stats in batch_stats if stats.get('cache_hit'))
+        return totals
+
+    @staticmethod
+    def _count_search_stats(stats: Dict):
+        metrics.count('matcher.searches')
+        metrics.count('matcher.candidates', stats.get('candidates', 0))
+        metrics.count('matcher.dtw_calls', stats.get('full_dtw', 0))
+        metrics.count('matcher.abandoned', stats.get('abandoned', 0))
+        for bound in ('length', 'kim', 'keogh'):
+            metrics.count(f'matcher.pruned_{bound}', stats.get(f'pruned_{bound}', 0))
+
+    def _search_uncached(self, query_arr: np.ndarray, top_k: int, pool_size: Optional[int],
+                         candidates: Optional[np.ndarray] = None) -> List[Dict]:
         results = []
+        for results in self._iter_uncached(query_arr, top_k, pool_size, candidates):
+            pass
+        return results
+
+    def _iter_uncached(self, query_arr: np.ndarray, top_k: int, pool_size: Optional[int],
+                       candidates: Optional[np.ndarray] = None) -> Iterator[List[Dict]]:
+        """
+        candidates: ascending ids to restrict the search to (the filtered chains).
+        """
+        if self.backend == 'fastdtw':
+            n = len(self.chains) if candidates is None else len(candidates)
+            self.last_search_stats = {'candidates': n, 'full_dtw': n}
+            yield self._search_fastdtw(query_arr, top_k, candidates)
+            return
+
+        if pool_size is not None:
+            pool_size = max(pool_size, top_k)
+            if candidates is None:
+                pool_size = min(pool_size, len(self.chains))
+                _, candidates = self.ann_tree.query(self.embed_query(query_arr), k=pool_size)
+                candidates = np.atleast_1d(candidates)
+            elif len(candidates) > pool_size:
+                candidates = self._filtered_pool(query_arr, pool_size, candidates)
+
+        for hits in self._iter_top_k(query_arr, top_k, candidates):
+            if pool_size is not None:
+                self.last_search_stats['pool_size'] = pool_size
+            yield [{
+                'chain_idx': idx,
+                'distance': dist,
+                'chain_data': self.chains[idx]
+            } for dist, idx in hits]
+
+    def _filtered_pool(self, query_arr: np.ndarray, pool_size: int, candidates: np.ndarray) -> np.ndarray:
+        """
+        The pool_size chains nearest to the query in the embedding index among
+        candidates. The tree can't filter, so it is asked for as many more
+        neighbours as the filter is selective (a subset no bigger than the pool
+        is searched exactly without it).
+        """
+        n = len(self.chains)
+        k = min(n, pool_size * -(-n // len(candidates)))
+        _, nearest = self.ann_tree.query(self.embed_query(query_arr), k=k)
+        nearest = np.atleast_1d(nearest)
+        pos = np.minimum(np.searchsorted(candidates, nearest), len(candidates) - 1)
+        pool = nearest[candidates[pos] == nearest][:pool_size]
+        if len(pool) < pool_size and k < n:
+            # Unlucky neighbourhood: fall back to the whole subset
+            return candidates
+        return pool
+
+    def _candidate_groups(self, candidates: Optional[np.ndarray] = None):
+        """
+        Yields (length, chain indices, chain array, envelope lower, envelope upper)
+        per length group, optionally restricted to the given chain indices.
+        """
+        if candidates is None:
+            for length, (indices, arr) in self.length_groups.items():
+                lower, upper = self.group_envelopes[length]
+                yield length, indices, arr, lower, upper
+            return
+
+        candidates = np.unique(np.asarray(candidates, dtype=np.int64))
+        # Lengths of the candidates only, not of the whole corpus
+        if self.chains is not None:
+            offsets = self.chains.offsets
+            cand_lengths = offsets[candidates + 1] - offsets[candidates]
+        else:
+            # Prebuilt groups (a parallel worker's shard): candidates outside them are dropped
+            ids, lengths = self._group_ids
+            if len(ids) == 0:
+                return
+            pos = np.minimum(np.searchsorted(ids, candidates), len(ids) - 1)
+            inside = ids[pos] == candidates
+            candidates, cand_lengths = candidates[inside], lengths[pos[inside]]
+        for length in np.unique(cand_lengths):
+            if int(length) not in self.length_groups:
+                continue
+            indices, arr = self.length_groups[int(length)]
+            lower, upper = self.group_envelopes[int(length)]
+            # Group indices are sorted, so members are found by binary search
+            pos = np.searchsorted(indices, candidates[cand_lengths == length])
+            yield int(length), indices[pos], arr[pos], lower[pos], upper[pos]
+
+    def _top_k(self, query_arr: np.ndarray, top_k: int,
+               candidates: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        """
+        Final result of _iter_top_k.
+        """
+        hits = []
+        for hits in self._iter_top_k(query_arr, top_k, candidates):
+            pass
+        return hits
+
+    def _iter_top_k(self, query_arr: np.ndarray, top_k: int,
+                    candidates: Optional[np.ndarray] = None) -> Iterator[List[Tuple[float, int]]]:
+        """
+        Exact top-k DTW search with a pruning cascade.
+        1. Length bound: with a band, chains whose length differs from the
+           query by more than the window can never be aligned.
+        2. LB_Kim (end points) and LB_Keogh (envelopes) for every chain.
+        3. Chains are scored in order of their lower bound against a bounded
+           heap; anything whose bound exceeds the current k-th best is skipped
+           and DTW itself abandons once its partial cost exceeds it.
+        candidates: optional chain indices to restrict the search to.
+        Yields the sorted (distance, chain_idx) top-k whenever a chunk changed
+        it, and always once more at the end; pruning counts are kept in
+        self.last_search_stats.
+        """
+        stats = {'candidates': 0, 'pruned_length': 0, 'pruned_kim': 0,
+                 'pruned_keogh': 0, 'abandoned': 0, 'full_dtw': 0}
+        self.last_search_stats = stats
+        if top_k <= 0:
+            yield []
+            return
+
+        n = query_arr.shape[0]
+        pending = []
+        for length, indices, arr, lower, upper in self._candidate_groups(candidates):
+            stats['candidates'] += len(indices)
+            if self.window is not None and abs(n - length) > self.window:
+                stats['pruned_length'] += len(indices)
+                continue
+            kim = lb_kim(query_arr, arr)
+            bound = np.maximum(kim, lb_keogh(query_arr, arr, lower, upper, self.window))
+            order = np.argsort(bound, kind='stable')
+            pending.append([indices, arr, order, bound[order], kim[order], 0])
+
+        if not pending:
+            yield []
+            return
+
+        # Max-heap of the current best k as (-distance, -chain_idx)
+        heap = []
+
+        def threshold():
+            if len(heap) < top_k:
+                return np.inf
+            return -heap[0][0]
+
+        # Seed with the globally most promising candidates, then sweep the rest
+        all_bounds = np.concatenate([p[3] for p in pending])
+        seed = min(top_k * self.SEED_FACTOR, len(all_bounds)) - 1
+        seed_cutoff = np.partition(all_bounds, seed)[seed]
+
+        for cutoff in (seed_cutoff, np.inf):
+            for group in pending:
+                indices, arr, order, bound, kim, cursor = group
+
+                while cursor < len(order) and bound[cursor] <= cutoff:
+                    limit = threshold()
+                    stop = min(cursor + self.CHUNK_SIZE, len(order))
+                    if cutoff < np.inf:
+                        stop = cursor + int(np.searchsorted(bound[cursor:stop], cutoff, side='right'))
+
+                    # Bounds are sorted, so everything from the first pruned one onwards goes
+                    slack = limit * (1 + self.PRUNE_EPS) + self.PRUNE_EPS
+                    keep = int(np.searchsorted(bound[cursor:stop], slack, side='right'))
+                    if keep < stop - cursor:
+                        rest = kim[cursor + keep:] > slack
+                        stats['pruned_kim'] += int(rest.sum())
+                        stats['pruned_keogh'] += int(len(rest) - rest.sum())
+                        stop = cursor + keep
+                        group[5] = len(order)
+                    else:
+                        group[5] = stop
+
+                    if stop > cursor:
+                        local = order[cursor:stop]
+                        max_dist = None if limit == np.inf else slack
+                        dists = dtw_batch(query_arr, arr[local], self.window, max_dist)
+                        done = np.isfinite(dists)
+                        stats['full_dtw'] += int(done.sum())
+                        stats['abandoned'] += int(len(dists) - done.sum())
+
+                        changed = False
+                        for dist, idx in zip(dists[done], indices[local][done]):
+                            item = (-float(dist), -int(idx))
+                            if len(heap) < top_k:
+                                heapq.heappush(heap, item)
+                                changed = True
+                            elif item > heap[0]:
+                                heapq.heapreplace(heap, item)
+                                changed = True
+                        if changed:
+                            yield sorted((-d, -i) for d, i in heap)
+                    cursor = group[5]
+
+        yield sorted((-d, -i) for d, i in heap)
+
+    def _top_k_many(self, query_arrs: List[np.ndarray], top_k: int,
+                    candidates: Optional[np.ndarray] = None) -> Tuple[List[List[Tuple[float, int]]], List[Dict]]:
+        """
+        _top_k for several normalized queries in one pass over the corpus.
+        Same cascade as _iter_top_k, with (query, chain) pairs in place of
+        chains: the bounds of every pair in a length group are computed in one
+        broadcast (queries of equal length stacked together), every query is
+        seeded with its own most promising pairs, and the pairs still under
+        their query's current k-th best are scored, best bound first, in
+        chunks that mix queries. candidates restricts every query to those
+        chain ids. Returns per-query (distance, chain_idx) lists and stats.
+        """
+        n_queries = len(query_arrs)
+        names = ('candidates', 'pruned_length', 'pruned_kim', 'pruned_keogh', 'abandoned', 'full_dtw')
+        counts = {name: np.zeros(n_queries, dtype=np.int64) for name in names}
+        heaps = [[] for _ in range(n_queries)]
+        # k-th best distance per query, inf while its heap isn't full
+        kth = np.full(n_queries, np.inf)
+        if top_k <= 0 or n_queries == 0:
+            return [[] for _ in range(n_queries)], [{name: 0 for name in names} for _ in range(n_queries)]
+
+        by_length = {}
+        for qi, query_arr in enumerate(query_arrs):
+            by_length.setdefault(query_arr.shape[0], []).append(qi)
+        stacks = {n: np.stack([query_arrs[qi] for qi in ids]) for n, ids in by_length.items()}
+        by_length = {n: np.array(ids) for n, ids in by_length.items()}
+
+        # One pass over the corpus for the bounds: each group is touched once for all queries
+        blocks = []
+        for length, indices, arr, lower, upper in self._candidate_groups(candidates):
+            for n, qids in by_length.items():
+                counts['candidates'][qids] += len(indices)
+                if self.window is not None and abs(n - length) > self.window:
+                    counts['pruned_length'][qids] += len(indices)
+                    continue
+                kim = lb_kim_many(stacks[n], arr)
+                bound = np.maximum(kim, lb_keogh_many(stacks[n], arr, lower, upper, self.window))
+                blocks.append((n, qids, indices, arr, bound, kim, np.zeros(bound.shape, dtype=bool)))
+
+        def slack(limit):
+            return limit * (1 + self.PRUNE_EPS) + self.PRUNE_EPS
+
+        # Seed cutoff: each query first scores its top_k * SEED_FACTOR best bounds
+        rows = [[] for _ in range(n_queries)]
+        for n, qids, indices, arr, bound, kim, scored in blocks:
+            for row, qi in enumerate(qids):
+                rows[qi].append(bound[row])
+        seed_cutoff = np.full(n_queries, np.inf)
+        for qi, bounds in enumerate(rows):
+            if bounds:
+                bounds = np.concatenate(bounds)
+                seed = min(top_k * self.SEED_FACTOR, len(bounds)) - 1
+                seed_cutoff[qi] = np.partition(bounds, seed)[seed]
+        rows = None
+
+        for cutoff in (seed_cutoff, None):
+            for n, qids, indices, arr, bound, kim, scored in blocks:
+                limit = slack(kth[qids])
+                if cutoff is not None:
+                    limit = np.minimum(limit, cutoff[qids])
+                q_rows, c_cols = np.nonzero(~scored & (bound <= limit[:, None]))
+                order = np.argsort(bound[q_rows, c_cols], kind='stable')
+                q_rows, c_cols = q_rows[order], c_cols[order]
+
+                for chunk in range(0, len(q_rows), self.CHUNK_SIZE):
+                    r = q_rows[chunk:chunk + self.CHUNK_SIZE]
+                    c = c_cols[chunk:chunk + self.CHUNK_SIZE]
+                    # Thresholds only tighten, so re-check against the current ones
+                    limit = slack(kth[qids[r]])
+                    keep = bound[r, c] <= limit
+                    r, c, limit = r[keep], c[keep], limit[keep]
+                    if len(r) == 0:
+                        continue
+                    scored[r, c] = True
+                    max_dist = None if np.isinf(limit).all() else limit
+                    dists = dtw_batch(stacks[n][r], arr[c], self.window, max_dist)
+                    done = np.isfinite(dists)
+                    qi_all = qids[r]
+                    np.add.at(counts['full_dtw'], qi_all[done], 1)
+                    np.add.at(counts['abandoned'], qi_all[~done], 1)
+
+                    for dist, idx, qi in zip(dists[done], indices[c[done]], qi_all[done]):
+                        heap = heaps[qi]
+                        item = (-float(dist), -int(idx))
+                        if len(heap) < top_k:
+                            heapq.heappush(heap, item)
+                        elif item > heap[0]:
+                            heapq.heapreplace(heap, item)
+                        else:
+                            continue
+                        if len(heap) == top_k:
+                            kth[qi] = -heap[0][0]
+
+        # Whatever was never scored was pruned by one of the bounds
+        for n, qids, indices, arr, bound, kim, scored in blocks:
+            unscored = ~scored
+            by_kim = unscored & (kim > slack(kth[qids])[:, None])
+            counts['pruned_kim'][qids] += by_kim.sum(axis=1)
+            counts['pruned_keogh'][qids] += (unscored & ~by_kim).sum(axis=1)
+
+        hits = [sorted((-d, -i) for d, i in heap) for heap in heaps]
+        stats = [{name: int(counts[name][qi]) for name in names} for qi in range(n_queries)]
+        return hits, stats
+
+    def evaluate_ann(self, queries: List[List[Tuple[float, float]]], top_k: int = 15,
+                     pool_sizes: Tuple[int, ...] = (50, 100, 200, 500, 1000)) -> Dict[int, Dict]:
+        """
+        Recall@k of the approximate search against the exhaustive one, per pool size.
+        Returns {pool_size: {'recall': mean recall@k, 'mean_ms': mean latency}},
+        plus an 'exact' entry with the exhaustive latency for reference.
+        """
+        queries = [q for q in queries if len(q)]
+        report = {}
+        exact = []
+        # Timings bypass the result cache and leave out the index build
+        queries = [self.normalize_sequence(q) for q in queries]
+        if self.ann_tree is None:
+            self.build_ann_index()
+        start = time.perf_counter()
+        for q in queries:
+            exact.append({m['chain_idx'] for m in self._search_uncached(q, top_k, None)})
+        report['exact'] = {'recall': 1.0, 'mean_ms': 1000 * (time.perf_counter() - start) / max(1, len(queries))}
+
+        for pool_size in pool_sizes:
+            recalls = []
+            start = time.perf_counter()
+            for q, truth in zip(queries, exact):
+                found = {m['chain_idx'] for m in self._search_uncached(q, top_k, pool_size)}
+                recalls.append(len(found & truth) / max(1, len(truth)))
+            elapsed = time.perf_counter() - start
+            report[pool_size] = {'recall': float(np.mean(recalls)) if recalls else 0.0,
+                                 'mean_ms': 1000 * elapsed / max(1, len(queries))}
+        return report
+
+    def _search_fastdtw(self, query_arr: np.ndarray, top_k: int,
+                        candidates: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Original per-chain fastdtw loop, kept as a fallback backend.
+        """
+        from fastdtw import fastdtw
+        from scipy.spatial.distance import euclidean
+        results = []
+        ids = range(len(self.chains)) if candidates is None else candidates
         
-        for idx, chain in enumerate(self.chains):
-            chain_coords = chain.get('coords')
-            if not chain_coords or len(chain_coords) < 1:
+        for idx in ids:
+            idx = int(idx)
+            chain = self.chains[idx]
+            chain_arr = self.chains.normalized_of(idx)
+            if len(chain_arr) < 1:
                 continue
-                
-            chain_arr = self.normalize_sequence(chain_coords)
             
             # fastdtw computes the distance and the path
             try:
@@ -0,0 +1,255 @@
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import List, Dict, Tuple, Optional, Iterator
+
+from chain_store import ChainStore
+from matcher import PatternMatcher
+from instrumentation import metrics
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to a block created by the parent. The parent owns (and unlinks) it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag; spawned workers share the parent's
+        # resource tracker, so registering the name again is harmless
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(conn, coords_name: str, n_points: int, ids_name: str, n_chains: int,
+                 shard_groups: List[Tuple[int, int, int, int]], window: Optional[int]):
+    """
+    Worker loop. Builds zero-copy length groups over its shard of the shared
+    buffers once, then answers (query, top_k) messages until it gets None.
+    shard_groups: (length, first chain row, chain count, first point row) in the
+    shared layout.
+    """
+    coords_shm = _attach(coords_name)
+    ids_shm = _attach(ids_name)
+    try:
+        coords = np.ndarray((n_points, 2), dtype=np.float32, buffer=coords_shm.buf)
+        ids = np.ndarray((n_chains,), dtype=np.int64, buffer=ids_shm.buf)
+
+        groups = {}
+        for length, first_row, count, first_point in shard_groups:
+            arr = coords[first_point:first_point + count * length].reshape(count, length, 2)
+            groups[length] = (ids[first_row:first_row + count], arr)
+        matcher = PatternMatcher.from_length_groups(groups, window)
+        conn.send('ready')
+
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            query_arr, top_k, candidates = msg
+            try:
+                hits = matcher._top_k(query_arr, top_k, candidates)
+                conn.send(('ok', hits, matcher.last_search_stats))
+            except Exception as e:
+                conn.send(('error', str(e), {}))
+    finally:
+        # Drop our views before closing the mappings
+        matcher = groups = coords = ids = None
+        coords_shm.close()
+        ids_shm.close()
+        conn.close()
+
+
+class ParallelMatcher:
+    """
+    Multi-core DTW search over a corpus placed in shared memory once.
+
+    The normalized coordinates are copied into one shared block, laid out
+    shard by shard and, inside each shard, sorted by chain length, so every
+    worker sees its length groups as plain reshaped views of the block.
+    Each persistent worker owns one shard; a query is sent to all of them
+    (only the query points, and the filtered ids if any, cross the pipe) and
+    the per-shard top-k lists are merged in the parent.
+
+    Exposes the same search(), iter_search() and search_many() as
+    PatternMatcher. Approximate searches (pool_size) only score a small pool,
+    so they run on an in-process PatternMatcher instead of the workers.
+    """
+
+    def __init__(self, chains, n_workers: Optional[int] = None, window: Optional[int] = None):
+        if not isinstance(chains, ChainStore):
+            chains = ChainStore.from_chains(chains)
+        self.chains = chains
+        self.window = window
+        self.n_workers = max(1, n_workers or os.cpu_count() or 1)
+        self.last_search_stats = {}
+        self.last_batch_stats = []
+        self._local = None
+        self._workers = []
+        self._shm = []
+
+        lengths = chains.lengths
+        by_length = np.argsort(lengths, kind='stable')
+        by_length = by_length[lengths[by_length] > 0]
+
+        # Round-robin over the length-sorted ids gives every shard the same
+        # mix of short and long chains (and each shard stays length-sorted)
+        shards = [by_length[s::self.n_workers] for s in range(self.n_workers)]
+        layout = np.concatenate(shards) if len(by_length) else np.zeros(0, dtype=np.int64)
+        layout_lengths = lengths[layout]
+
+        n_points = int(layout_lengths.sum())
+        coords_shm = self._create(max(1, n_points * 2 * 4))
+        ids_shm = self._create(max(1, len(layout) * 8))
+        coords = np.ndarray((n_points, 2), dtype=np.float32, buffer=coords_shm.buf)
+        shared_ids = np.ndarray((len(layout),), dtype=np.int64, buffer=ids_shm.buf)
+        shared_ids[:] = layout
+        if n_points:
+            rows = np.repeat(chains.offsets[layout], layout_lengths)
+            rows += np.arange(n_points) - np.repeat(np.cumsum(layout_lengths) - layout_lengths, layout_lengths)
+            coords[:] = chains.normalized[rows]
+        del coords, shared_ids
+
+        ctx = mp.get_context('spawn')
+        first_row = 0
+        first_point = 0
+        for shard in shards:
+            shard_groups = []
+            shard_lengths = lengths[shard]
+            for length in np.unique(shard_lengths):
+                count = int(np.count_nonzero(shard_lengths == length))
+                shard_groups.append((int(length), first_row, count, first_point))
+                first_row += count
+                first_point += count * int(length)
+            if not shard_groups:
+                continue
+
+            parent_conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(target=_worker_main, daemon=True,
+                               args=(child_conn, coords_shm.name, n_points, ids_shm.name,
+                                     len(layout), shard_groups, window))
+            proc.start()
+            child_conn.close()
+            self._workers.append((proc, parent_conn))
+
+        for proc, conn in self._workers:
+            if conn.recv() != 'ready':
+                raise RuntimeError("Search worker failed to start")
+
+    def _create(self, size: int) -> shared_memory.SharedMemory:
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self._shm.append(shm)
+        return shm
+
+    normalize_sequence = PatternMatcher.normalize_sequence
+    select = PatternMatcher.select
+    filter_options = PatternMatcher.filter_options
+
+    def local_matcher(self) -> PatternMatcher:
+        """
+        In-process matcher over the same chains, for approximate searches.
+        """
+        if self._local is None:
+            self._local = PatternMatcher(self.chains, window=self.window)
+        return self._local
+
+    def search(self, query: List[Tuple[float, float]], top_k: int = 5,
+               pool_size: Optional[int] = None, filters: Optional[Dict] = None) -> List[Dict]:
+        """
+        Search for the top_k most similar chains to the query on all workers.
+        pool_size and filters are as for PatternMatcher.search.
+        """
+        if not query:
+            return []
+        if pool_size is not None:
+            local = self.local_matcher()
+            results = local.search(query, top_k, pool_size, filters)
+            self.last_search_stats = local.last_search_stats
+            return results
+        candidates = self.select(filters)
+        if not self._workers or (candidates is not None and len(candidates) == 0):
+            self.last_search_stats = {} if candidates is None else {'candidates': 0, 'filtered': 0}
+            return []
+
+        start = time.perf_counter()
+        query_arr = self.normalize_sequence(query)
+        for proc, conn in self._workers:
+            conn.send((query_arr, top_k, candidates))
+
+        hits = []
+        stats = {}
+        errors = []
+        for proc, conn in self._workers:
+            status, shard_hits, shard_stats = conn.recv()
+            if status != 'ok':
+                errors.append(shard_hits)
+                continue
+            hits.extend(shard_hits)
+            for key, value in shard_stats.items():
+                stats[key] = stats.get(key, 0) + value
+        if errors:
+            raise RuntimeError(f"Search worker failed: {errors[0]}")
+        if candidates is not None:
+            stats['filtered'] = len(candidates)
+
+        self.last_search_stats = stats
+        metrics.record('matcher.parallel_search', time.perf_counter() - start)
+        PatternMatcher._count_search_stats(stats)
+        hits.sort()
+        return [{
+            'chain_idx': idx,
+            'distance': dist,
+            'chain_data': self.chains[idx]
+        } for dist, idx in hits[:top_k]]
+
+    def iter_search(self, query: List[Tuple[float, float]], top_k: int = 5,
+                    pool_size: Optional[int] = None, filters: Optional[Dict] = None) -> Iterator[List[Dict]]:
+        """
+        The shards are searched side by side, so this yields the final list only.
+        """
+        yield self.search(query, top_k, pool_size, filters)
+
+    def search_many(self, queries: List[List[Tuple[float, float]]], top_k: int = 5,
+                    pool_size: Optional[int] = None, filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        search() for each query in turn; every query uses all the workers.
+        Per-query stats are left in self.last_batch_stats.
+        """
+        results, batch_stats = [], []
+        for query in queries:
+            results.append(self.search(query, top_k, pool_size, filters))
+            batch_stats.append(dict(self.last_search_stats))
+        self.last_batch_stats = batch_stats
+        self.last_search_stats = PatternMatcher._sum_stats(batch_stats)
+        return results
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory.
+        """
+        for proc, conn in self._workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for proc, conn in self._workers:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+            conn.close()
+        self._workers = []
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        if self._shm:
+            self.close()
@@ -1,12 +1,123 @@
+import contextlib
+import hashlib
+import itertools
 import json
+import multiprocessing
 import os
-import pickle
-from typing import List, Tuple, Dict, Optional
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Optional, Iterator
+
+from chain_store import ChainStore, CorpusFormatError, game_clock_seconds
+from instrumentation import metrics
+
+class ChainBuilder:
+    """
+    The chain-boundary state machine. Events are fed in match order one at a
+    time; a chain is a run of passes by the same team and is closed whenever
+    the other team touches the ball.
+    """
+
+    def __init__(self, parser: 'ChainParser', match_name: str):
+        self.parser = parser
+        self.match_name = match_name
+        self.chains = []
+        self.current_chain = []
+        self.current_team_id = None
+        self.n_events = 0
+        self.last_seconds = None
+
+    def _close(self, timestamp: str, seconds: Optional[float]):
+        if len(self.current_chain) >= 3:
+            self.chains.append({
+                'team_id': self.current_team_id,
+                'coords': self.current_chain,
+                'match_name': self.match_name,
+                'timestamp': timestamp,
+                'seconds': seconds
+            })
+        self.current_chain = []
+
+    def feed(self, event: Dict):
+        self.n_events += 1
+        possession_info = event.get('possessionEvents', {})
+        event_type = possession_info.get('possessionEventType')
+        
+        game_info = event.get('gameEvents', {})
+        team_id = game_info.get('teamId')
+        
+        # Timestamp, and as seconds for the time filters
+        timestamp = possession_info.get('formattedGameClock', '00:00')
+        seconds = game_clock_seconds(timestamp)
+        seconds = self.last_seconds if seconds != seconds else seconds # NaN: keep the last known time
+        self.last_seconds = seconds
+
+        if event_type == 'PA' and team_id is not None:
+            passer_id = possession_info.get('passerPlayerId')
+            
+            if team_id != self.current_team_id:
+                self._close(timestamp, seconds)
+                self.current_team_id = team_id
+
+            if passer_id:
+                coords = self.parser.get_player_coordinates(event, passer_id)
+                if coords and coords[0] is not None and coords[1] is not None:
+                    self.current_chain.append(coords)
+        
+        elif team_id is not None and team_id != self.current_team_id:
+            self._close(timestamp, seconds)
+            self.current_team_id = None
+
+    def finish(self) -> List[Dict]:
+        self._close('End of Match', self.last_seconds)
+        metrics.count('parser.events_scanned', self.n_events)
+        metrics.count('parser.chains_emitted', len(self.chains))
+        return self.chains
+
+
+def _parse_counted(parser: 'ChainParser', path: str) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Pool task: parse one file and hand the worker's counters back to the parent.
+    Progress goes to stderr: a spawned worker doesn't inherit a redirect of
+    the parent's stdout, which may be carrying results (cli.py).
+    """
+    metrics.take_counters()
+    with contextlib.redirect_stdout(sys.stderr):
+        chains = parser.parse_file(path)
+    return chains, metrics.take_counters()
+
 
 class ChainParser:
-    def __init__(self, data_dir: str, cache_file: str = "chains_cache.pkl"):
+    # Characters read per step when streaming a match file
+    STREAM_CHUNK = 1 << 16
+    # Bump when the cached segment format changes
+    MANIFEST_VERSION = 3
+    # Failures that come from a file's content, so they recur until it changes
+    # (JSONDecodeError and UnicodeDecodeError are ValueErrors)
+    CONTENT_ERRORS = (ValueError,)
+
+    def __init__(self, data_dir: str, cache_file: str = "chains_cache.bin", streaming: bool = True,
+                 workers: int = 1, verify: bool = False):
+        """
+        workers: number of processes used to parse files on a cold build.
+        verify: also check the data checksum of the combined cache when it is
+        loaded as is (cached segments are always checked when stitched).
+        """
         self.data_dir = data_dir
         self.cache_file = cache_file
+        self.streaming = streaming
+        self.workers = max(1, workers or 1)
+        self.verify = verify
+        self.errors = []
+        self.content_errors = set() # paths in self.errors that failed on their content
+        self.last_refresh = {}
+
+        # Per-file cache: a manifest plus one cached segment per match file
+        cache_base = os.path.splitext(cache_file)[0]
+        self.manifest_file = cache_base + "_manifest.json"
+        self.segment_dir = cache_base + "_segments"
+        self.export_file = cache_base + "_exported.json"
 
     def get_player_coordinates(self, event: Dict, player_id: int) -> Optional[Tuple[float, float]]:
         """
@@ -20,130 +131,384 @@ class ChainParser:
                         return (player.get('x'), player.get('y'))
         return None
 
-    def parse_file(self, filepath: str) -> List[Dict]:
+    def iter_events(self, filepath: str) -> Iterator[Dict]:
+        """
+        Yields the events of a match file one at a time.
+        The file is a single JSON array; it is read in chunks and each element is
+        decoded as soon as it is complete, so only one event (plus one read
+        chunk) is held in memory at a time.
+        """
+        decoder = json.JSONDecoder()
+        with open(filepath, 'r', encoding='utf-8') as f:
+            buf = f.read(self.STREAM_CHUNK)
+            pos = 0
+            eof = not buf
+            state = 'start' # start -> first -> (value -> sep)*
+
+            while True:
+                # Skip whitespace, pulling in more text when the buffer runs out
+                while True:
+                    while pos < len(buf) and buf[pos] in ' \t\r\n':
+                        pos += 1
+                    if pos < len(buf) or eof:
+                        break
+                    buf = f.read(self.STREAM_CHUNK)
+                    pos = 0
+                    eof = not buf
+                if pos >= len(buf):
+                    raise ValueError("Unexpected end of file")
+
+                ch = buf[pos]
+                if state == 'start':
+                    if ch != '[':
+                        raise ValueError("Expected a JSON array of events")
+                    pos += 1
+                    state = 'first'
+                    continue
+                if ch == ']' and state in ('first', 'sep'):
+                    return
+                if state == 'sep':
+                    if ch != ',':
+                        raise ValueError(f"Expected ',' or ']' but found {ch!r}")
+                    pos += 1
+                    state = 'value'
+                    continue
+
+                # Decode one element; if it runs past the buffer, read more and retry
+                while True:
+                    try:
+                        event, end = decoder.raw_decode(buf, pos)
+                        if end < len(buf) or eof:
+                            break
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                    more = f.read(self.STREAM_CHUNK)
+                    eof = not more
+                    buf = buf[pos:] + more
+                    pos = 0
+
+                yield event
+                pos = end
+                state = 'sep'
+                if pos > self.STREAM_CHUNK:
+                    buf = buf[pos:]
+                    pos = 0
+
+    def detect_match_name(self, events: Iterator[Dict]) -> Tuple[str, List[Dict]]:
+        """
+        Builds the "Home vs Away" name from the first events of a match.
+        Returns the name and the events consumed while looking.
+        """
+        # Usually first event captures team names.
+        # Often gameEvents -> teamName is present.
+        # Based on user view: "teamName": "Netherlands", "homeTeam": true
+        # We scan the first few events to find 2 distinct team names.
+        head = []
+        teams = {} # id -> name
+        for evt in events:
+            head.append(evt)
+            ge = evt.get('gameEvents', {})
+            tid = ge.get('teamId')
+            tname = ge.get('teamName')
+            if tid and tname:
+                teams[tid] = tname
+                if len(teams) >= 2:
+                    break
+            if len(head) >= 100: # Check first 100 events
+                break
+
+        match_name = "Unknown Match"
+        if len(teams) >= 2:
+            names = list(teams.values())
+            match_name = f"{names[0]} vs {names[1]}"
+        elif len(teams) == 1:
+            match_name = f"{list(teams.values())[0]} vs Unknown"
+        return match_name, head
+
+    def parse_file(self, filepath: str, streaming: Optional[bool] = None) -> List[Dict]:
         """
         Parses a single JSON file and returns a list of possession chains.
+        streaming: walk the file event by event instead of loading it whole
+        (defaults to the parser's setting). Both modes give the same chains.
+        Raises OSError / ValueError if the file can't be read or isn't a JSON
+        array of events; parse_files() reports those in self.errors.
         """
+        if streaming is None:
+            streaming = self.streaming
         print(f"Parsing {filepath}...")
-        try:
+
+        if not streaming:
             with open(filepath, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-        except Exception as e:
-            print(f"Error reading {filepath}: {e}")
-            return []
+            if not isinstance(data, list):
+                raise ValueError("Expected a JSON array of events")
 
-        chains = []
-        current_chain = []
-        current_team_id = None
-        
-        # Metadata extraction logic
-        # Usually first event captures team names.
-        match_name = "Unknown Match"
-        if len(data) > 0:
-            first = data[0]
-            # Try to find team names. 
-            # Often gameEvents -> teamName is present.
-            # Or we look for a 'lineup' event or 'kickoff'.
-            # Based on user view: "teamName": "Netherlands", "homeTeam": true
-            # We can scan first few events to find 2 distinct team names.
-            
-            teams = {} # id -> name
-            for evt in data[:100]: # Check first 100 events
-                ge = evt.get('gameEvents', {})
-                tid = ge.get('teamId')
-                tname = ge.get('teamName')
-                if tid and tname:
-                    teams[tid] = tname
-                    if len(teams) >= 2:
-                        break
-            
-            if len(teams) >= 2:
-                names = list(teams.values())
-                match_name = f"{names[0]} vs {names[1]}"
-            elif len(teams) == 1:
-                match_name = f"{list(teams.values())[0]} vs Unknown"
-
-        for event in data:
-            possession_info = event.get('possessionEvents', {})
-            event_type = possession_info.get('possessionEventType')
-            
-            game_info = event.get('gameEvents', {})
-            team_id = game_info.get('teamId')
-            
-            # Timestamp
-            timestamp = possession_info.get('formattedGameClock', '00:00')
-
-            if event_type == 'PA' and team_id is not None:
-                passer_id = possession_info.get('passerPlayerId')
-                
-                if team_id != current_team_id:
-                    if len(current_chain) >= 3:
-                        chains.append({
-                            'team_id': current_team_id,
-                            'coords': current_chain,
-                            'match_name': match_name,
-                            'timestamp': timestamp 
-                        })
-                    current_chain = []
-                    current_team_id = team_id
-
-                if passer_id:
-                    coords = self.get_player_coordinates(event, passer_id)
-                    if coords and coords[0] is not None and coords[1] is not None:
-                        current_chain.append(coords)
-            
-            elif team_id is not None and team_id != current_team_id:
-                 if len(current_chain) >= 3:
-                    chains.append({
-                        'team_id': current_team_id,
-                        'coords': current_chain,
-                        'match_name': match_name,
-                        'timestamp': timestamp
-                    })
-                 current_chain = []
-                 current_team_id = None
-
-        if len(current_chain) >= 3:
-            chains.append({
-                'team_id': current_team_id,
-                'coords': current_chain,
-                'match_name': match_name,
-                'timestamp': 'End of Match'
-            })
-            
-        return chains
+            match_name, _ = self.detect_match_name(iter(data))
+            builder = ChainBuilder(self, match_name)
+            for event in data:
+                builder.feed(event)
+            return builder.finish()
+
+        events = self.iter_events(filepath)
+        match_name, head = self.detect_match_name(events)
+        builder = ChainBuilder(self, match_name)
+        for event in itertools.chain(head, events):
+            builder.feed(event)
+        return builder.finish()
 
-    def process_all(self):
+    def list_files(self) -> List[str]:
+        """
+        Match files in the data directory, in a fixed (sorted) order.
+        Our own manifest and readable export can live next to them and are
+        skipped.
+        """
+        own_files = {os.path.basename(self.export_file), os.path.basename(self.manifest_file)}
+        return [os.path.join(self.data_dir, filename)
+                for filename in sorted(os.listdir(self.data_dir))
+                if filename.endswith(".json") and filename not in own_files]
+
+    def parse_files(self, paths: List[str]) -> List[List[Dict]]:
+        """
+        Parses the given files and returns their chains in the same order.
+        With workers > 1 the files are spread over a process pool.
+        A file that fails is reported in self.errors and contributes no chains;
+        it never aborts the run. Files whose content is bad (CONTENT_ERRORS)
+        are also added to self.content_errors.
+        """
+        self.errors = []
+        self.content_errors = set()
+        results = [[] for _ in paths]
+        workers = min(self.workers, len(paths))
+
+        with metrics.stage('parser.parse_files'):
+            if workers <= 1:
+                for i, path in enumerate(paths):
+                    try:
+                        results[i] = self.parse_file(path)
+                    except Exception as e:
+                        self._report_error(path, e)
+            else:
+                ctx = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                    futures = [pool.submit(_parse_counted, self, path) for path in paths]
+                    for i, (path, future) in enumerate(zip(paths, futures)):
+                        try:
+                            results[i], counters = future.result()
+                            metrics.merge_counters(counters)
+                        except Exception as e:
+                            self._report_error(path, e)
+        metrics.count('parser.files_parsed', len(paths))
+        metrics.count('parser.errors', len(self.errors))
+        return results
+
+    def _report_error(self, path: str, error: Exception):
+        print(f"Error parsing {path}: {error}")
+        self.errors.append((path, str(error)))
+        if isinstance(error, self.CONTENT_ERRORS):
+            self.content_errors.add(path)
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        """
+        SHA-1 of a file's content, read in chunks.
+        """
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def load_manifest(self) -> Dict:
+        """
+        The per-file cache manifest, or an empty one if missing/unreadable.
+        """
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == self.MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'version': self.MANIFEST_VERSION, 'files': {}}
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.segment_dir, name)
+
+    def _write_atomic(self, path: str, write, mode: str = 'wb'):
+        tmp_path = path + '.tmp'
+        encoding = None if 'b' in mode else 'utf-8'
+        with open(tmp_path, mode, encoding=encoding) as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _load_segment(self, rel: str, entry: Dict) -> ChainStore:
+        """
+        Reads a cached segment for stitching. Its data checksum is checked
+        (stitching reads it in full anyway); a damaged segment is rebuilt
+        from its match file.
+        """
+        path = self._segment_path(entry['segment'])
+        try:
+            return ChainStore.open(path, mmap=False, verify=True)
+        except CorpusFormatError as e:
+            print(f"Reparsing {rel}: {e}")
+        metrics.count('parser.segments_rebuilt')
+        store = ChainStore.from_chains(self.parse_file(os.path.join(self.data_dir, rel)))
+        store.save(path)
+        return store
+
+    def scan_files(self) -> Tuple[Dict, List[Tuple[str, str]], List[str], Dict]:
+        """
+        Compares the data directory with the manifest (stat first, content
+        hash only for touched files). Returns the manifest entries for the
+        current files, the (relative, full) paths that need parsing, the
+        relative paths of files that disappeared and the entries of files
+        that failed to parse before and haven't changed since.
+        """
+        manifest = self.load_manifest()
+        old_entries = manifest['files']
+        old_failed = manifest.get('failed', {})
+        entries = {}
+        to_parse = []
+        failed = {}
+
+        for path in self.list_files():
+            rel = os.path.relpath(path, self.data_dir)
+            st = os.stat(path)
+            entry = old_entries.get(rel)
+
+            # A file that failed is only retried once it changes
+            failure = old_failed.get(rel)
+            if failure is not None and failure['size'] == st.st_size and failure['mtime'] == st.st_mtime_ns:
+                failed[rel] = failure
+                continue
+            cached = entry is not None and os.path.exists(self._segment_path(entry['segment']))
+
+            if cached and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+                entries[rel] = entry
+                continue
+
+            # Touched but maybe not changed: compare content before reparsing
+            digest = self.file_digest(path)
+            if cached and entry['sha1'] == digest:
+                entries[rel] = dict(entry, size=st.st_size, mtime=st.st_mtime_ns)
+                continue
+            if failure is not None and failure['sha1'] == digest:
+                failed[rel] = dict(failure, size=st.st_size, mtime=st.st_mtime_ns)
+                continue
+
+            entries[rel] = {
+                'size': st.st_size,
+                'mtime': st.st_mtime_ns,
+                'sha1': digest,
+                'segment': hashlib.sha1(rel.encode('utf-8')).hexdigest() + '.bin',
+            }
+            to_parse.append((rel, path))
+
+        removed = [rel for rel in old_entries if rel not in entries]
+        return entries, to_parse, removed, failed
+
+    def has_changes(self) -> bool:
+        """
+        True if process_all() would reparse or drop any file. Files that
+        failed before and haven't changed don't count.
+        """
+        _, to_parse, removed, _ = self.scan_files()
+        return bool(to_parse or removed)
+
+    def process_all(self, export_json: bool = False) -> ChainStore:
         """
         Process all JSON files in the data directory and cache the results.
+        Returns the chains as a columnar ChainStore.
+        export_json: also write the readable JSON export after a rebuild.
+
+        The cache is incremental. A manifest records, per match file, its size,
+        mtime and content hash plus the cached chains of that file (a segment).
+        Only new or changed files are reparsed and deleted files are dropped;
+        if nothing changed the combined cache is memory-mapped as is.
+        Segments and the combined cache use the binary ChainStore format.
+        Files that fail to parse are left out of the corpus. A file with bad
+        content is remembered with its error, which stays in self.errors until
+        the file changes; any other failure (a dead worker, running out of
+        memory, a read error) isn't recorded, so the file is retried next time.
         """
-        all_chains = []
-        
-        # Load from cache if exists
-        if os.path.exists(self.cache_file):
-            print(f"Loading from cache: {self.cache_file}")
-            with open(self.cache_file, 'rb') as f:
-                return pickle.load(f)
-
-        # Parse valid files
-        for filename in os.listdir(self.data_dir):
-            if filename.endswith(".json"):
-                full_path = os.path.join(self.data_dir, filename)
-                all_chains.extend(self.parse_file(full_path))
-        
-        print(f"Processed {len(all_chains)} chains.")
-        
+        start = time.perf_counter()
+        os.makedirs(self.segment_dir, exist_ok=True)
+        entries, to_parse, removed, failed = self.scan_files()
+        self.last_refresh = {'reparsed': len(to_parse), 'reused': len(entries) - len(to_parse),
+                             'removed': len(removed)}
+        known_errors = [(os.path.join(self.data_dir, rel), failure['error']) for rel, failure in failed.items()]
+        self.errors = list(known_errors)
+        metrics.record('parser.scan_files', time.perf_counter() - start)
+        metrics.count('parser.files_reused', self.last_refresh['reused'])
+
+        # Load from cache if nothing changed
+        if not to_parse and not removed:
+            try:
+                with metrics.stage('parser.cache_load'):
+                    store = ChainStore.open(self.cache_file, verify=self.verify)
+                print(f"Loading from cache: {self.cache_file}")
+                metrics.record('parser.process_all', time.perf_counter() - start)
+                return store
+            except CorpusFormatError as e:
+                print(f"Rebuilding cache: {e}")
+
+        print(f"Cache refresh: {len(to_parse)} new/changed, "
+              f"{self.last_refresh['reused']} unchanged, {len(removed)} removed files.")
+
+        # Parse new and changed files, one cached segment each
+        parsed = self.parse_files([path for rel, path in to_parse])
+        build_start = time.perf_counter()
+        errors = dict(self.errors)
+        for (rel, path), chains in zip(to_parse, parsed):
+            if path in errors:
+                entry = entries.pop(rel)
+                if path not in self.content_errors:
+                    continue
+                # Not a cached file, but remembered so it isn't retried until it changes
+                failed[rel] = {'size': entry['size'], 'mtime': entry['mtime'], 'sha1': entry['sha1'],
+                               'error': errors[path]}
+                continue
+            entries[rel]['chains'] = len(chains)
+            ChainStore.from_chains(chains).save(self._segment_path(entries[rel]['segment']))
+
+        # Drop segments no manifest entry points to (deleted files, old formats)
+        live = {entry['segment'] for entry in entries.values()}
+        for name in os.listdir(self.segment_dir):
+            if name not in live:
+                os.remove(self._segment_path(name))
+
+        # Stitch the segments together in file order
+        segments = []
+        for rel in sorted(entries):
+            segments.append(self._load_segment(rel, entries[rel]))
+        store = ChainStore.concat(segments)
+        print(f"Processed {len(store)} chains.")
+
         # Save to cache
-        with open(self.cache_file, 'wb') as f:
-            pickle.dump(all_chains, f)
-            
-        # Export to readable JSON as requested
-        json_path = self.cache_file.replace('.pkl', '_exported.json')
+        store.save(self.cache_file)
+        self.errors = known_errors + self.errors
+        manifest = {'version': self.MANIFEST_VERSION, 'files': entries, 'failed': failed}
+        self._write_atomic(self.manifest_file, lambda f: json.dump(manifest, f, indent=1), mode='w')
+        metrics.record('parser.build_cache', time.perf_counter() - build_start)
+
+        if export_json:
+            with metrics.stage('parser.export_json'):
+                self.export_json(store)
+        
+        metrics.record('parser.process_all', time.perf_counter() - start)
+        return store
+
+    def export_json(self, store: ChainStore, path: Optional[str] = None) -> str:
+        """
+        Writes the chains as readable, indented JSON (next to the cache by default).
+        """
+        json_path = path or self.export_file
         try:
             with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(all_chains, f, indent=2)
+                json.dump(store.to_dicts(), f, indent=2)
             print(f"Exported readable chains to: {json_path}")
         except Exception as e:
             print(f"Failed to export JSON: {e}")
-        
-        return all_chains
\ No newline at end of file
+        return json_path
@@ -0,0 +1,71 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+class QueryCache:
+    """
+    Bounded LRU cache of search results.
+
+    Keys are built from the start-translated query snapped to a grid of
+    'grid' units, so redrawing nearly the same shape (within half a grid cell
+    per point) hits the same entry and returns the first drawing's results.
+    Extra search parameters (top_k, backend, ...) are part of the key.
+    Every entry belongs to one corpus: when the corpus token changes the whole
+    cache is dropped.
+    """
+
+    def __init__(self, max_entries: int = 256, grid: float = 1.0):
+        self.max_entries = max_entries
+        self.grid = grid
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._token = None
+
+    def make_key(self, query_arr: np.ndarray, *params: Hashable) -> Tuple:
+        cells = np.round(np.asarray(query_arr, dtype=np.float64) / self.grid).astype(np.int64)
+        return (cells.shape, cells.tobytes()) + params
+
+    def _check_token(self, token: Hashable):
+        if token != self._token:
+            self._entries.clear()
+            self._token = token
+
+    def get(self, key: Tuple, token: Hashable) -> Optional[Tuple[List[Dict], Dict]]:
+        """
+        Cached (results, stats) for key, or None. Counts a hit or a miss.
+        """
+        self._check_token(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        results, stats = entry
+        return [dict(r) for r in results], dict(stats)
+
+    def put(self, key: Tuple, token: Hashable, results: List[Dict], stats: Dict):
+        if self.max_entries <= 0:
+            return
+        self._check_token(token)
+        self._entries[key] = ([dict(r) for r in results], dict(stats))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
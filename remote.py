@@ -0,0 +1,230 @@
+"""
+Client side of server.py: stand-ins for PatternMatcher, PatternClusterer and
+LengthClusterer that ask a running query server instead of holding the
+corpus. They implement just what the GUI uses.
+
+    backend = RemoteBackend("http://127.0.0.1:8765")
+    matches = backend.matcher().search(query, top_k=15)
+"""
+import json
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from chain_store import ChainStore
+
+
+class RemoteError(RuntimeError):
+    """
+    The query server could not be reached or rejected a request.
+    """
+
+
+class RemoteBackend:
+    def __init__(self, url: str, timeout: float = 120.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.generation = None
+        self.chains = RemoteChains(self)
+
+    def request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """
+        GET endpoint, or POST params to it. Returns the decoded response.
+        """
+        data = None if params is None else json.dumps(params).encode('utf-8')
+        req = urllib.request.Request(f"{self.url}/{endpoint}", data=data,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                response = json.load(resp)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get('error', str(e))
+            except ValueError:
+                message = str(e)
+            raise RemoteError(f"{endpoint}: {message}") from None
+        except urllib.error.URLError as e:
+            raise RemoteError(f"Cannot reach query server at {self.url}: {e.reason}") from None
+
+        # A reload on the server renumbers the chains
+        generation = response.get('generation')
+        if generation is not None and generation != self.generation:
+            if self.generation is not None:
+                self.chains.clear()
+            self.generation = generation
+        return response
+
+    def stats(self) -> Dict:
+        return self.request('stats')
+
+    def reload(self, force: bool = False) -> Dict:
+        return self.request('reload', {'force': force})
+
+    def matcher(self) -> 'RemoteMatcher':
+        return RemoteMatcher(self)
+
+    def clusterer(self, n_points: int = 10) -> 'RemoteClusterer':
+        return RemoteClusterer(self, n_points)
+
+    def length_clusterer(self) -> 'RemoteLengthClusterer':
+        return RemoteLengthClusterer(self)
+
+
+class RemoteChains:
+    """
+    The server's corpus, fetched chain by chain as it is looked at.
+    Indexing gives a chain dict, like indexing a ChainStore gives a ChainView.
+    """
+
+    MAX_CACHED = 100_000
+
+    def __init__(self, backend: RemoteBackend):
+        self.backend = backend
+        self._cache = {}
+        self._len = None
+
+    def clear(self):
+        self._cache = {}
+        self._len = None
+
+    def remember(self, i: int, chain: Dict) -> Dict:
+        if len(self._cache) >= self.MAX_CACHED:
+            self._cache = {}
+        chain['coords'] = [tuple(p) for p in chain['coords']]
+        self._cache[i] = chain
+        return chain
+
+    def fetch(self, ids: Sequence[int]) -> List[Dict]:
+        """
+        Chain dicts for ids, one request for all the ones not seen yet.
+        """
+        ids = [int(i) for i in ids]
+        missing = list(dict.fromkeys(i for i in ids if i not in self._cache))
+        if missing:
+            response = self.backend.request('chains', {'ids': missing})
+            for i, chain in zip(missing, response['chains']):
+                self.remember(i, chain)
+        return [self._cache[i] for i in ids]
+
+    def take(self, ids: Sequence[int]) -> ChainStore:
+        return ChainStore.from_chains(self.fetch(ids))
+
+    def coords_of(self, i: int) -> np.ndarray:
+        return np.asarray(self[i]['coords'], dtype=np.float32).reshape(-1, 2)
+
+    def __len__(self) -> int:
+        if self._len is None:
+            n = self.backend.stats()['chains']
+            self._len = n
+        return self._len
+
+    def __getitem__(self, i: int) -> Dict:
+        return self.fetch([i])[0]
+
+
+class RemoteMatcher:
+    def __init__(self, backend: RemoteBackend):
+        self.backend = backend
+        self.chains = backend.chains
+        self.last_search_stats = {}
+
+    def search(self, query: List[Tuple[float, float]], top_k: int = 5,
+               pool_size: Optional[int] = None, filters: Optional[Dict] = None) -> List[Dict]:
+        if not query:
+            return []
+        response = self.backend.request('search', {'coords': [[float(x), float(y)] for x, y in query],
+                                                   'top_k': top_k, 'pool_size': pool_size,
+                                                   'filters': filters})
+        self.last_search_stats = dict(response['stats'], server_ms=response['latency_ms'],
+                                      batch_size=response['batch_size'])
+        return [{
+            'chain_idx': r['chain_idx'],
+            'distance': r['distance'],
+            'chain_data': self.chains.remember(r['chain_idx'], r['chain']),
+        } for r in response['results']]
+
+    def iter_search(self, query: List[Tuple[float, float]], top_k: int = 5,
+                    pool_size: Optional[int] = None, filters: Optional[Dict] = None):
+        """
+        The server answers in one go, so this yields the final list only.
+        """
+        yield self.search(query, top_k, pool_size, filters)
+
+    def filter_options(self) -> Dict[str, List]:
+        return self.backend.request('filters')['options']
+
+
+class RemoteClusterer:
+    def __init__(self, backend: RemoteBackend, n_points: int = 10):
+        self.backend = backend
+        self.chains = backend.chains
+        self.n_points = n_points
+        self.cluster_data = {}
+
+    def cluster(self, threshold=40.0) -> Dict[int, List[int]]:
+        response = self.backend.request('cluster', {'threshold': threshold, 'n_points': self.n_points})
+        self.cluster_data = {int(cid): members for cid, members in response['clusters'].items()}
+        return self.cluster_data
+
+    def cluster_counts(self, thresholds) -> Dict:
+        thresholds = list(thresholds)
+        response = self.backend.request('cluster_counts', {'thresholds': thresholds, 'n_points': self.n_points})
+        return dict(zip(thresholds, response['counts']))
+
+    def get_cluster_representative(self, cluster_id):
+        members = self.cluster_data.get(cluster_id)
+        if not members:
+            return None
+        return self.chains[members[0]]['coords']
+
+
+class RemoteLengthClusterer:
+    """
+    Same answers as a LengthClusterer over the server's corpus; the server
+    memoizes the clusterings, the ids per length are kept here.
+    """
+
+    def __init__(self, backend: RemoteBackend):
+        self.backend = backend
+        self.chains = backend.chains
+        self._counts = None
+        self._ids = {}
+        self._generation = None
+
+    def _check_generation(self):
+        if self.backend.generation != self._generation:
+            self._counts = None
+            self._ids = {}
+            self._generation = self.backend.generation
+
+    def lengths(self) -> List[int]:
+        self._check_generation()
+        if self._counts is None:
+            response = self.backend.request('lengths')
+            self._check_generation()
+            self._counts = {int(length): n for length, n in response['lengths'].items()}
+        return sorted(self._counts)
+
+    def count(self, length: int) -> int:
+        self.lengths()
+        return self._counts.get(length, 0)
+
+    def chain_ids(self, length: int) -> List[int]:
+        self._check_generation()
+        if length not in self._ids:
+            response = self.backend.request('length', {'length': length})
+            self._check_generation()
+            self._ids[length] = response['ids']
+        return self._ids[length]
+
+    def subset(self, length: int) -> ChainStore:
+        return self.chains.take(self.chain_ids(length))
+
+    def cluster(self, length: int, n_points: int = 10, threshold: float = 40.0) -> Dict[int, List[int]]:
+        response = self.backend.request('length', {'length': length, 'n_points': n_points,
+                                                   'threshold': threshold})
+        self._check_generation()
+        self._ids[length] = response['ids']
+        return {int(cid): members for cid, members in response['clusters'].items()}
@@ -0,0 +1,493 @@
+"""
+Local query server: one warm corpus shared by every analyst on the machine.
+
+    python server.py DATA_DIR [--port 8765] [--watch 30]
+
+Loads the corpus once through ChainParser and answers search, clustering and
+length queries as JSON over HTTP on localhost. The GUI uses it as a remote
+backend with `python gui.py --server http://127.0.0.1:8765`; remote.py is
+the client side.
+
+    GET  /stats            corpus size, uptime, per-endpoint latency, cache stats
+    GET  /lengths          {length: number of chains}
+    GET  /filters          the team_id / match_name values searches can be filtered on
+    POST /search           {"coords": [[x, y], ...], "top_k": 15, "pool_size": null,
+                            "filters": {"team_id": 12, "time_range": [0, "15:00"]}}
+    POST /cluster          {"threshold": 40, "n_points": 10}
+    POST /cluster_counts   {"thresholds": [20, 40, 60], "n_points": 10}
+    POST /length           {"length": 5, "n_points": 10, "threshold": 40}
+    POST /chains           {"ids": [0, 1, 2]}
+    POST /reload           {"force": false}
+
+Every query goes through one worker thread, which owns the matcher and the
+clusterers. Requests that arrive while it is busy are taken as one batch:
+identical searches in it are run once, and the rest go through
+PatternMatcher.search_many() together. Each response carries its
+latency_ms, the batch_size it ran in and the corpus generation, which goes up
+whenever a reload swaps in a new corpus.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from parser import ChainParser
+from matcher import PatternMatcher
+from clustering import PatternClusterer, LengthClusterer
+from instrumentation import metrics
+
+
+def chain_json(chain) -> Dict:
+    """
+    A ChainView (or chain dict) as plain JSON types.
+    """
+    return {
+        'team_id': chain['team_id'],
+        'match_name': chain['match_name'],
+        'timestamp': chain['timestamp'],
+        'seconds': chain.get('seconds'),
+        'coords': [[x, y] for x, y in chain['coords']],
+    }
+
+
+def clusters_json(clusters: Dict[int, List[int]]) -> Dict[str, List[int]]:
+    return {str(cid): [int(i) for i in members] for cid, members in clusters.items()}
+
+
+class QueryService:
+    """
+    The corpus, its matcher and clusterers, and the worker that runs queries
+    against them. Usable without HTTP: handle(endpoint, params) is what the
+    request handler calls.
+    """
+
+    # Queued endpoints, run on the worker thread
+    QUERIES = ('search', 'cluster', 'cluster_counts', 'length', 'lengths', 'filters', 'chains')
+    # Latency samples kept per endpoint for the percentiles
+    LATENCY_SAMPLES = 1000
+    MAX_BATCH = 64
+
+    def __init__(self, data_dir: str, cache_file: Optional[str] = None, workers: int = 1,
+                 window: Optional[int] = None, batch_window: float = 0.0):
+        """
+        batch_window: seconds the worker waits for more requests before
+        running a batch. 0 takes whatever queued up while the last batch ran,
+        so a lone request is never held back.
+        """
+        cache_file = cache_file or os.path.join(data_dir, "chains_cache.bin")
+        self.parser = ChainParser(data_dir, cache_file=cache_file, workers=workers)
+        self.window = window
+        self.batch_window = batch_window
+        self.generation = 0
+        self.started = time.time()
+        self.last_reload = None
+        self.batches = {'batches': 0, 'requests': 0, 'deduplicated': 0, 'max_size': 0}
+
+        self._corpus_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._latency_lock = threading.Lock()
+        self._latency = {}
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._watcher = None
+
+        with self._reload_lock:
+            self._install(self.parser.process_all())
+        self._worker = threading.Thread(target=self._run, name="query-worker", daemon=True)
+        self._worker.start()
+
+    # --- Corpus ------------------------------------------------------------
+
+    def _install(self, store) -> bool:
+        """
+        Builds the indexes for store, then swaps them in between two batches.
+        If store is the current corpus with chains appended (new match files
+        that sort after the old ones), the clusterer is extended instead:
+        the new chains join the last grouping asked for, which stays warm.
+        Returns whether that happened.
+        """
+        matcher = PatternMatcher(store, window=self.window)
+        length_clusterer = LengthClusterer(store)
+        clusterer = getattr(self, 'clusterer', None)
+        extend = clusterer is not None and store.starts_with(clusterer.chains)
+        if not extend:
+            clusterer = PatternClusterer(store)
+        with self._corpus_lock:
+            clusters = {}
+            if extend:
+                clusterer.extend(store)
+                if clusterer.cluster_key is not None:
+                    n_points, threshold = clusterer.cluster_key
+                    clusters[(threshold, n_points)] = clusterer.cluster_data
+            self.store = store
+            self.matcher = matcher
+            self.clusterer = clusterer
+            self.length_clusterer = length_clusterer
+            self._clusters = clusters
+            self.generation += 1
+        return extend
+
+    def reload(self, force: bool = False) -> Dict:
+        """
+        Re-reads the data directory if any match file was added, changed or
+        removed (or always with force). The new corpus is built while queries
+        keep running against the old one.
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            if not force and not self.parser.has_changes():
+                return {'reloaded': False, 'generation': self.generation, 'chains': len(self.store)}
+            store = self.parser.process_all()
+            extended = self._install(store)
+            self.last_reload = dict(self.parser.last_refresh, at=time.time(), chains=len(store), extended=extended,
+                                    errors=len(self.parser.errors), seconds=time.perf_counter() - start)
+            metrics.record('server.reload_corpus', self.last_reload['seconds'])
+            print(f"Reloaded: {len(store)} chains, generation {self.generation}.")
+            return dict(self.last_reload, reloaded=True, generation=self.generation)
+
+    def watch(self, interval: float):
+        """
+        Polls the data directory every interval seconds and reloads on changes.
+        Only the file sizes and mtimes are checked unless something was touched.
+        """
+        def poll():
+            while not self._stopped.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Reload failed: {e}")
+
+        self._watcher = threading.Thread(target=poll, name="corpus-watcher", daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join()
+
+    # --- Requests ----------------------------------------------------------
+
+    def handle(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Answers one request. Raises KeyError for an unknown endpoint and
+        ValueError for bad parameters.
+        """
+        start = time.perf_counter()
+        params = params or {}
+        if endpoint == 'stats':
+            response = self.stats()
+        elif endpoint == 'reload':
+            response = self.reload(force=bool(params.get('force')))
+        elif endpoint in self.QUERIES:
+            response = self.submit(endpoint, params)
+        else:
+            raise KeyError(endpoint)
+
+        elapsed = time.perf_counter() - start
+        self._record_latency(endpoint, elapsed)
+        response['latency_ms'] = elapsed * 1000
+        return response
+
+    def submit(self, endpoint: str, params: Dict) -> Dict:
+        """
+        Queues a query for the worker and waits for its answer.
+        """
+        future = Future()
+        self._queue.put((endpoint, params, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0)) \
+                        if self.batch_window else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None) # Stop after this batch
+                    break
+                batch.append(item)
+            with self._corpus_lock:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch: List):
+        with metrics.stage('server.batch'):
+            searches = {}
+            for endpoint, params, future in batch:
+                if endpoint == 'search':
+                    try:
+                        key = self._search_key(params)
+                    except (TypeError, ValueError) as e:
+                        future.set_exception(ValueError(str(e)))
+                        continue
+                    searches.setdefault(key, []).append(future)
+                    continue
+                try:
+                    self._resolve(future, getattr(self, f'_query_{endpoint}')(params), len(batch))
+                except Exception as e:
+                    future.set_exception(e)
+
+            # Distinct searches with the same settings share one corpus pass
+            settings = {}
+            for key in searches:
+                settings.setdefault(key[1:], []).append(key)
+            for (top_k, pool_size, filters), keys in settings.items():
+                try:
+                    responses = self._query_search([key[0] for key in keys], top_k, pool_size,
+                                                   json.loads(filters) if filters else None)
+                except Exception as e:
+                    for key in keys:
+                        for future in searches[key]:
+                            future.set_exception(e)
+                    continue
+                for key, response in zip(keys, responses):
+                    for future in searches[key]:
+                        self._resolve(future, dict(response), len(batch))
+
+        deduplicated = sum(len(futures) - 1 for futures in searches.values())
+        self.batches['batches'] += 1
+        self.batches['requests'] += len(batch)
+        self.batches['deduplicated'] += deduplicated
+        self.batches['max_size'] = max(self.batches['max_size'], len(batch))
+        metrics.count('server.batches')
+        metrics.count('server.requests', len(batch))
+        metrics.count('server.searches_deduplicated', deduplicated)
+
+    def _resolve(self, future: Future, response: Dict, batch_size: int):
+        response['batch_size'] = batch_size
+        response['generation'] = self.generation
+        future.set_result(response)
+
+    @staticmethod
+    def _search_key(params: Dict):
+        coords = tuple((float(x), float(y)) for x, y in params.get('coords') or [])
+        if not coords:
+            raise ValueError("coords: expected a list of [x, y] points")
+        pool_size = params.get('pool_size')
+        filters = params.get('filters') or None
+        if filters is not None and not isinstance(filters, dict):
+            raise ValueError("filters: expected an object")
+        return (coords, int(params.get('top_k', 15)), int(pool_size) if pool_size else None,
+                json.dumps(filters, sort_keys=True) if filters else None)
+
+    def _query_search(self, queries, top_k: int, pool_size: Optional[int],
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        all_matches = self.matcher.search_many([list(coords) for coords in queries],
+                                               top_k=top_k, pool_size=pool_size, filters=filters)
+        responses = []
+        for matches, stats in zip(all_matches, self.matcher.last_batch_stats):
+            responses.append({
+                'results': [{
+                    'chain_idx': int(m['chain_idx']),
+                    'distance': float(m['distance']),
+                    'chain': chain_json(m['chain_data']),
+                } for m in matches],
+                'stats': {k: v.item() if isinstance(v, np.generic) else v for k, v in stats.items()
+                          if isinstance(v, (bool, int, float, np.integer, np.floating))},
+            })
+        return responses
+
+    def _clusters_for(self, threshold: float, n_points: int) -> Dict[int, List[int]]:
+        # Every analyst shares the clusterer, so results are kept per setting
+        key = (threshold, n_points)
+        if key not in self._clusters:
+            self.clusterer.extract_features(n_points=n_points)
+            self._clusters[key] = self.clusterer.cluster(threshold=threshold)
+        return self._clusters[key]
+
+    def _query_cluster(self, params: Dict) -> Dict:
+        clusters = self._clusters_for(float(params.get('threshold', 40.0)), int(params.get('n_points', 10)))
+        return {'count': len(clusters), 'clusters': clusters_json(clusters)}
+
+    def _query_cluster_counts(self, params: Dict) -> Dict:
+        thresholds = [float(t) for t in params.get('thresholds') or []]
+        self.clusterer.extract_features(n_points=int(params.get('n_points', 10)))
+        counts = self.clusterer.cluster_counts(thresholds)
+        return {'thresholds': thresholds, 'counts': [counts[t] for t in thresholds]}
+
+    def _query_lengths(self, params: Dict) -> Dict:
+        index = self.length_clusterer.index
+        return {'lengths': {str(length): index.count(length) for length in index.lengths()}}
+
+    def _query_filters(self, params: Dict) -> Dict:
+        return {'options': self.matcher.filter_options()}
+
+    def _query_length(self, params: Dict) -> Dict:
+        """
+        Corpus ids of the chains with this length and, given a threshold,
+        their clusters as positions in that id list.
+        """
+        length = int(params['length'])
+        response = {'length': length, 'ids': self.length_clusterer.chain_ids(length).tolist()}
+        if params.get('threshold') is not None:
+            clusters = self.length_clusterer.cluster(length, n_points=int(params.get('n_points', 10)),
+                                                     threshold=float(params['threshold']))
+            response['clusters'] = clusters_json(clusters)
+        return response
+
+    def _query_chains(self, params: Dict) -> Dict:
+        ids = [int(i) for i in params.get('ids') or []]
+        n = len(self.store)
+        bad = [i for i in ids if not 0 <= i < n]
+        if bad:
+            raise ValueError(f"ids out of range: {bad[:10]}")
+        return {'chains': [chain_json(self.store[i]) for i in ids]}
+
+    # --- Stats -------------------------------------------------------------
+
+    def _record_latency(self, endpoint: str, seconds: float):
+        metrics.record(f'server.{endpoint}', seconds)
+        with self._latency_lock:
+            samples = self._latency.get(endpoint)
+            if samples is None:
+                samples = self._latency[endpoint] = {'count': 0, 'recent': deque(maxlen=self.LATENCY_SAMPLES)}
+            samples['count'] += 1
+            samples['recent'].append(seconds)
+
+    def latency(self) -> Dict:
+        """
+        Per endpoint: total requests, and mean / p50 / p95 / max milliseconds
+        over the most recent LATENCY_SAMPLES.
+        """
+        with self._latency_lock:
+            recent = {name: (s['count'], np.array(s['recent']) * 1000) for name, s in self._latency.items()}
+        return {name: {
+            'count': count,
+            'mean_ms': float(ms.mean()),
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)),
+            'max_ms': float(ms.max()),
+        } for name, (count, ms) in recent.items()}
+
+    def stats(self) -> Dict:
+        snap = metrics.snapshot()
+        return {
+            'generation': self.generation,
+            'data_dir': self.parser.data_dir,
+            'chains': len(self.store),
+            'uptime_s': time.time() - self.started,
+            'queue_depth': self._queue.qsize(),
+            'latency': self.latency(),
+            'batches': dict(self.batches),
+            'search_cache': self.matcher.cache.stats(),
+            'last_reload': self.last_reload,
+            'metrics': {'stages': snap['stages'], 'counters': snap['counters'],
+                        'peak_rss_mb': snap['memory']['peak_rss_mb']},
+        }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP for a QueryService (set as server.service).
+    """
+    server_version = "FPMQueryServer/1"
+    GET_ENDPOINTS = ('stats', 'lengths', 'filters')
+    quiet = True
+
+    def do_GET(self):
+        endpoint = self.path.strip('/').split('?')[0]
+        if endpoint not in self.GET_ENDPOINTS:
+            self.reply(404, {'error': f"unknown endpoint '{self.path}'"})
+            return
+        self.answer(endpoint, {})
+
+    def do_POST(self):
+        endpoint = self.path.strip('/').split('?')[0]
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            params = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self.reply(400, {'error': f"bad request body: {e}"})
+            return
+        self.answer(endpoint, params)
+
+    def answer(self, endpoint: str, params: Dict):
+        try:
+            response = self.server.service.handle(endpoint, params)
+        except KeyError:
+            self.reply(404, {'error': f"unknown endpoint '{self.path}'"})
+        except (TypeError, ValueError) as e:
+            self.reply(400, {'error': str(e)})
+        except Exception as e:
+            self.reply(500, {'error': f"{type(e).__name__}: {e}"})
+        else:
+            self.reply(200, response)
+
+    def reply(self, status: int, body: Dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(service: QueryService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    httpd = ThreadingHTTPServer((host, port), QueryHandler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    return httpd
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Football Tactical Pattern Matcher query server")
+    ap.add_argument("data_dir", help="folder with the match JSON files")
+    ap.add_argument("--host", default="127.0.0.1", help="interface to listen on (default: localhost only)")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--cache", default=None, help="cache file (default: DATA_DIR/chains_cache.bin)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes")
+    ap.add_argument("--window", type=int, default=None, help="Sakoe-Chiba band for DTW")
+    ap.add_argument("--watch", type=float, default=30.0,
+                    help="seconds between checks for new match files (0 disables hot reload)")
+    ap.add_argument("--batch-window", type=float, default=0.0,
+                    help="seconds to wait for more requests before running a batch")
+    ap.add_argument("--verbose", action="store_true", help="log every request")
+    args = ap.parse_args(argv)
+
+    service = QueryService(args.data_dir, cache_file=args.cache, workers=args.workers,
+                           window=args.window, batch_window=args.batch_window)
+    if args.watch > 0:
+        service.watch(args.watch)
+    QueryHandler.quiet = not args.verbose
+    try:
+        httpd = make_server(service, args.host, args.port)
+    except OSError as e:
+        print(f"Error: cannot listen on {args.host}:{args.port}: {e}")
+        return 2
+
+    print(f"Serving {len(service.store)} chains on http://{args.host}:{httpd.server_port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chain_store import CORPUS_MAGIC, SECTION_ALIGN, ChainStore, CorpusFormatError
+
+
+def make_chains():
+    rng = np.random.default_rng(0)
+    return [{'team_id': 700 + i % 2, 'coords': rng.uniform(0, 100, (3 + i % 4, 2)).tolist(),
+             'match_name': f"Match {i % 3}", 'timestamp': f"{i:02d}:00", 'seconds': float(60 * i)}
+            for i in range(20)]
+
+
+def section_offset(path, name):
+    """
+    File offset of a data section, read back through the header.
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(len(CORPUS_MAGIC) + 8)
+        _, header_len = struct.unpack('<II', prefix[len(CORPUS_MAGIC):])
+        header = json.loads(f.read(header_len))
+    data_start = -(-(len(prefix) + header_len + 4) // SECTION_ALIGN) * SECTION_ALIGN
+    return data_start + header['sections'][name]['offset']
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip(tmp_path, mmap):
+    store = ChainStore.from_chains(make_chains())
+    path = str(tmp_path / "corpus.bin")
+    store.save(path)
+    loaded = ChainStore.open(path, mmap=mmap, verify=True)
+
+    assert len(loaded) == len(store)
+    for name in ('coords', 'normalized', 'offsets', 'team_idx', 'match_idx', 'timestamp_idx', 'seconds'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(store, name))
+    assert loaded.to_dicts() == store.to_dicts()
+
+
+def test_corrupt_offsets_are_rejected(tmp_path):
+    store = ChainStore.from_chains(make_chains())
+    path = str(tmp_path / "corpus.bin")
+    store.save(path)
+    with open(path, 'r+b') as f:
+        f.seek(section_offset(path, 'offsets') + 8 * 5)
+        f.write(np.int64(1 << 40).tobytes())
+
+    with pytest.raises(CorpusFormatError, match="checksum"):
+        ChainStore.open(path, verify=True)
+    with pytest.raises(CorpusFormatError, match="offsets"):
+        ChainStore.open(path)
+
+
+def test_corrupt_coords_fail_the_checksum_only(tmp_path):
+    store = ChainStore.from_chains(make_chains())
+    path = str(tmp_path / "corpus.bin")
+    store.save(path)
+    with open(path, 'r+b') as f:
+        f.seek(section_offset(path, 'coords'))
+        f.write(np.float32(-1.0).tobytes())
+
+    assert len(ChainStore.open(path)) == len(store)
+    with pytest.raises(CorpusFormatError, match="checksum"):
+        ChainStore.open(path, verify=True)
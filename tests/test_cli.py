@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generator import write_match
+
+
+def test_search_stdout_is_only_results_on_a_cold_parallel_build(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for seed in range(2):
+        write_match(str(data_dir / f"match_{seed:05d}.json"), seed=seed, n_events=400)
+    queries = tmp_path / "queries.json"
+    queries.write_text(json.dumps([[[10, 10], [40, 30], [70, 50]]]), encoding='utf-8')
+
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, "cli.py"), "search", str(data_dir),
+                           "--queries", str(queries), "--workers", "2", "--format", "json"],
+                          capture_output=True, text=True, cwd=ROOT, timeout=300)
+
+    assert proc.returncode == 0, proc.stderr
+    json.loads(proc.stdout)
+    assert "Parsing" in proc.stderr
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chain_store import ChainStore
+from clustering import PatternClusterer
+
+
+def make_chains(n_chains, seed=0):
+    rng = np.random.default_rng(seed)
+    chains = []
+    for i in range(n_chains):
+        start = rng.uniform(0, 100, 2)
+        steps = rng.normal(0, 10, (int(rng.integers(3, 7)), 2))
+        chains.append({'team_id': 700 + i % 2, 'coords': (start + np.cumsum(steps, axis=0)).tolist(),
+                       'match_name': "Match", 'timestamp': "00:00"})
+    # A repeated point has zero length and no features
+    chains.append({'team_id': 700, 'coords': [[5.0, 5.0]] * 3, 'match_name': "Match", 'timestamp': "00:00"})
+    return chains
+
+
+@pytest.mark.parametrize("threshold", [5, 20, 40, 100, 250])
+def test_kdtree_backend_matches_matrix(threshold):
+    clusterer = PatternClusterer(make_chains(600))
+    matrix = clusterer.cluster(threshold, backend='matrix')
+    assert clusterer.cluster(threshold, backend='kdtree') == matrix
+
+
+def test_threshold_order_does_not_change_clusters():
+    clusterer = PatternClusterer(make_chains(600))
+    for threshold in (40, 100, 20, 40, 7):
+        assert clusterer.cluster(threshold) == clusterer.cluster(threshold, backend='matrix')
+    counts = clusterer.cluster_counts([7, 20, 40, 100])
+    assert counts == {t: len(PatternClusterer(make_chains(600)).cluster(t)) for t in (7, 20, 40, 100)}
+
+
+@pytest.mark.parametrize("threshold", [20, 40])
+def test_add_chains_matches_a_fresh_clustering(threshold):
+    chains = make_chains(900, seed=1)
+    clusterer = PatternClusterer(chains[:300])
+    clusterer.cluster(threshold)
+    # At 20 the middle batch adds enough leaders to rebuild the leader tree
+    for start, stop in ((300, 320), (320, 700), (700, len(chains))):
+        clusterer.add_chains(chains[start:stop])
+
+        fresh = PatternClusterer(chains[:stop])
+        assert clusterer.cluster_data == fresh.cluster(threshold)
+        assert len(clusterer.chains) == stop
+
+
+def test_extend_rejects_a_different_corpus():
+    chains = make_chains(50)
+    clusterer = PatternClusterer(chains)
+    clusterer.cluster(40)
+    with pytest.raises(ValueError):
+        clusterer.extend(ChainStore.from_chains(chains[1:] + chains[:1]))
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dtw import dtw_batch, dtw_distance
+
+
+def naive_dtw(a, b, window=None):
+    """
+    Textbook O(nm) DTW with a Euclidean point cost.
+    """
+    n, m = len(a), len(b)
+    acc = np.full((n + 1, m + 1), np.inf)
+    acc[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            if window is not None and abs(i - j) > window:
+                continue
+            cost = np.hypot(*(a[i - 1] - b[j - 1]))
+            acc[i, j] = cost + min(acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])
+    return acc[n, m]
+
+
+@pytest.mark.parametrize("window", [None, 0, 1, 2, 4])
+@pytest.mark.parametrize("n, m", [(1, 1), (3, 3), (4, 6), (7, 3), (9, 9)])
+def test_dtw_batch_matches_naive_dp(n, m, window):
+    rng = np.random.default_rng(n * 10 + m)
+    query = rng.uniform(-50, 50, (n, 2))
+    batch = rng.uniform(-50, 50, (30, m, 2)).astype(np.float32)
+
+    expected = [naive_dtw(query, chain.astype(np.float64), window) for chain in batch]
+    np.testing.assert_allclose(dtw_batch(query, batch, window), expected, rtol=1e-9)
+    assert dtw_distance(query, batch[0], window) == pytest.approx(expected[0])
+
+
+@pytest.mark.parametrize("window", [None, 2])
+def test_early_abandoning_never_drops_a_chain_within_max_dist(window):
+    rng = np.random.default_rng(7)
+    query = rng.uniform(-50, 50, (6, 2))
+    batch = rng.uniform(-50, 50, (200, 6, 2))
+    exact = np.array([naive_dtw(query, chain, window) for chain in batch])
+
+    # Abandoned chains come back as inf, every other distance is exact
+    max_dist = float(np.median(exact))
+    dists = dtw_batch(query, batch, window, max_dist)
+    kept = np.isfinite(dists)
+    np.testing.assert_allclose(dists[kept], exact[kept], rtol=1e-9)
+    assert kept[exact <= max_dist].all()
+    assert not kept.all()
+
+    # One threshold per chain
+    per_chain = exact + np.where(np.arange(len(batch)) % 2, 1.0, -5.0)
+    dists = dtw_batch(query, batch, window, per_chain)
+    kept = np.isfinite(dists)
+    np.testing.assert_allclose(dists[kept], exact[kept], rtol=1e-9)
+    assert kept[1::2].all()
+
+
+def test_paired_queries_match_one_by_one():
+    rng = np.random.default_rng(3)
+    queries = rng.uniform(-50, 50, (40, 5, 2))
+    batch = rng.uniform(-50, 50, (40, 4, 2))
+    expected = [naive_dtw(q, c, 1) for q, c in zip(queries, batch)]
+    np.testing.assert_allclose(dtw_batch(queries, batch, 1), expected, rtol=1e-9)
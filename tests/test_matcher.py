@@ -0,0 +1,88 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chain_store import ChainStore
+from matcher import PatternMatcher
+from parallel import ParallelMatcher
+from test_dtw import naive_dtw
+
+TOP_K = 10
+
+
+def make_store(n_chains=400, seed=0):
+    rng = np.random.default_rng(seed)
+    chains = []
+    for i in range(n_chains):
+        steps = rng.normal(0, 15, (int(rng.integers(3, 9)), 2))
+        chains.append({'team_id': 700 + i % 3, 'coords': (50 + np.cumsum(steps, axis=0)).tolist(),
+                       'match_name': f"Match {i % 4}", 'timestamp': f"{i % 90:02d}:00",
+                       'seconds': float(60 * (i % 90))})
+    return ChainStore.from_chains(chains)
+
+
+def make_queries(n_queries=6, seed=1):
+    rng = np.random.default_rng(seed)
+    return [(50 + np.cumsum(rng.normal(0, 15, (length, 2)), axis=0)).tolist()
+            for length in rng.integers(3, 9, n_queries)]
+
+
+def brute_force(store, query, window, top_k=TOP_K, ids=None):
+    """
+    (chain_idx, distance) of the top_k by sorting every chain's naive DTW distance.
+    """
+    query_arr = np.asarray(query, dtype=float)
+    query_arr = query_arr - query_arr[0]
+    ids = range(len(store)) if ids is None else ids
+    scored = [(naive_dtw(query_arr, store.normalized_of(i).astype(np.float64), window), int(i)) for i in ids]
+    scored = sorted(s for s in scored if np.isfinite(s[0]))[:top_k]
+    return [(i, d) for d, i in scored]
+
+
+def assert_same(results, expected):
+    assert [r['chain_idx'] for r in results] == [i for i, _ in expected]
+    np.testing.assert_allclose([r['distance'] for r in results], [d for _, d in expected], rtol=1e-9)
+
+
+@pytest.fixture(scope='module')
+def store():
+    return make_store()
+
+
+@pytest.mark.parametrize("window", [None, 2])
+def test_search_matches_brute_force(store, window):
+    matcher = PatternMatcher(store, window=window, cache_size=0)
+    for query in make_queries():
+        assert_same(matcher.search(query, top_k=TOP_K), brute_force(store, query, window))
+
+
+@pytest.mark.parametrize("window", [None, 2])
+def test_filtered_search_matches_brute_force(store, window):
+    matcher = PatternMatcher(store, window=window, cache_size=0)
+    filters = {'team_id': 701, 'time_range': (0, '45:00'), 'length': {'min': 4}}
+    ids = store.select(**filters)
+    assert 0 < len(ids) < len(store)
+    for query in make_queries():
+        assert_same(matcher.search(query, top_k=TOP_K, filters=filters),
+                    brute_force(store, query, window, ids=ids))
+
+
+@pytest.mark.parametrize("window", [None, 2])
+def test_search_many_matches_search(store, window):
+    matcher = PatternMatcher(store, window=window, cache_size=0)
+    queries = make_queries(20, seed=2)
+    batched = matcher.search_many(queries, top_k=TOP_K)
+    assert len(batched) == len(queries)
+    for query, results in zip(queries, batched):
+        assert_same(results, brute_force(store, query, window))
+
+
+def test_parallel_search_matches_brute_force(store):
+    queries = make_queries()
+    with ParallelMatcher(store, n_workers=2) as matcher:
+        for query in queries:
+            assert_same(matcher.search(query, top_k=TOP_K), brute_force(store, query, None))
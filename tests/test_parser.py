@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import generate_match, write_match
+from chain_store import ChainStore
+from parser import ChainParser
+
+
+def make_data_dir(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_match(str(data_dir / "match_00000.json"), seed=0, n_events=400)
+    text = (data_dir / "match_00000.json").read_text(encoding='utf-8')
+    (data_dir / "match_00001.json").write_text(text[:len(text) // 2], encoding='utf-8')
+    return data_dir
+
+
+def test_truncated_file_is_reported_and_not_cached(tmp_path):
+    data_dir = make_data_dir(tmp_path)
+    parser = ChainParser(str(data_dir), cache_file=str(tmp_path / "cache.bin"))
+    store = parser.process_all()
+
+    assert [os.path.basename(path) for path, _ in parser.errors] == ["match_00001.json"]
+    with open(parser.manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert list(manifest['files']) == ["match_00000.json"]
+    assert len(store) == len(ChainParser(str(data_dir)).parse_file(str(data_dir / "match_00000.json")))
+
+
+def test_failed_file_is_retried_only_when_it_changes(tmp_path):
+    data_dir = make_data_dir(tmp_path)
+    parser = ChainParser(str(data_dir), cache_file=str(tmp_path / "cache.bin"))
+    parser.process_all()
+
+    assert not parser.has_changes()
+    parser.process_all()
+    assert parser.last_refresh['reparsed'] == 0
+    assert [os.path.basename(path) for path, _ in parser.errors] == ["match_00001.json"]
+
+    write_match(str(data_dir / "match_00001.json"), seed=1, n_events=400)
+    assert parser.has_changes()
+    parser.process_all()
+    assert parser.errors == []
+    with open(parser.manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert sorted(manifest['files']) == ["match_00000.json", "match_00001.json"]
+    assert manifest['failed'] == {}
+
+
+def test_transient_failure_is_retried(tmp_path, monkeypatch):
+    data_dir = make_data_dir(tmp_path)
+    parser = ChainParser(str(data_dir), cache_file=str(tmp_path / "cache.bin"))
+    parse_file = ChainParser.parse_file
+
+    def flaky(self, path, streaming=None):
+        if path.endswith("match_00000.json"):
+            raise MemoryError("out of memory")
+        return parse_file(self, path, streaming)
+
+    monkeypatch.setattr(ChainParser, 'parse_file', flaky)
+    store = parser.process_all()
+    assert len(store) == 0
+    assert sorted(os.path.basename(path) for path, _ in parser.errors) == ["match_00000.json", "match_00001.json"]
+    with open(parser.manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert list(manifest['files']) == []
+    assert list(manifest['failed']) == ["match_00001.json"]
+
+    monkeypatch.setattr(ChainParser, 'parse_file', parse_file)
+    assert parser.has_changes()
+    store = parser.process_all()
+    assert len(store) > 0
+    assert [os.path.basename(path) for path, _ in parser.errors] == ["match_00001.json"]
+
+
+def test_damaged_segment_is_rebuilt_when_stitching(tmp_path, capsys):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for seed in range(2):
+        write_match(str(data_dir / f"match_{seed:05d}.json"), seed=seed, n_events=400)
+    parser = ChainParser(str(data_dir), cache_file=str(tmp_path / "cache.bin"))
+    expected = parser.process_all().to_dicts()
+
+    with open(parser.manifest_file, 'r', encoding='utf-8') as f:
+        segment = parser._segment_path(json.load(f)['files']["match_00000.json"]['segment'])
+    with open(segment, 'r+b') as f:
+        # The middle of a segment is coordinate data
+        f.seek(os.path.getsize(segment) // 2)
+        f.write(b'\xff' * 8)
+    write_match(str(data_dir / "match_00002.json"), seed=2, n_events=400)
+    capsys.readouterr()
+
+    store = parser.process_all()
+    assert "Reparsing match_00000.json" in capsys.readouterr().out
+    assert parser.last_refresh['reparsed'] == 1
+    assert store.to_dicts()[:len(expected)] == expected
+    ChainStore.open(segment, verify=True)
+
+
+def write_awkward_match(path):
+    """
+    A generated match re-encoded with indentation and non-ASCII team names,
+    which are written as UTF-8.
+    """
+    events = generate_match(seed=3, n_events=300)
+    for event in events:
+        game_event = event.get('gameEvents') or {}
+        if game_event.get('teamName'):
+            game_event['teamName'] = "Équipe " + game_event['teamName']
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(events, f, indent=2, ensure_ascii=False)
+    return events
+
+
+@pytest.mark.parametrize("chunk", [97, 1000, ChainParser.STREAM_CHUNK])
+def test_streaming_matches_json_load(tmp_path, chunk):
+    plain = str(tmp_path / "plain.json")
+    awkward = str(tmp_path / "awkward.json")
+    write_match(plain, seed=2, n_events=300)
+    events = write_awkward_match(awkward)
+
+    parser = ChainParser(str(tmp_path))
+    parser.STREAM_CHUNK = chunk
+    assert list(parser.iter_events(awkward)) == events
+    for path in (plain, awkward):
+        assert os.path.getsize(path) > 3 * chunk
+        chains = parser.parse_file(path, streaming=True)
+        assert chains and chains == parser.parse_file(path, streaming=False)
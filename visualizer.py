@@ -1,6 +1,8 @@
-import matplotlib.pyplot as plt
 import matplotlib.patches as patches
-from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.markers import MarkerStyle
+from matplotlib.colors import to_rgba, to_rgba_array
+from matplotlib.transforms import IdentityTransform
 import numpy as np
 
 class Visualizer:
@@ -115,21 +117,74 @@ class Visualizer:
         # Remove margins
         ax.set_position([0, 0, 1, 1])
 
+    @staticmethod
+    def _marker_path(marker):
+        style = MarkerStyle(marker)
+        return style.get_path().transformed(style.get_transform())
+
+    @staticmethod
+    def plot_chains(ax, chains, color='blue', label=None, linestyle='-', marker='o', alpha=1.0,
+                    linewidth=2, arrows=True, markers=True):
+        """
+        Plots any number of chains with a fixed number of artists:
+        one LineCollection for the paths, one quiver for the pass arrows and
+        one PathCollection for the markers (start points are white circles).
+        color is a single colour or one per chain.
+        Returns the artists it added.
+        """
+        chains = [np.asarray(c, dtype=float).reshape(-1, 2) for c in chains if c is not None and len(c)]
+        if not chains:
+            return []
+
+        if isinstance(color, str) or (isinstance(color, tuple) and len(color) in (3, 4)):
+            colors = np.repeat([to_rgba(color, alpha)], len(chains), axis=0)
+        else:
+            colors = to_rgba_array(color, alpha)
+        lengths = np.array([len(c) for c in chains])
+        points = np.concatenate(chains)
+        point_colors = np.repeat(colors, lengths, axis=0)
+        is_start = np.zeros(len(points), dtype=bool)
+        is_start[np.cumsum(lengths) - lengths] = True
+
+        artists = []
+        # Paths
+        lines = LineCollection(chains, colors=colors, linestyles=linestyle, linewidths=linewidth,
+                               label=label, zorder=2)
+        ax.add_collection(lines, autolim=False)
+        artists.append(lines)
+
+        # Arrows: one per pass, from each point to the next
+        if arrows:
+            seg_start = ~np.roll(is_start, -1)
+            seg_start[-1] = False
+            if seg_start.any():
+                tails = points[seg_start]
+                vecs = points[np.flatnonzero(seg_start) + 1] - tails
+                artists.append(ax.quiver(tails[:, 0], tails[:, 1], vecs[:, 0], vecs[:, 1],
+                                         color=point_colors[seg_start], angles='xy', scale_units='xy', scale=1,
+                                         width=0.002, headwidth=6, headlength=8, headaxislength=7, zorder=2))
+
+        # Markers: start circles and pass markers share one collection
+        if markers:
+            paths = [Visualizer._marker_path('o'), Visualizer._marker_path(marker)]
+            path_idx = np.where(is_start, 0, 1)
+            face = point_colors.copy()
+            face[is_start] = to_rgba('white', alpha)
+            dots = PathCollection([paths[i] for i in path_idx],
+                                  sizes=np.where(is_start, 100, 50),
+                                  offsets=points, offset_transform=ax.transData, transform=IdentityTransform(),
+                                  facecolors=face, edgecolors=point_colors, linewidths=1.5, zorder=3)
+            ax.add_collection(dots, autolim=False)
+            artists.append(dots)
+        return artists
+
     @staticmethod
     def plot_chain(ax, coords, color='blue', label=None, linestyle='-', marker='o', alpha=1.0):
+        """
+        Plots one chain on ax and returns the artists it added, so callers can
+        remove them or draw them on their own (e.g. when blitting).
+        """
         if not coords:
-            return
-        
-        xs = [p[0] for p in coords]
-        ys = [p[1] for p in coords]
-        
-        # Plot path
-        ax.plot(xs, ys, color=color, linestyle=linestyle, linewidth=2, label=label, zorder=2, alpha=alpha)
-        # Plot start
-        ax.scatter(xs[0], ys[0], color='white', edgecolor=color, s=100, marker='o', zorder=3, alpha=alpha)
-        # Plot rest
-        ax.scatter(xs[1:], ys[1:], color=color, s=50, marker=marker, zorder=3, alpha=alpha)
-        # Arrows for direction?
-        for i in range(len(xs) - 1):
-            ax.annotate('', xy=(xs[i+1], ys[i+1]), xytext=(xs[i], ys[i]),
-                        arrowprops=dict(arrowstyle='->', color=color, lw=1.5, alpha=alpha), zorder=2)
+            return []
+        return Visualizer.plot_chains(ax, [coords], color=color, label=label, linestyle=linestyle,
+                                      marker=marker, alpha=alpha)